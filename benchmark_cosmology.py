@@ -0,0 +1,31 @@
+''' Benchmark the comoving distance interpolation against np.interp'''
+import time
+import numpy as np
+import src.cosmology as cosmo
+
+sizes = [10**7, 10**8]
+
+cosmo.set_Planck15()
+zz, rr = cosmo.redshift, cosmo.r_comoving
+rng = np.random.default_rng(0)
+
+def timeit(func, x):
+    start = time.perf_counter()
+    func(x)
+    return time.perf_counter() - start
+
+for size in sizes:
+    z = rng.uniform(0., zz[-1], size)
+    r = rng.uniform(0., rr[-1], size)
+    tests = [
+        ('comoving_distance', z,
+         cosmo.comoving_distance, lambda x: np.interp(x, zz, rr)),
+        ('redshift_at_distance', r,
+         cosmo.redshift_at_distance, lambda x: np.interp(x, rr, zz)),
+    ]
+    for name, x, func, ref in tests:
+        tfunc = timeit(func, x)
+        tref = timeit(ref, x)
+        print(f'{name} ({size:.0e} elements): {tfunc:.2f} s, '
+              f'np.interp {tref:.2f} s, speed-up {tref/tfunc:.1f}')
+    del z, r
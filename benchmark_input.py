@@ -0,0 +1,14 @@
+''' Benchmark the stages on synthetic GALFORM and Shark files'''
+import shutil
+from src.benchmark import benchmark
+
+layouts = ['galform', 'shark']
+ngals = [10**5, 10**6, 10**7]   # Galaxies per subvolume, up to 10**8
+subvols = [0]
+chunk_size = 10**6
+path = 'output/benchmark'
+
+for layout in layouts:
+    for ngal in ngals:
+        benchmark(layout, path, ngal, subvols=subvols, chunk_size=chunk_size)
+        shutil.rmtree(path)
@@ -0,0 +1,16 @@
+''' Compare storage options of the gne_input.hdf5 datasets:
+write and read throughput versus file size '''
+import shutil
+from src.benchmark import benchmark_storage
+
+layouts = ['galform', 'shark']
+ngal = 10**6   # Galaxies per subvolume
+presets = ['contiguous', 'chunked', 'lzf', 'gzip1', 'gzip4']
+subvols = [0]
+chunk_size = 10**6
+path = 'output/benchmark'
+
+for layout in layouts:
+    benchmark_storage(layout, path, ngal, presets=presets,
+                      subvols=subvols, chunk_size=chunk_size)
+    shutil.rmtree(path)
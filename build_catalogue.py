@@ -0,0 +1,15 @@
+''' Catalogue the input files of a set of simulations, to be queried
+for validation and job planning instead of the filesystem '''
+from src.catalogue import build_catalogue
+
+verbose = True
+nvol = 64
+workers = None  # By default, SLURM_CPUS_PER_TASK if defined, otherwise 1
+dbfile = 'output/catalogue.db'
+
+simulations = [
+    ('SharkSU_1', [128, 109, 104, 98, 96, 90, 87, 78], list(range(nvol))),
+    ('GP20SU_1', [109, 104, 98, 90, 87, 128, 96, 78], list(range(nvol))),
+]
+
+build_catalogue(dbfile, simulations, workers=workers, verbose=verbose)
@@ -1,5 +1,8 @@
 ''' Generate and submit SLURM jobs for preparing Galform input '''
+import os
 import src.slurm_utils as u
+from src.job_plan import plan_jobs, save_plan, load_plan
+from src.job_plan import get_missing_units, get_running_jobs, group_units
 
 verbose = True
 nvol = 64
@@ -7,7 +10,13 @@ nvol = 64
 SIM = "GP20"
 
 submit_jobs = True  # False for only generating the scripts
+group_size = None  # Subvolumes per task of a job array, None for one job per snapshot
+max_running = None  # Maximum number of array tasks running at once
+target_hours = None  # If given, pack the subvolumes into jobs of about this runtime
+catalogue = None  # SQLite catalogue with the input sizes (build_catalogue.py)
+plan_file = 'output/job_plan.json'  # Jobs planned for target_hours
 check_all_jobs = True
+resubmit = False  # Submit only the missing subvolumes of jobs no longer queued
 clean = False
 
 taurus_sims_Shark = [
@@ -53,18 +62,45 @@ try:
 except KeyError:
     raise ValueError(f"Simulation type '{SIM}' not supported. Available types: {simtypes.keys()}")
 
+# Cost-aware packing of the subvolumes into jobs, kept to check them
+if target_hours is not None:
+    if (clean or check_all_jobs or resubmit) and os.path.exists(plan_file):
+        simulations = load_plan(plan_file)
+    else:
+        simulations = plan_jobs(simulations, target_hours*3600.,
+                                workers=u.get_cpus_per_task(hpc),
+                                catalogue=catalogue, verbose=verbose)
+        save_plan(simulations, plan_file)
+
+# Check the jobs and keep only the subvolumes still missing
+if resubmit and not clean:
+    results = u.check_all_jobs(simulations,group_size=group_size,verbose=verbose)
+    queued = u.get_queued_jobs()
+    missing = get_missing_units(simulations, results=results, queued=queued,
+                                group_size=group_size, verbose=verbose)
+    running = get_running_jobs(simulations, results=results, queued=queued,
+                               group_size=group_size)
+    simulations = group_units(missing)
+    if target_hours is not None:
+        simulations = plan_jobs(simulations, target_hours*3600.,
+                                workers=u.get_cpus_per_task(hpc),
+                                catalogue=catalogue, verbose=verbose)
+        # Jobs still running are kept, to be checked later
+        save_plan(running + simulations, plan_file)
+
 # Submit, check or clean
 if clean:
-    u.clean_all_jobs(simulations, only_show=True)
-elif check_all_jobs:
-    results = u.check_all_jobs(simulations,verbose=True)
+    u.clean_all_jobs(simulations, only_show=True, group_size=group_size)
+elif check_all_jobs and not resubmit:
+    results = u.check_all_jobs(simulations,group_size=group_size,verbose=True)
 else:            
     job_count = 0
     for sim, snaps, subvols in simulations:
         for snap in snaps:
             # Generate SLURM script
             script_path, job_name= u.create_slurm_script(
-                hpc, sim, snap, subvols, verbose=verbose)
+                hpc, sim, snap, subvols, verbose=verbose,
+                group_size=group_size, max_running=max_running)
             if verbose: 
                 print(f'  Created script: {script_path}')
                 
@@ -0,0 +1,263 @@
+"""
+Throughput of the different stages on synthetic input files
+"""
+import os
+import time
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import h5py
+
+from src.synthetic import get_synthetic_config, get_synthetic_files, write_synthetic_files
+from src.validate import validate_hdf5_file
+from src.generate_input import generate_input_file
+from src.generate_test_files import generate_test_files
+
+stages = ['synthetic', 'validate', 'generate', 'read_output', 'test_files']
+
+# Storage options of the output datasets, as given in config['storage']
+storage_presets = {
+    'contiguous': None,
+    'chunked': {'default': {'chunks': 2**16}},
+    'lzf': {'default': {'chunks': 2**16, 'compression': 'lzf',
+                        'shuffle': True}},
+    'gzip1': {'default': {'chunks': 2**16, 'compression': 'gzip',
+                          'compression_opts': 1, 'shuffle': True}},
+    'gzip4': {'default': {'chunks': 2**16, 'compression': 'gzip',
+                          'compression_opts': 4, 'shuffle': True}},
+}
+
+def get_input_size(config, subvols):
+    """
+    Size in bytes of the input files of a set of subvolumes
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    subvols : list of integers
+        List of subvolumes to be considered
+
+    Returns
+    -------
+    nbytes : integer
+        Size of the files
+    """
+    nbytes = 0
+    for ivol in subvols:
+        for infile in get_synthetic_files(config, ivol):
+            if os.path.exists(infile):
+                nbytes += os.path.getsize(infile)
+    return nbytes
+
+
+def get_output_size(config, subvols):
+    """
+    Size in bytes of the generated gne_input.hdf5 files
+    """
+    nbytes = 0
+    for ivol in subvols:
+        outfile = config['outroot'] + str(ivol) + '/gne_input.hdf5'
+        if os.path.exists(outfile):
+            nbytes += os.path.getsize(outfile)
+    return nbytes
+
+
+def read_output(config, subvols):
+    """
+    Read all the datasets of the generated gne_input.hdf5 files
+
+    Returns
+    -------
+    nbytes : integer
+        Bytes of the datasets once read
+    """
+    nbytes = 0
+    for ivol in subvols:
+        outfile = config['outroot'] + str(ivol) + '/gne_input.hdf5'
+        with h5py.File(outfile, 'r') as hf:
+            for name, dset in hf['data'].items():
+                nbytes += dset[()].nbytes
+    return nbytes
+
+
+def run_stage(stage, config, subvols, ngal, chunk_size=None,
+              percentage=10, subfiles=2):
+    """
+    Run one stage over all the subvolumes, measuring its throughput.
+    It is meant to run in its own process, for the peak memory of the
+    process to be that of the stage.
+
+    Parameters
+    ----------
+    stage : str
+        Stage to be run, one of 'synthetic', 'validate', 'generate',
+        'read_output' or 'test_files'
+    config : dict
+        Configuration dictionary containing paths and file properties
+    subvols : list of integers
+        List of subvolumes to be considered
+    ngal : integer
+        Number of galaxies per subvolume
+    chunk_size : integer
+        Number of rows processed at once
+    percentage : float
+        Percentage of galaxies in the testing files
+    subfiles : integer
+        Number of testing files
+
+    Returns
+    -------
+    stats : dict
+        Stage, success, number of galaxies, bytes processed,
+        elapsed time (s), galaxies/s, MB/s and peak RSS (MB)
+    """
+    success = True
+    start = time.perf_counter()
+    if stage == 'synthetic':
+        nbytes = 0
+        for ivol in subvols:
+            nbytes += write_synthetic_files(config, ivol, ngal,
+                                            chunk_size=chunk_size or 10**6)
+    elif stage == 'validate':
+        nbytes = get_input_size(config, subvols)
+        for ivol in subvols:
+            success &= validate_hdf5_file(config, config['snap'], ivol,
+                                          verbose=False)
+    elif stage == 'generate':
+        nbytes = get_input_size(config, subvols)
+        for ivol in subvols:
+            success &= generate_input_file(config, ivol, chunk_size=chunk_size)
+    elif stage == 'read_output':
+        nbytes = read_output(config, subvols)
+    elif stage == 'test_files':
+        nbytes = get_output_size(config, subvols)
+        outpath = os.path.join(os.path.dirname(config['outroot']), 'test_files')
+        success = generate_test_files(config, subvols, percentage, subfiles,
+                                      outpath=outpath, verbose=False)
+    else:
+        raise ValueError(f"Stage '{stage}' not supported. Available stages: {stages}")
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes in Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    ngals = ngal*len(subvols)
+    return {
+        'stage': stage,
+        'success': bool(success),
+        'ngal': ngals,
+        'nbytes': nbytes,
+        'time_s': elapsed,
+        'gal_per_s': ngals/elapsed,
+        'MB_per_s': nbytes/1e6/elapsed,
+        'peak_rss_MB': rss,
+        'output_MB': get_output_size(config, subvols)/1e6,
+    }
+
+
+def benchmark(layout, path, ngal, subvols=[0], run_stages=stages,
+              chunk_size=None, storage=None, verbose=True):
+    """
+    Benchmark the stages on synthetic files, each stage running
+    in a fresh process
+
+    Parameters
+    ----------
+    layout : str
+        Layout of the files, 'galform' or 'shark'
+    path : string
+        Path to the synthetic input and output files
+    ngal : integer
+        Number of galaxies per subvolume
+    subvols : list of integers
+        List of subvolumes to be considered
+    run_stages : list of str
+        Stages to be run, in order
+    chunk_size : integer
+        Number of rows processed at once
+    storage : dict or str
+        Storage options of the output datasets, as config['storage'],
+        or the name of one of the storage_presets
+    verbose : bool
+        If True, print the statistics of each stage
+
+    Returns
+    -------
+    allstats : list of dict
+        Statistics of each stage, as returned by run_stage
+    """
+    config = get_synthetic_config(layout, path)
+    if isinstance(storage, str):
+        if storage not in storage_presets:
+            raise ValueError(f"Storage '{storage}' not supported. "
+                             f"Available storage presets: {list(storage_presets)}")
+        storage = storage_presets[storage]
+    if storage is not None:
+        config['storage'] = storage
+
+    allstats = []
+    ctx = multiprocessing.get_context('spawn')
+    for stage in run_stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            stats = pool.submit(run_stage, stage, config, subvols, ngal,
+                                chunk_size=chunk_size).result()
+        stats['layout'] = layout
+        allstats.append(stats)
+        if verbose:
+            print(f"* {layout} {stage}: {stats['ngal']:.1e} galaxies in "
+                  f"{stats['time_s']:.2f} s, {stats['gal_per_s']:.3g} galaxies/s, "
+                  f"{stats['MB_per_s']:.1f} MB/s, "
+                  f"peak RSS {stats['peak_rss_MB']:.0f} MB")
+        if not stats['success']:
+            print(f"WARNING: {stage} failed for the {layout} files.")
+    return allstats
+
+
+def benchmark_storage(layout, path, ngal, presets=list(storage_presets),
+                      subvols=[0], chunk_size=None, verbose=True):
+    """
+    Write and read throughput, and size of the output files,
+    for different storage options of the output datasets.
+    The synthetic input files are written once.
+
+    Parameters
+    ----------
+    layout : str
+        Layout of the files, 'galform' or 'shark'
+    path : string
+        Path to the synthetic input and output files
+    ngal : integer
+        Number of galaxies per subvolume
+    presets : list of str
+        Names of the storage_presets to be compared
+    subvols : list of integers
+        List of subvolumes to be considered
+    chunk_size : integer
+        Number of rows processed at once
+    verbose : bool
+        If True, print the statistics of each preset
+
+    Returns
+    -------
+    results : list of dict
+        Preset, write and read statistics (as returned by run_stage)
+        and size of the output files (MB)
+    """
+    benchmark(layout, path, ngal, subvols=subvols, run_stages=['synthetic'],
+              chunk_size=chunk_size, verbose=False)
+
+    results = []
+    for preset in presets:
+        write, read = benchmark(layout, path, ngal, subvols=subvols,
+                                run_stages=['generate', 'read_output'],
+                                chunk_size=chunk_size, storage=preset,
+                                verbose=False)
+        results.append({'preset': preset, 'write': write, 'read': read,
+                        'output_MB': read['output_MB']})
+        if verbose:
+            print(f"* {layout} {preset}: output {read['output_MB']:.1f} MB, "
+                  f"write {write['gal_per_s']:.3g} galaxies/s, "
+                  f"read {read['MB_per_s']:.1f} MB/s")
+        if not (write['success'] and read['success']):
+            print(f"WARNING: {preset} storage failed for the {layout} files.")
+    return results
@@ -0,0 +1,311 @@
+"""
+SQLite catalogue of the input files of a campaign: size and
+modification time of the files of each (sim, snap, ivol), and the
+shape and data type of the datasets in the groups that are read
+"""
+import os
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+
+import src.utils as u
+from src.config import get_config
+from src.read_plan import get_input_files
+
+schema = """
+CREATE TABLE IF NOT EXISTS files (
+    sim TEXT, snap INTEGER, ivol INTEGER, name TEXT, path TEXT,
+    size INTEGER, mtime_ns INTEGER,
+    PRIMARY KEY (sim, snap, ivol, name));
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT, grp TEXT, dataset TEXT, shape TEXT, nrows INTEGER,
+    dtype TEXT,
+    PRIMARY KEY (path, grp, dataset));
+CREATE TABLE IF NOT EXISTS crawled (
+    path TEXT, grp TEXT);
+CREATE INDEX IF NOT EXISTS crawled_path ON crawled (path);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+"""
+
+def connect(dbfile):
+    """
+    Open a catalogue, creating its tables if needed
+    """
+    outdir = os.path.dirname(dbfile)
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+    conn = sqlite3.connect(dbfile)
+    conn.executescript(schema)
+    return conn
+
+
+def get_groups(config):
+    """
+    Groups read from each input file of a configuration,
+    with the file names used in the configuration as keys
+    """
+    allfiles = [config['file_props']]
+    if config['selection'] is not None:
+        allfiles.insert(0, config['selection'])
+
+    groups = {}
+    for files in allfiles:
+        for ifile, props in files.items():
+            fgroups = groups.setdefault(ifile, [])
+            if props.get('group') not in fgroups:
+                fgroups.append(props.get('group'))
+    if 'file_redshift' in config:
+        groups['file_redshift'] = [config['file_redshift']['group']]
+    return groups
+
+
+def crawl_file(path, groups, known=None):
+    """
+    Size, modification time and datasets of an input file
+
+    Parameters
+    ----------
+    path : string
+        Path to the hdf5 file
+    groups : list of strings
+        Groups whose datasets are to be recorded (None for the root)
+    known : tuple
+        (size, mtime_ns) already in the catalogue. If they have not
+        changed, the file is not opened.
+
+    Returns
+    -------
+    entry : dict
+        'path', 'size' and 'mtime_ns' (None for missing files) and
+        'datasets', a list of (group, dataset, shape, dtype), None if
+        the file is unchanged
+    """
+    entry = {'path': path, 'size': None, 'mtime_ns': None, 'datasets': []}
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return entry
+    entry['size'] = stat.st_size; entry['mtime_ns'] = stat.st_mtime_ns
+    if known is not None and tuple(known) == (stat.st_size, stat.st_mtime_ns):
+        entry['datasets'] = None
+        return entry
+
+    try:
+        with h5py.File(path, 'r') as hdf_file:
+            for group in groups:
+                hf = u.open_hdf5_group(hdf_file, group)
+                if hf is None: continue
+                for name, obj in hf.items():
+                    if isinstance(obj, h5py.Dataset):
+                        entry['datasets'].append((group, name, list(obj.shape),
+                                                  str(obj.dtype)))
+    except OSError:
+        pass # Not readable as hdf5: no datasets recorded
+    return entry
+
+
+def _crawl_task(task):
+    return crawl_file(*task)
+
+
+def build_catalogue(dbfile, simulations, workers=None, laptop=False,
+                    verbose=True):
+    """
+    Crawl the input files of a set of simulations into a catalogue,
+    with the files inspected concurrently by a pool of processes.
+    Files with the size and modification time already catalogued
+    are not opened again.
+
+    Parameters
+    ----------
+    dbfile : string
+        SQLite file with the catalogue
+    simulations : list of tuples
+        (sim, snaps, subvols) for each simulation, as in validate_files.py
+    workers : integer
+        Number of processes, by default SLURM_CPUS_PER_TASK if defined,
+        otherwise 1
+    laptop : bool
+        If True, use local test configuration
+    verbose : bool
+        If True, print a summary
+
+    Returns
+    -------
+    nfiles : integer
+        Number of files catalogued, including missing ones
+    """
+    configs = []
+    for sim, snaps, subvols in simulations:
+        for snap in snaps:
+            try:
+                config = get_config(sim, snap, subvols, laptop=laptop)
+            except (ValueError, OSError, SystemExit):
+                print(f'WARNING: No configuration for {sim} snapshot {snap}')
+                continue
+            configs.append((sim, snap, subvols, config))
+    return add_to_catalogue(dbfile, configs, workers=workers, verbose=verbose)
+
+
+def add_to_catalogue(dbfile, configs, workers=None, verbose=True):
+    """
+    Crawl the input files of a set of configurations into a catalogue,
+    as build_catalogue. Unchanged files are opened again if groups
+    not crawled before are needed, recording those crawled before too.
+
+    Parameters
+    ----------
+    dbfile : string
+        SQLite file with the catalogue
+    configs : list of tuples
+        (sim, snap, subvols, config) with the configuration of each
+        simulation snapshot, as given by src.config.get_config
+    workers : integer
+        Number of processes, by default SLURM_CPUS_PER_TASK if defined,
+        otherwise 1
+    verbose : bool
+        If True, print a summary
+
+    Returns
+    -------
+    nfiles : integer
+        Number of files catalogued, including missing ones
+    """
+    conn = connect(dbfile)
+    known = {path: (size, mtime) for path, size, mtime in conn.execute(
+        'SELECT path, size, mtime_ns FROM files WHERE size IS NOT NULL')}
+    crawled = {}
+    for path, group in conn.execute('SELECT path, grp FROM crawled'):
+        crawled.setdefault(path, []).append(group)
+
+    units = []; tasks = {}
+    for sim, snap, subvols, config in configs:
+        groups = get_groups(config)
+        for ivol in subvols:
+            for ifile, path in get_input_files(config, ivol).items():
+                units.append((sim, snap, ivol, ifile, path))
+                if path not in tasks:
+                    tasks[path] = [path, list(crawled.get(path, [])),
+                                   known.get(path)]
+                fgroups = tasks[path][1]
+                fgroups.extend(g for g in groups[ifile] if g not in fgroups)
+    for path, task in tasks.items():
+        if set(task[1]) - set(crawled.get(path, [])):
+            task[2] = None # New groups to be crawled
+
+    nworkers = min(u.get_nworkers(workers), max(len(tasks), 1))
+    if nworkers <= 1:
+        entries = list(map(_crawl_task, tasks.values()))
+    else:
+        chunksize = max(len(tasks)//(4*nworkers), 1)
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            entries = list(executor.map(_crawl_task, tasks.values(),
+                                        chunksize=chunksize))
+    entries = {entry['path']: entry for entry in entries}
+
+    with conn:
+        for sim, snap, ivol, ifile, path in units:
+            entry = entries[path]
+            conn.execute('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?)',
+                         (sim, snap, ivol, ifile, path,
+                          entry['size'], entry['mtime_ns']))
+        for path, entry in entries.items():
+            if entry['datasets'] is None: continue # Unchanged
+            conn.execute('DELETE FROM crawled WHERE path = ?', (path,))
+            if entry['size'] is not None:
+                conn.executemany('INSERT INTO crawled VALUES (?,?)',
+                                 [(path, group) for group in tasks[path][1]])
+            conn.execute('DELETE FROM datasets WHERE path = ?', (path,))
+            conn.executemany('INSERT INTO datasets VALUES (?,?,?,?,?,?)',
+                             [(path, group, name, json.dumps(shape),
+                               shape[0] if shape else None, dtype)
+                              for group, name, shape, dtype in entry['datasets']])
+    conn.close()
+
+    if verbose:
+        nmissing = sum(entry['size'] is None for entry in entries.values())
+        nopened = sum(entry['datasets'] is not None and entry['size'] is not None
+                      for entry in entries.values())
+        print(f' * Catalogue {dbfile}: {len(entries)} files,',
+              f'{nopened} inspected, {nmissing} missing')
+    return len(entries)
+
+
+def get_files(dbfile, sim, snap=None, ivol=None):
+    """
+    Catalogued input files
+
+    Parameters
+    ----------
+    dbfile : string
+        SQLite file with the catalogue
+    sim : str
+        Simulation type, as in src.config.get_config
+    snap : integer
+        Snapshot number, None for all
+    ivol : integer
+        Number of subvolume, None for all
+
+    Returns
+    -------
+    files : list of dict
+        'sim', 'snap', 'ivol', 'name', 'path', 'size' and 'mtime_ns'
+        of each file, with None size for missing files
+    """
+    query = 'SELECT * FROM files WHERE sim = ?'; args = [sim]
+    if snap is not None:
+        query += ' AND snap = ?'; args.append(snap)
+    if ivol is not None:
+        query += ' AND ivol = ?'; args.append(ivol)
+    conn = connect(dbfile)
+    conn.row_factory = sqlite3.Row
+    files = [dict(row) for row in conn.execute(query + ' ORDER BY snap, ivol', args)]
+    conn.close()
+    return files
+
+
+def get_subvolume_bytes(dbfile, sim, snap):
+    """
+    Size of the input files of each catalogued subvolume of a snapshot,
+    counting once the files with several names (as Shark's galaxies.hdf5,
+    also its file_redshift)
+
+    Returns
+    -------
+    nbytes : dict
+        Bytes of the existing input files, with the subvolumes as keys
+    """
+    conn = connect(dbfile)
+    rows = conn.execute('SELECT ivol, SUM(size) FROM ('
+                        'SELECT DISTINCT ivol, path, COALESCE(size, 0) AS size '
+                        'FROM files WHERE sim = ? AND snap = ?) '
+                        'GROUP BY ivol ORDER BY ivol',
+                        (sim, snap)).fetchall()
+    conn.close()
+    return {ivol: nbytes for ivol, nbytes in rows}
+
+
+def get_structure(dbfile, path):
+    """
+    Catalogued structure of an input file
+
+    Returns
+    -------
+    structure : dict
+        Datasets of each catalogued group, with the group names as keys.
+        None if the file is not catalogued or missing.
+    """
+    conn = connect(dbfile)
+    row = conn.execute('SELECT size FROM files WHERE path = ? LIMIT 1',
+                       (path,)).fetchone()
+    if row is None or row[0] is None:
+        conn.close()
+        return None
+    structure = {}
+    for group, dataset in conn.execute('SELECT grp, dataset FROM datasets '
+                                       'WHERE path = ?', (path,)):
+        structure.setdefault(group, []).append(dataset)
+    conn.close()
+    return structure
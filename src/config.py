@@ -8,6 +8,44 @@ import os
 
 sims = ['GP20cosma','GP20SU','GP20UNIT1Gpc', 'SharkSU', 'SharkUNIT1Gpc'] 
 
+# Data type of the output datasets, with the first matching pattern
+# of their names (GALFORM and Shark) applying. Other datasets,
+# such as positions and halo indexes, keep their input data type.
+output_schema = {
+    # Indexes and types
+    'gal_index': 'int32',
+    'type': 'int32',
+    # Luminosities, magnitudes and their ratios
+    'L_*': 'float32',
+    'Lbol_AGN': 'float32',
+    'bolometric_luminosity_agn': 'float32',
+    'mag_*': 'float32',
+    'ratio_*': 'float32',
+    # Metallicities
+    'Zgas_*': 'float32',
+    # Velocities and sizes
+    'v?gal': 'float32',
+    'velocity_*': 'float32',
+    'vbulge': 'float32',
+    'rbulge': 'float32',
+    'rcomb': 'float32',
+    'rdisk': 'float32',
+    'rgas_*': 'float32',
+    # Masses, star formation and black holes
+    'mcold*': 'float32',
+    'mgas_*': 'float32',
+    'mhhalo': 'float32',
+    'mhot': 'float32',
+    'mstars_*': 'float32',
+    'mstardot*': 'float32',
+    'mvir_*': 'float32',
+    'm_bh': 'float32',
+    'M_SMBH': 'float32',
+    'SMBH_*': 'float32',
+    'sfr_*': 'float32',
+    'bh_*': 'float32',
+}
+
 
 def get_config(sim, snap, subvols, laptop=False, verbose=False):
     """
@@ -50,6 +88,7 @@ def get_config(sim, snap, subvols, laptop=False, verbose=False):
     config_function = globals()[function_name]
     config = config_function(snap, subvols, cosmo_var=cosmo_var,
                              laptop=laptop, verbose=verbose)
+    config.setdefault('output_schema', output_schema)
     return config
 
 
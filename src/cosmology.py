@@ -4,8 +4,17 @@
 Cosmology + some useful functions
 This module contains various functions to compute distances and 
 times in a Universe with a given cosmology.
+The calculations are done by instances of the immutable Cosmology
+class, which own their precomputed distance tables. The functions
+below are wrappers over the instance created with set_cosmology().
 List of functions:
+  Cosmology(): cosmology with its distance tables, exposing the
+               functions below as methods.
+  get_cosmology(): returns a Cosmology, reusing the instances already
+                   built within the process.
   set_cosmology(): lets user specify a cosmology.
+  comoving_distance_table(): tabulates the comoving distance
+                             on a grid of redshifts (Mpc/h).
   cosmology_set(): determines wheter an input cosmology
                    has been specfied.
   report_cosmology(): report back parameters for specified 
@@ -53,9 +62,13 @@ Based upon the 'Cosmology Calculator' (Wright, 2006, PASP,
 118, 1711) and Fortran 90 code written by John Helly.
 """
 
-import sys
+import sys, os
+import hashlib
+from functools import lru_cache
 import numpy as np
 
+import src.utils as u
+
 WM = None
 WV = None
 WB = None
@@ -65,6 +78,8 @@ h = None
 
 kmpersec_to_mpchpergyr = None
 
+_default = None
+
 zmax = 20.0
 dz = 0.0005
 nzmax = int(zmax/dz)
@@ -137,8 +152,659 @@ def romberg(f, a, b, max_steps=10, acc=1e-8):
     return Rp[max_steps]  # Return our best guess
 
 
+_lookup_keys = ['_inv_dz', '_dzz', '_drr', '_inv_drr', '_rbin', '_inv_hh']
+_block_size = 65536
+
+def _blocked(kernel, x):
+    """
+    Applies an element-wise kernel to x in blocks that fit in cache,
+    returning a float for scalar inputs
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 0:
+        return kernel(x.reshape(1))[0]
+
+    xf = x.ravel()
+    out = np.empty(xf.shape)
+    for start in range(0, len(xf), _block_size):
+        stop = start + _block_size
+        out[start:stop] = kernel(xf[start:stop])
+    return out.reshape(x.shape)
+
+
+def _lerp(x, ii, xx, inv_dxx, yy, dyy):
+    """
+    Linear interpolation within the bins ii of the table (xx, yy),
+    constant beyond its edges and NaN for NaN inputs, as np.interp
+    """
+    frac = x - xx[ii]
+    frac *= inv_dxx
+    np.clip(frac, 0., 1., out=frac)
+    frac *= dyy[ii]
+    frac += yy[ii]
+    return frac
+
+
+def _to_output(arr):
+    """
+    Returns 0-d arrays as scalars and other arrays unchanged
+    """
+    if np.ndim(arr) == 0:
+        return float(arr)
+    return arr
+
+
+class Cosmology:
+    """
+    Cosmology(): immutable cosmology, holding the cosmological
+                 parameters and the comoving distance relation
+                 tabulated as a function of redshift.
+
+    USAGE: cosmo = Cosmology([Omega_M],[Omega_b],[Omega_V],[h],
+                             [universe=Flat],[include_radiation=False],
+                             [cache_dir=None])
+           r = cosmo.comoving_distance(z)
+
+    The parameters are those of set_cosmology(). Instances can be
+    shared between threads and sent to worker processes; if the
+    tables come from a cache file, only the parameters are pickled
+    and the tables are memory-mapped again on arrival.
+    """
+    def __init__(self, omega0=None, omegab=None, lambda0=None, h0=None,
+                 universe="Flat", include_radiation=False, cache_dir=None):
+        if(h0 is None):
+            h = 0.674
+        else:
+            h = h0
+        if(include_radiation):
+            WR = 8.985075e-5
+        else:
+            WR = 0.0
+        if(omegab is None):
+            WB = 0.0224/(h*h)
+        else:
+            WB = omegab
+        if(omega0 is None):
+            WM = 0.315
+        else:
+            WM = omega0
+        WV = None
+        if(lambda0 is None):
+            if(universe in ("Flat","F","flat","f")):
+                WV = 1.0 - (WM + WR)
+            if(universe in ("Open","O","open","o")):
+                WV = 0
+        else:
+            WV = lambda0
+        WK = 1.0 - (WM + WV + WR)
+
+        params = dict(WM=WM, WV=WV, WB=WB, WR=WR, WK=WK, h=h,
+                      include_radiation=bool(include_radiation),
+                      cache_dir=cache_dir,
+                      kmpersec_to_mpchpergyr=kilo * (Gyr/Mpc) * h)
+        for key, val in params.items():
+            object.__setattr__(self, key, val)
+        self._set_tables()
+
+    def _set_tables(self):
+        """
+        Tabulate the comoving distance relation, from the cache if set
+        """
+        if self.cache_dir is None:
+            zz = np.arange(0.0,zmax,dz)
+            rr = self.comoving_distance_table(zz)
+            zz.flags.writeable = False
+            rr.flags.writeable = False
+        else:
+            zz, rr = self.load_distance_table(self.cache_dir)
+        object.__setattr__(self, 'redshift', zz)
+        object.__setattr__(self, 'r_comoving', rr)
+        self._set_lookup()
+
+    def _set_lookup(self):
+        """
+        Bin widths of the distance tables and the lookup table of
+        r_comoving bins, on a uniform grid in distances finer than any
+        bin, used by comoving_distance and redshift_at_distance
+        """
+        zz = self.redshift; rr = self.r_comoving
+        nn = len(zz)
+        lookup = {'_inv_dz': (nn - 1)/(zz[-1] - zz[0]),
+                  '_dzz': np.diff(zz), '_drr': np.diff(rr)}
+        lookup['_inv_drr'] = 1.0/lookup['_drr']
+
+        # Each cell of the uniform grid holds at most two bin edges
+        hh = 0.5*lookup['_drr'].min()
+        ncell = int((rr[-1] - rr[0])/hh) + 2
+        edges = rr[0] + hh*np.arange(ncell)
+        rbin = np.searchsorted(rr, edges, side='right') - 1
+        lookup['_rbin'] = np.minimum(rbin, nn - 2).astype(np.int32)
+        lookup['_inv_hh'] = 1.0/hh
+
+        for key, val in lookup.items():
+            if isinstance(val, np.ndarray):
+                val.flags.writeable = False
+            object.__setattr__(self, key, val)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Cosmology instances are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Cosmology instances are immutable')
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.cache_dir is not None:
+            # Tables are memory-mapped again from the cache
+            for key in ['redshift', 'r_comoving'] + _lookup_keys:
+                del state[key]
+        return state
+
+    def __setstate__(self, state):
+        for key, val in state.items():
+            object.__setattr__(self, key, val)
+        if 'r_comoving' not in state:
+            self._set_tables()
+
+    def __repr__(self):
+        return (f'Cosmology(omega0={self.WM}, omegab={self.WB}, '
+                f'lambda0={self.WV}, h0={self.h}, '
+                f'include_radiation={self.include_radiation})')
+
+    def comoving_distance_table(self, zz):
+        """
+        comoving_distance_table(): returns the comoving distance (in Mpc/h)
+                         at each redshift of an increasing grid starting
+                         at z=0, integrating f(z) with Simpson's rule
+                         within each bin and a cumulative sum over bins.
+
+        USAGE: r = cosmo.comoving_distance_table(zz)
+        NOTE: for the default grid (dz=0.0005 up to z=20) the result
+              matches the bin by bin romberg integration to a relative
+              difference below 1e-12.
+        """
+        zz = np.asarray(zz, dtype=float)
+        r = np.zeros(len(zz))
+        if len(zz) < 2:
+            return r
+
+        z1 = zz[:-1]; z2 = zz[1:]
+        dr = (z2 - z1)*(self.f(z1) + 4.0*self.f(0.5*(z1 + z2)) + self.f(z2))/6.0
+        np.cumsum(dr, out=r[1:])
+        return r
+
+    def load_distance_table(self, cache_dir):
+        """
+        load_distance_table(): returns the redshift grid and the comoving
+                         distances (in Mpc/h), memory-mapped from a cache
+                         file in cache_dir. The file is built if it does
+                         not exist.
+
+        USAGE: zz, r = cosmo.load_distance_table(cache_dir)
+        NOTE: cache files are keyed by (omega0, omegab, lambda0, h0,
+              include_radiation, zmax, dz). They are written to a
+              temporary file that is atomically renamed, so concurrent
+              jobs building the same entry do not read partial files.
+        """
+        key = repr((float(self.WM), float(self.WB), float(self.WV),
+                    float(self.h), self.include_radiation,
+                    float(zmax), float(dz)))
+        label = hashlib.sha1(key.encode()).hexdigest()[:16]
+        cache_file = os.path.join(cache_dir, f'cosmology_{label}.npy')
+
+        if os.path.exists(cache_file):
+            try:
+                table = np.load(cache_file, mmap_mode='r')
+                return table[0], table[1]
+            except (OSError, ValueError):
+                pass # Unreadable file, to be rebuilt
+
+        zz = np.arange(0.0,zmax,dz)
+        table = np.vstack((zz, self.comoving_distance_table(zz)))
+        table.flags.writeable = False
+
+        if not u.write_atomic(cache_file, lambda ff: np.save(ff, table),
+                              binary=True):
+            return table[0], table[1] # Unusable cache: kept in memory
+
+        table = np.load(cache_file, mmap_mode='r')
+        return table[0], table[1]
+
+    def report_cosmology(self):
+        """
+        report_cosmology(): reports parameters for this cosmology
+        """
+        print("***********************")
+        print("COSMOLOGY:")
+        print("   Omega_M = {0:5.3f}".format(self.WM))
+        print("   Omega_b = {0:5.3f}".format(self.WB))
+        print("   Omega_V = {0:5.3f}".format(self.WV))
+        print("   h       = {0:5.3f}".format(self.h))
+        print("   Omega_R = {0:5.3e}".format(self.WR))
+        print("   Omega_k = {0:5.3f}".format(self.WK))
+        print("***********************")
+        return
+
+    def f(self, z):
+        """
+        f(z): Function relating comoving distance to redshift.
+              Integrating f(z)dz from 0 to z' gives comoving
+              distance r(z'). Result is in Mpc/h.
+        """
+        return DH/self.E(z)
+
+    def E(self, z):
+        """
+        E(z): Peebles' E(z) function.
+        """
+        a = 1.0/(1.0+z)
+        result = self.WK*np.power(a,-2) + self.WV + \
+                 self.WM*np.power(a,-3) + self.WR*np.power(a,-4)
+        return np.sqrt(result)
+
+    def rez(self, lz):
+        """
+        E(ln_z): Function relating comoving distance to redshift.
+              Integrating rez(z)d(ln_z) from zlow to z' gives comoving
+              distance r(z'). Result is in Mpc/h.
+        """
+        return self.f(np.exp(lz))
+
+    def H(self, z):
+        """
+        H(z): Hubble parameter as measured by an observer at redshift, z.
+        """
+        return 100.0*self.E(z)
+
+    def tHubble(self, z):
+        """
+        tHubble(z): Hubble time at z in Gyr.
+        """
+        return 1./(self.H(z)*self.kmpersec_to_mpchpergyr)
+
+    def comoving_distance(self, z):
+        """
+        comoving_distance(): comoving distance (in Mpc/h)
+                             corresponding to redshift, z.
+        NOTE: linear interpolation as np.interp, with the bins found
+              directly from the uniform redshift grid.
+        """
+        return _blocked(self._comoving_distance_block, z)
+
+    def _comoving_distance_block(self, z):
+        zz = self.redshift
+        zc = np.fmin(np.fmax(z, zz[0]), zz[-1]) # NaN are indexed as zz[0]
+        ii = ((zc - zz[0])*self._inv_dz).astype(np.intp)
+        np.minimum(ii, len(zz) - 2, out=ii)
+        return _lerp(z, ii, zz, self._inv_dz, self.r_comoving, self._drr)
+
+    def redshift_at_distance(self, r):
+        """
+        redshift_at_distance(): redshift corresponding
+                                to comoving distance, r (in Mpc/h).
+        NOTE: linear interpolation as np.interp, with the bins found
+              from a lookup table in distances and one comparison
+              with each neighbouring bin edge.
+        """
+        return _blocked(self._redshift_at_distance_block, r)
+
+    def _redshift_at_distance_block(self, r):
+        rr = self.r_comoving
+        rc = np.fmin(np.fmax(r, rr[0]), rr[-1]) # NaN are indexed as rr[0]
+        ii = self._rbin[((rc - rr[0])*self._inv_hh).astype(np.intp)]
+        ii -= rc < rr[ii]
+        ii += rc >= rr[ii + 1]
+        np.minimum(ii, len(rr) - 2, out=ii)
+        return _lerp(r, ii, rr, self._inv_drr[ii], self.redshift, self._dzz)
+
+    def age_of_universe(self, z):
+        """
+        age_of_universe(): age of the Universe (in Gyr) at a redshift, z.
+        """
+        WM = self.WM; WV = self.WV; h = self.h
+        a = 1.0/(1.0+z)
+        if(WM >= 0.99999): # Einstein de Sitter Universe
+            result = invH0*2.0*np.sqrt(a)/(3.0*h)
+        else:
+            if(WV <= 0.0): # Open Universe
+                zplus1 = 1.0/a
+                result1 = (WM/(2.0*h*np.power(1-WM,1.5)))
+                result2 = 2.0*np.sqrt(1.0-WM)*np.sqrt(WM*(zplus1-1.0)+1.0)
+                result3 = np.arccosh((WM*(zplus1-1.0)-WM+2.0)/(WM*zplus1))
+                result = invH0*result1*(result2/result3)
+            else: # Flat Universe with non-zero Cosmological Constant
+                result1 = (2.0/(3.0*h*np.sqrt(1.0-WM)))
+                result2 = np.arcsinh(np.sqrt((1.0/WM-1.0)*a)*a)
+                result = invH0*result1*result2
+        return result
+
+    def lookback_time(self, z):
+        """
+        lookback_time(): lookback time (in Gyr) to redshift, z.
+        """
+        return self.age_of_universe(0.0) - self.age_of_universe(z)
+
+    def angular_diameter_distance(self, z):
+        """
+        angular_diameter_distance(): angular diameter distance (in Mpc/h)
+                                     corresponding to redshift, z.
+                                     Da = size/rad
+        """
+        WK = self.WK
+        dr = self.comoving_distance(z)*Mpc/(c/H100) #Unitless
+        x = np.sqrt(np.abs(WK))*dr
+        if np.ndim(x) > 0:
+            ratio = np.ones_like(x)*-1.00
+            mask = (x > 0.1)
+            y = x[np.where(mask)]
+            if(WK > 0.0):
+                np.place(ratio,mask,0.5*(np.exp(y)-np.exp(-y))/y)
+            else:
+                np.place(ratio,mask,np.sin(y)/y)
+            mask = (x <= 0.1)
+            y = np.power(x[np.where(mask)],2)
+            if(WK < 0.0):
+                y = -y
+            np.place(ratio,mask,1.0 + y/6.0 + np.power(y,2)/120.0)
+        else:
+            ratio = -1.0
+            if(x > 0.1):
+                if(WK > 0.0):
+                    ratio = 0.5*(np.exp(x)-np.exp(-x))/x
+                else:
+                    ratio = np.sin(x)/x
+            else:
+                y = np.power(x,2)
+                if(WK < 0.0):
+                    y = -y
+                ratio = 1.0 + y/6.0 + np.power(y,2)/120.0
+        dt = ratio*dr/(1.0+z)
+        dA = (c/H100)*dt/Mpc
+        return dA
+
+    def angular_scale(self, z):
+        """
+        angular_scale(): angular scale (in kpc/h/arcsec)
+                         corresponding to redshift, z.
+        """
+        da = self.angular_diameter_distance(z) #Mpc/h/rad
+        return da/206.26480 # 1 rad = 206265 arcsec
+
+    def luminosity_distance(self, z):
+        """
+        luminosity_distance(): luminosity distance (in Mpc/h)
+                               corresponding to a redshift, z.
+        """
+        return self.angular_diameter_distance(z)*(1.0+z)**2
+
+    def comoving_volume(self, z, verbose=False):
+        """
+        comoving_volume(): comoving volume (in (Mpc/h)^3) contained
+                           within a sphere extending out to redshift, z.
+                           z can be a scalar or an array.
+        """
+        if np.ndim(z) > 0:
+            z = np.asarray(z, dtype=float)
+        elif (z<zlow_lim):
+            return 0.0
+
+        WK = self.WK
+        dr = self.comoving_distance(z)*Mpc/(c/H100) #Unitless: DC/DH
+        x = np.sqrt(np.abs(WK))*dr
+        if np.ndim(z) > 0:
+            ratio = np.ones_like(z)*-1.0
+            mask = (x > 0.1)
+            y = x[np.where(mask)]
+            if(WK > 0.0):
+                rat = (0.125*(np.exp(2.0*y)-np.exp(-2.0*y))-y/2.0)
+            else:
+                rat = (y/2.0 - np.sin(2.0*y)/4.0)
+            np.place(ratio,mask,rat/(np.power(y,3)/3.0))
+            mask = (x <= 0.1)
+            y = np.power(x[np.where(mask)],2)
+            if(WK < 0.0):
+                y = -y
+            np.place(ratio,mask,1.0 + y/5.0 + np.power(y,2)*(2.0/105.0))
+        else:
+            ratio = -1.0
+            if(x > 0.1):
+                if(WK > 0.0):
+                    ratio = (0.125*(np.exp(2.0*x)-np.exp(-2.0*x))-x/2.0)
+                else:
+                    ratio = (x/2.0 - np.sin(2.0*x)/4.0)
+                ratio = ratio/(np.power(x,3)/3.0)
+            else:
+                y = np.power(x,2)
+                if(WK < 0.0):
+                    y = -y
+                ratio = 1.0 + y/5.0 + np.power(y,2)*(2.0/105.0)
+
+        vol = 4.0*np.pi*ratio*np.power((c/H100)*dr/Mpc,3)/3.0
+        if np.ndim(z) > 0:
+            vol[z < zlow_lim] = 0.0
+
+        if verbose:
+            print('cV (z={:.1f}) = {:.4e} (Mpc/h)^-3'.format(z,vol))
+        return vol
+
+    def cv_survey(self, z1, z2, area, verbose=False):
+        """
+        cv_survey(): comoving volume of a survey [(Mpc/h)^-3] between
+                     z1 and z2 over an area in deg2.
+        """
+        # The volume below zlow_lim is 0
+        dV = self.comoving_volume(z2) - self.comoving_volume(z1)
+
+        vsurvey = dV*area/asky
+
+        if verbose:
+            print('V survey (dz={:.1f}) = {:.4e} (Mpc/h)^-3'.format(z2-z1,vsurvey))
+        return vsurvey
+
+    def dVdz(self, z):
+        """
+        dVdz() : comoving volume element dV/dz at redshift, z,
+                 for all sky (Mpc/h)^3.
+        """
+        dA = self.angular_diameter_distance(z)
+        return self.f(z)*np.power(dA,2)*np.power(1.0+z,2)*4.0*np.pi
+
+    def distance_modulus(self, z):
+        """
+        distance_modulus(): 5log10(Dl/10) - 5logh, Dl in Mpc/h,
+                            for a scalar or an array of redshifts
+        """
+        z = np.asarray(z, dtype=float)
+        dm = np.zeros(z.shape)
+        ind = z >= zlow_lim
+        if np.any(ind):
+            dL = self.luminosity_distance(z[ind])
+            dm[ind] = 5.0*np.log10(dL) + 25
+        return _to_output(dm)
+
+    def band_corrected_distance_modulus(self, z):
+        """
+        band_corrected_distance_modulus(): Band Corrected Distance
+                 Modulus (BCDM) at redshift, z, a scalar or an array.
+                 See the module function of the same name for
+                 further information.
+        """
+        z = np.asarray(z, dtype=float)
+        bcdm = np.zeros(z.shape)
+        ind = z >= zlow_lim
+        if np.any(ind):
+            dref = 10.0/mega # 10pc in Mpc
+            zi = z[ind]
+            dL = self.luminosity_distance(zi)
+            bcdm[ind] = 5.0*np.log10(dL/dref) - 2.5*np.log10(1.0+zi)
+        return _to_output(bcdm)
+
+    def Hubble(self):
+        """ Hubble(): returns h """
+        return self.h
+
+    def Omega_M(self):
+        """ Omega_M(): returns Omega_M """
+        return self.WM
+
+    def Omega_b(self):
+        """ Omega_b(): returns Omega_b """
+        return self.WB
+
+    def Omega_V(self):
+        """ Omega_V(): returns Omega_V """
+        return self.WV
+
+    def Omega_r(self):
+        """ Omega_r(): returns Omega_r """
+        return self.WR
+
+    def Omega_k(self):
+        """ Omega_k(): returns Omega_k """
+        return self.WK
+
+    def omegam(self, z):
+        """ Matter density at z """
+        a = 1.0/(1.0+z)
+        return self.WM*np.power(a,-3)/(self.E(z)**2)
+
+    def omegab(self, z):
+        """ Baryonic density at z """
+        a = 1.0/(1.0+z)
+        return self.WB*np.power(a,-3)/(self.E(z)**2)
+
+    def omegav(self, z):
+        """ Vacuum/Cosmological constant density at z """
+        return self.WV/(self.E(z)**2)
+
+    def omegar(self, z):
+        """ Radiation density at z """
+        a = 1.0/(1.0+z)
+        return self.WR*np.power(a,-4)/(self.E(z)**2)
+
+    def kaiser_factor(self, z, bias, gamma=None):
+        """
+        Kaiser Factor from either a linear bias value or an array bias
+        """
+        if (gamma is None):
+            gamma = 0.55
+
+        omb = np.power(self.omegam(z),gamma)/bias
+        return 1. + (2./3.)*omb + (1./5.)*omb**2.
+
+    def ndeg2nV(self, ndeg, z1, z2, verbose=False):
+        """
+        Transforms number of objects per deg2 per dz to
+        number density (N/V) [(Mpc/h)^-3].
+        """
+        dV = self.comoving_volume(z2) - self.comoving_volume(z1)
+        dz = z2-z1
+        nV = ndeg*dz*asky/dV
+
+        if verbose:
+            print('n (dz={:.1f}) = {:.4e} (Mpc/h)^-3'.format(dz,nV))
+        return nV
+
+    def sphere_area(self, inz):
+        """
+        Area, 4 pi d_L^2, in (cm/h)^2 of the sphere with the luminosity
+        distance to redshifts inz (scalar or array), which are raised
+        to a minimum of zlow_lim.
+        """
+        zz = np.maximum(np.asarray(inz, dtype=float), zlow_lim)
+
+        # Luminosity distance in cm/h
+        d_L = self.luminosity_distance(zz)*Mpc2cm
+        return 4.0*np.pi*(d_L**2)
+
+    def logL2flux(self, log10luminosity, inz):
+        """
+        Flux in units of erg/s/cm^2 from log10(Luminosity in units
+        of h-2erg/s) and corresponding redshifts.
+        Inputs can be scalars or arrays that broadcast together.
+        """
+        logL = np.asarray(log10luminosity, dtype=float)
+        den = self.sphere_area(inz)
+        logL, den = np.broadcast_arrays(logL, den)
+
+        # Luminosities are in h-2 erg/s units
+        emission_line_flux = np.zeros(logL.shape)
+        ind = logL > -9.
+        # Flux in erg/s/cm^2
+        emission_line_flux[ind] = 10**(logL[ind] - np.log10(den[ind]))
+        return _to_output(emission_line_flux)
+
+    def emission_line_flux(self, luminosity_data, inz):
+        """
+        Flux in units of erg/s/cm^2 from bolometric luminosity_data
+        in units of E+40*h-2erg/s and corresponding redshifts.
+        Inputs can be scalars or arrays that broadcast together.
+        """
+        lum = np.asarray(luminosity_data, dtype=float)
+        den = self.sphere_area(inz)
+        lum, den = np.broadcast_arrays(lum, den)
+
+        # Luminosities are in 10^40 h-2 erg/s units
+        emission_line_flux = np.zeros(lum.shape)
+        ind = lum > 0.
+        # Flux in erg/s/cm^2
+        emission_line_flux[ind] = 10**(np.log10(lum[ind]/den[ind]) + 40.)
+        return _to_output(emission_line_flux)
+
+    def emission_line_luminosity(self, flux_data, inz):
+        """
+        Bolometric luminosity in units of E+40*erg/s from flux_data
+        in units of erg/s/cm^2 and corresponding redshifts.
+        Inputs can be scalars or arrays that broadcast together.
+        """
+        flux = np.asarray(flux_data, dtype=float)
+        den = self.sphere_area(inz)
+        flux, den = np.broadcast_arrays(flux, den)
+
+        emission_line_luminosity = np.zeros(flux.shape)
+        ind = flux > 0.
+        emission_line_luminosity[ind] = 10**(np.log10(den[ind]*flux[ind]) - 40.)
+        return _to_output(emission_line_luminosity)
+
+    def polar2cartesians(self, ra, dec, zz):
+        """ Cartesian coordinates given polar ones in degrees """
+        dist = self.comoving_distance(zz)
+        cx = dist*np.cos(dec*(np.pi/180.))*np.cos(ra*(np.pi/180.))
+        cy = dist*np.cos(dec*(np.pi/180.))*np.sin(ra*(np.pi/180.))
+        cz = dist*np.sin(dec*(np.pi/180.))
+        return cx,cy,cz
+
+
+@lru_cache(maxsize=None)
+def get_cosmology(omega0=None, omegab=None, lambda0=None, h0=None,
+                  universe="Flat", include_radiation=False, cache_dir=None):
+    """
+    get_cosmology(): returns a Cosmology with the given parameters,
+                     reusing the instance if it has already been
+                     built within this process.
+
+    USAGE: cosmo = get_cosmology([Omega_M],[Omega_b],[Omega_V],[h],
+                                 [universe=Flat],[include_radiation=False],
+                                 [cache_dir=None])
+    """
+    return Cosmology(omega0=omega0, omegab=omegab, lambda0=lambda0, h0=h0,
+                     universe=universe, include_radiation=include_radiation,
+                     cache_dir=cache_dir)
+
+
+def get_default():
+    """
+    get_default(): returns the Cosmology set with set_cosmology(),
+                   and exits if no cosmology has been set.
+    """
+    if _default is None:
+        print('STOP: No cosmology has been set, use set_cosmology()')
+        sys.exit(1)
+    return _default
+
+
 def set_cosmology(omega0=None,omegab=None,lambda0=None,h0=None, \
-                      universe="Flat",include_radiation=False):
+                      universe="Flat",include_radiation=False,cache_dir=None):
     """
     set_cosmology(): Sets the cosmological parameters and evaluates
                      the comoving distance relation as a function
@@ -161,45 +827,45 @@ def set_cosmology(omega0=None,omegab=None,lambda0=None,h0=None, \
                      -- can be "True" (i.e. set Omega_R = 4.165e-5/(h*h))
                      of "False" (i.e. set Omega_R = 0.0)
                      (default value is False)
+           cache_dir: directory with cached distance tables, which
+                     are memory-mapped if present and created otherwise
+                     (default value is None, no cache)
           Default values: Planck18
+    NOTE: the Cosmology instance is reused if the same parameters
+          have already been set within the process.
     """
+    global _default
+    _default = get_cosmology(omega0=omega0, omegab=omegab, lambda0=lambda0,
+                             h0=h0, universe=universe,
+                             include_radiation=include_radiation,
+                             cache_dir=cache_dir)
 
-    global WM, WV, WB, WR, WK, h
-    if(h0 is None):
-        h = 0.674
-    else:
-        h = h0    
-    if(include_radiation):
-        WR = 8.985075e-5
-    else:
-        WR = 0.0
-    if(omegab is None):
-        WB = 0.0224/(h*h)
-    else:
-        WB = omegab
-    if(omega0 is None):
-        WM = 0.315
-    else:
-        WM = omega0
-    if(lambda0 is None):
-        if(universe in ("Flat","F","flat","f")):
-            WV = 1.0 - (WM + WR)
-        if(universe in ("Open","O","open","o")):
-            WV = 0
-    else:
-        WV = lambda0
-    WK = 1.0 - (WM + WV + WR)
+    # Module variables, kept for backwards compatibility
+    global WM, WV, WB, WR, WK, h, kmpersec_to_mpchpergyr
+    WM = _default.WM; WV = _default.WV; WB = _default.WB
+    WR = _default.WR; WK = _default.WK; h = _default.h
+    kmpersec_to_mpchpergyr = _default.kmpersec_to_mpchpergyr
 
     global r_comoving, redshift
-    for i in range(1,len(redshift)):
-        z1 = redshift[i-1]
-        z2 = redshift[i]
-        r_comoving[i] = r_comoving[i-1] + romberg(f,z1,z2)
+    redshift = _default.redshift
+    r_comoving = _default.r_comoving
+    return
 
-    global kmpersec_to_mpchpergyr
-    kmpersec_to_mpchpergyr = kilo * (Gyr/Mpc) * h
 
-    return
+def comoving_distance_table(zz):
+    """
+    comoving_distance_table(): returns the comoving distance (in Mpc/h)
+                     at each redshift of an increasing grid starting
+                     at z=0, integrating f(z) with Simpson's rule
+                     within each bin and a cumulative sum over bins.
+
+    USAGE: r = comoving_distance_table(zz)
+    NOTE: a cosmology must first have been set. For the
+          default grid (dz=0.0005 up to z=20) the result matches
+          the bin by bin romberg integration to a relative
+          difference below 1e-12.
+    """
+    return get_default().comoving_distance_table(zz)
 
 
 def set_Millennium():
@@ -239,27 +905,15 @@ def cosmology_set():
                      no ==> FALSE).
     USAGE: cosmology_set()
     """
-    if(WM is None):
-        return False
-    else:
-        return True
-    
+    return _default is not None
+
 
 def report_cosmology():
     """
     report_cosmology(): reports parameters for inputted cosmology
     USAGE: report_comology()
     """
-    print("***********************")
-    print("COSMOLOGY:")
-    print("   Omega_M = {0:5.3f}".format(WM))
-    print("   Omega_b = {0:5.3f}".format(WB))
-    print("   Omega_V = {0:5.3f}".format(WV))
-    print("   h       = {0:5.3f}".format(h))
-    print("   Omega_R = {0:5.3e}".format(WR))
-    print("   Omega_k = {0:5.3f}".format(WK))
-    print("***********************")
-    return
+    return get_default().report_cosmology()
 
 
 def f(z):
@@ -268,25 +922,18 @@ def f(z):
           Integrating f(z)dz from 0 to z' gives comoving
           distance r(z'). Result is in Mpc/h.
           
-          Note: uses global cosmology variables.          
+          Note: uses the cosmology set with set_cosmology().          
     """
-    a = 1.0/(1.0+z)
-    result = WK*np.power(a,-2) + WV + \
-        WM*np.power(a,-3) + WR*np.power(a,-4)
-    result = DH/np.sqrt(result)
-    return result
+    return get_default().f(z)
 
 
 def E(z):
     """
     E(z): Peebles' E(z) function.
               
-          Note: uses global cosmology variables.  
+          Note: uses the cosmology set with set_cosmology().  
     """
-    a = 1.0/(1.0+z)
-    result = WK*np.power(a,-2) + WV + \
-             WM*np.power(a,-3) + WR*np.power(a,-4)
-    return np.sqrt(result)
+    return get_default().E(z)
 
 
 def rez(lz):
@@ -295,17 +942,9 @@ def rez(lz):
           Integrating rez(z)d(ln_z) from zlow to z' gives comoving
           distance r(z'). Result is in Mpc/h.
           
-          Note: uses global cosmology variables.          
+          Note: uses the cosmology set with set_cosmology().          
     """
-    
-    z = exp(lz)
-    a = 1.0/(1.0+z)
-    result = WK*np.power(a,-2) + WV + \
-        WM*np.power(a,-3) + WR*np.power(a,-4)
-
-    result = DH/np.sqrt(result)
-    return result
-
+    return get_default().rez(lz)
 
 
 def H(z):
@@ -313,17 +952,15 @@ def H(z):
     H(z): Function to return the Hubble parameter as measured
            by an observer at redshift, z.
     """
-    cosmology_set()
-    result = 100.0*E(z)
-    return result
+    return get_default().H(z)
+
 
 def tHubble(z):
     """
     tHubble(z): Function to return the Hubble time at z in Gyr.
     """
-    cosmology_set()
-    result = 1./(H(z)*kmpersec_to_mpchpergyr)
-    return result
+    return get_default().tHubble(z)
+
 
 def comoving_distance(z):
     """
@@ -334,9 +971,8 @@ def comoving_distance(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()
     """
-    cosmology_set()
-    r = np.interp(z,redshift,r_comoving)
-    return r
+    return get_default().comoving_distance(z)
+
 
 def redshift_at_distance(r):
     """
@@ -346,9 +982,7 @@ def redshift_at_distance(r):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()
     """
-    cosmology_set()
-    z = np.interp(r,r_comoving,redshift)
-    return z
+    return get_default().redshift_at_distance(r)
 
 
 def age_of_universe(z):
@@ -359,22 +993,7 @@ def age_of_universe(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()
     """
-    cosmology_set()
-    a = 1.0/(1.0+z)
-    if(WM >= 0.99999): # Einstein de Sitter Universe
-        result = invH0*2.0*np.sqrt(a)/(3.0*h)
-    else:
-        if(WV <= 0.0): # Open Universe
-            zplus1 = 1.0/a
-            result1 = (WM/(2.0*h*np.power(1-WM,1.5)))
-            result2 = 2.0*np.sqrt(1.0-WM)*np.sqrt(WM*(zplus1-1.0)+1.0)
-            result3 = np.arccosh((WM*(zplus1-1.0)-WM+2.0)/(WM*zplus1))
-            result = invH0*result1*(result2/result3)
-        else: # Flat Universe with non-zero Cosmological Constant
-            result1 = (2.0/(3.0*h*np.sqrt(1.0-WM)))
-            result2 = np.arcsinh(np.sqrt((1.0/WM-1.0)*a)*a)
-            result = invH0*result1*result2
-    return result
+    return get_default().age_of_universe(z)
 
 
 def lookback_time(z):
@@ -386,9 +1005,7 @@ def lookback_time(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()    
     """
-    cosmology_set()
-    t = age_of_universe(0.0) - age_of_universe(z)
-    return t
+    return get_default().lookback_time(z)
 
 
 def angular_diameter_distance(z):
@@ -401,37 +1018,7 @@ def angular_diameter_distance(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()    
     """
-    cosmology_set()
-    dr = comoving_distance(z)*Mpc/(c/H100) #Unitless
-    x = np.sqrt(np.abs(WK))*dr
-    if np.ndim(x) > 0:
-        ratio = np.ones_like(x)*-1.00
-        mask = (x > 0.1)
-        y = x[np.where(mask)]
-        if(WK > 0.0):
-            np.place(ratio,mask,0.5*(np.exp(y)-np.exp(-y))/y)
-        else:
-            np.place(ratio,mask,np.sin(y)/y)
-        mask = (x <= 0.1)
-        y = np.power(x[np.where(mask)],2)
-        if(WK < 0.0): 
-            y = -y
-        np.place(ratio,mask,1.0 + y/6.0 + np.power(y,2)/120.0)
-    else:        
-        ratio = -1.0
-        if(x > 0.1):
-            if(WK > 0.0):
-                ratio = 0.5*(np.exp(x)-np.exp(-x))/x
-            else:
-                ratio = np.sin(x)/x
-        else:
-            y = np.power(x,2)
-            if(WK < 0.0): 
-                y = -y
-            ratio = 1.0 + y/6.0 + np.power(y,2)/120.0
-    dt = ratio*dr/(1.0+z)
-    dA = (c/H100)*dt/Mpc
-    return dA
+    return get_default().angular_diameter_distance(z)
 
 
 def angular_scale(z):
@@ -443,11 +1030,8 @@ def angular_scale(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()    
     """
-    cosmology_set()
-    da = angular_diameter_distance(z) #Mpc/h/rad
-    a = da/206.26480 # 1 rad = 206265 arcsec
-    return a
-    
+    return get_default().angular_scale(z)
+
 
 def luminosity_distance(z):
     """
@@ -458,9 +1042,8 @@ def luminosity_distance(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()    
     """
-    dL = angular_diameter_distance(z)*(1.0+z)**2
-    return dL
-    
+    return get_default().luminosity_distance(z)
+
 
 def comoving_volume(z, verbose=False):
     """
@@ -473,46 +1056,7 @@ def comoving_volume(z, verbose=False):
     cosmo.comoving_volume(0.9,verbose=True)
     > cV (z=0.9) = 4.03e+10 (Mpc/h)^-3
     """
-    cosmology_set()
-
-    if (z<zlow_lim):
-        return 0.0
-    
-    dr = comoving_distance(z)*Mpc/(c/H100) #Unitless: DC/DH
-    x = np.sqrt(np.abs(WK))*dr
-    if np.ndim(z) > 0:
-        ratio = np.ones_like(z)*-1.0
-        mask = (x > 0.1)
-        y = x[np.where(mask)]
-        if(WK > 0.0):
-            rat = (0.125*(np.exp(2.0*y)-np.exp(-2.0*y))-y/2.0)
-        else:
-            rat = (y/2.0 - np.sin(2.0*y)/4.0)
-        np.place(ratio,mask,rat/(np.power(y,3)/3.0))
-        mask = (x <= 0.1)
-        y = np.power(x[np.where(mask)],2)
-        if(WK < 0.0): 
-            y = -y
-        np.place(ratio,mask,1.0 + y/5.0 + np.power(y,2)*(2.0/105.0))
-    else:  
-        ratio = -1.0
-        if(x > 0.1):
-            if(WK > 0.0):
-                ratio = (0.125*(np.exp(2.0*x)-np.exp(-2.0*x))-x/2.0)
-            else:
-                ratio = (x/2.0 - np.sin(2.0*x)/4.0)
-            ratio = ratio/(np.power(x,3)/3.0)
-        else:
-            y = np.power(x,2)
-            if(WK < 0.0): 
-                y = -y
-            ratio = 1.0 + y/5.0 + np.power(y,2)*(2.0/105.0)
-
-    vol = 4.0*np.pi*ratio*np.power((c/H100)*dr/Mpc,3)/3.0
-
-    if verbose:
-        print('cV (z={:.1f}) = {:.4e} (Mpc/h)^-3'.format(z,vol))
-    return vol
+    return get_default().comoving_volume(z, verbose=verbose)
 
 
 def cv_survey(z1,z2,area,verbose=False):
@@ -531,17 +1075,7 @@ def cv_survey(z1,z2,area,verbose=False):
     cosmo.cv_survey(0.9,1.0,14000,verbose=True)
     > V survey (dz=0.1) = 3.9e+09 (Mpc/h)^-3
     '''
-
-    if (z1<zlow_lim):
-        dV = comoving_volume(z2)
-    else:
-        dV = comoving_volume(z2) - comoving_volume(z1)
-        
-    vsurvey = dV*area/asky
-    
-    if verbose:
-        print('V survey (dz={:.1f}) = {:.4e} (Mpc/h)^-3'.format(z2-z1,vsurvey))    
-    return vsurvey
+    return get_default().cv_survey(z1, z2, area, verbose=verbose)
 
 
 def dVdz(z):
@@ -556,23 +1090,15 @@ def dVdz(z):
     NOTE: requires that a cosmology must first have been
           set using set_cosmology()         
     """
-    cosmology_set()
-    dA = angular_diameter_distance(z)
-    return f(z)*np.power(dA,2)*np.power(1.0+z,2)*4.0*np.pi
-    
+    return get_default().dVdz(z)
+
 
 def distance_modulus(z):
     '''
     Dinstance modulus 5log10(Dl/10) - 5logh
     Dl is expected in Mpc/h
     '''
-    cosmology_set()
-    if (z < zlow_lim):
-        dm = 0.0
-    else:
-        dL = luminosity_distance(z)
-        dm = 5.0*np.log10(dL) + 25
-    return dm
+    return get_default().distance_modulus(z)
 
 
 def band_corrected_distance_modulus(z):
@@ -604,14 +1130,7 @@ def band_corrected_distance_modulus(z):
     that we are taking into account when defining this "band corrected"
     distance modulus. 
     """
-    cosmology_set()
-    if (z < zlow_lim):
-        bcdm = 0.0
-    else:
-        dref = 10.0/mega # 10pc in Mpc
-        dL = luminosity_distance(z)
-        bcdm = 5.0*np.log10(dL/dref) - 2.5*np.log10(1.0+z)
-    return bcdm
+    return get_default().band_corrected_distance_modulus(z)
 
 
 def Hubble():
@@ -621,8 +1140,8 @@ def Hubble():
     
     USAGE: h = Hubble()
     """
-    cosmology_set()
-    return h
+    return get_default().Hubble()
+
 
 def Omega_M():
     """
@@ -631,8 +1150,7 @@ def Omega_M():
     
     USAGE: wm = Omega_M()
     """
-    cosmology_set()
-    return WM
+    return get_default().Omega_M()
 
 
 def Omega_b():
@@ -642,8 +1160,8 @@ def Omega_b():
                    
     USAGE: wb = Omega_b()
     """
-    cosmology_set()
-    return WB
+    return get_default().Omega_b()
+
 
 def Omega_V():
     """
@@ -652,8 +1170,8 @@ def Omega_V():
                    
     USAGE: wv = Omega_V()
     """
-    cosmology_set()
-    return WV
+    return get_default().Omega_V()
+
 
 def Omega_r():
     """
@@ -661,10 +1179,9 @@ def Omega_r():
                (will exit if no cosmology has been set)
     USAGE: wr = Omega_r()
     """
-    cosmology_set()
-    return WR
+    return get_default().Omega_r()
+
 
-    
 def Omega_k():
     """
     Omega_k(): returns Omega_k for the specified cosmology
@@ -672,51 +1189,43 @@ def Omega_k():
                    
     USAGE: wk = Omega_k()
     """
-    cosmology_set()
-    return WK
+    return get_default().Omega_k()
 
 
 def omegam(z):
     """
     Matter density at z
               
-          Note: uses global cosmology variables.  
+          Note: uses the cosmology set with set_cosmology().  
     """
-    a = 1.0/(1.0+z)
-    omegam=WM*np.power(a,-3)/(E(z)**2)
-    return omegam
+    return get_default().omegam(z)
+
 
 def omegab(z):
     """
     Baryonic density at z
               
-          Note: uses global cosmology variables.  
+          Note: uses the cosmology set with set_cosmology().  
     """
-    a = 1.0/(1.0+z)
-    omegab=WB*np.power(a,-3)/(E(z)**2)
-    return omegab
+    return get_default().omegab(z)
 
 
 def omegav(z):
     """
     Vacuum/Cosmological constant density at z
               
-          Note: uses global cosmology variables.  
+          Note: uses the cosmology set with set_cosmology().  
     """
-    a = 1.0/(1.0+z)
-    omegav=WV/(E(z)**2)
-    return omegav
+    return get_default().omegav(z)
 
 
 def omegar(z):
     """
     Radiation density at z
               
-          Note: uses global cosmology variables.  
+          Note: uses the cosmology set with set_cosmology().  
     """
-    a = 1.0/(1.0+z)
-    omegar=WR*np.power(a,-4)/(E(z)**2)
-    return omegar
+    return get_default().omegar(z)
 
 
 def kaiser_factor(z,bias,gamma=None):
@@ -724,13 +1233,7 @@ def kaiser_factor(z,bias,gamma=None):
     Calculate the Kaiser Factor from either a linear bias value
     or an array bias 
     """
-    if (gamma is None):
-        gamma = 0.55
-    
-    omb = np.power(omegam(z),gamma)/bias 
-    kaiser_factor = 1. + (2./3.)*omb + (1./5.)*omb**2.
-
-    return kaiser_factor
+    return get_default().kaiser_factor(z, bias, gamma=gamma)
 
 
 def ndeg2nV(ndeg,z1,z2,verbose=False):
@@ -750,38 +1253,16 @@ def ndeg2nV(ndeg,z1,z2,verbose=False):
     cosmo.ndeg2nV(2400,0.6,1.6)
     > 0.0002671477226063551
     '''
+    return get_default().ndeg2nV(ndeg, z1, z2, verbose=verbose)
 
-    dV = comoving_volume(z2) - comoving_volume(z1)
-    dz = z2-z1
-    nV = ndeg*dz*asky/dV
-    
-    if verbose:
-        print('n (dz={:.1f}) = {:.4e} (Mpc/h)^-3'.format(dz,nV))
-    
-    return nV
 
-    
 def logL2flux(log10luminosity,inz):
     """
     Returns flux in units of erg/s/cm^2 from input of
     log10(Luminosity in units of h-2erg/s)
     and corresponding redshifts.
     """
-    if log10luminosity>-9.:
-        zz = max(inz,zlow_lim)
-        
-        # Luminosity distance in cm/h
-        d_L = luminosity_distance(zz)*Mpc2cm
-
-        # Luminosities are in h-2 erg/s units
-        den = 4.0*np.pi*(d_L**2)
-        emission_line_flux = log10luminosity - np.log10(den)
-        # Flux in erg/s/cm^2
-        emission_line_flux = 10**(emission_line_flux)
-    else:
-        emission_line_flux = 0.
-
-    return emission_line_flux
+    return get_default().logL2flux(log10luminosity, inz)
 
 
 def emission_line_flux(luminosity_data,inz):
@@ -790,22 +1271,7 @@ def emission_line_flux(luminosity_data,inz):
     bolometric luminosity_data in units of E+40*h-2erg/s
     and corresponding redshifts.
     """
-
-    if luminosity_data>0.:
-        zz = max(inz,zlow_lim)
-        
-        # Luminosity distance in cm/h
-        d_L = luminosity_distance(zz)*Mpc2cm
-
-        # Luminosities are in 10^40 h-2 erg/s units
-        den = 4.0*np.pi*(d_L**2)
-        emission_line_flux = np.log10(luminosity_data/den) + 40.
-        # Flux in erg/s/cm^2
-        emission_line_flux = 10**(emission_line_flux)
-    else:
-        emission_line_flux = 0.
-        
-    return emission_line_flux
+    return get_default().emission_line_flux(luminosity_data, inz)
 
 
 def emission_line_luminosity(flux_data,inz):
@@ -813,28 +1279,13 @@ def emission_line_luminosity(flux_data,inz):
     Returns bolometric luminosity in units of E+40*erg/s from input of 
     flux_data in units of erg/s/cm^2 and corresponding redshifts.
     """
-
-    if flux_data>0.:
-        zz = max(inz,zlow_lim)
-        
-        # Luminosity distance in cm/h
-        d_L = luminosity_distance(zz)*Mpc2cm
-        
-        emission_line_luminosity = np.log10(4.0*np.pi*(d_L**2)*flux_data) - 40.
-        emission_line_luminosity = 10**(emission_line_luminosity)
-    else:
-        emission_line_luminosity = 0.
-        
-    return emission_line_luminosity
+    return get_default().emission_line_luminosity(flux_data, inz)
 
 
 def polar2cartesians(ra,dec,zz):
     """ Returns cartesian coordinates given polar ones in degrees"""
-    dz = comoving_distance(zz)
-    cx = dz*np.cos(dec*(np.pi/180.))*np.cos(ra*(np.pi/180.))
-    cy = dz*np.cos(dec*(np.pi/180.))*np.sin(ra*(np.pi/180.))
-    cz = dz*np.sin(dec*(np.pi/180.))
-    return cx,cy,cz
+    return get_default().polar2cartesians(ra, dec, zz)
+
 
 if __name__== "__main__":
     #set_Planck13()
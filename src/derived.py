@@ -0,0 +1,133 @@
+"""
+Registry of the properties derived from the input datasets
+"""
+from functools import partial
+import numpy as np
+
+notnum  = -999.
+
+class DerivedColumn:
+    """
+    Property computed from input datasets
+
+    Parameters
+    ----------
+    name : string
+        Name of the output dataset
+    inputs : list of strings
+        Names of the input datasets, passed in this order to the kernel
+    units : string
+        Units of the output dataset
+    kernel : function
+        Function returning the property from the input arrays
+    drop : list of strings
+        Input datasets not to be written in the output file
+
+    Examples
+    --------
+    >>> col = DerivedColumn('Zgas_disc', ['mcold', 'cold_metal'], 'M_Z/M',
+    ...                     metallicity, drop=['cold_metal'])
+    >>> Zdisc = col.evaluate({'mcold': mcold, 'cold_metal': cold_metal})
+    """
+    def __init__(self, name, inputs, units, kernel, drop=()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.units = units
+        self.kernel = kernel
+        self.drop = list(drop)
+
+    def evaluate(self, columns):
+        return self.kernel(*[columns[name] for name in self.inputs])
+
+    def __repr__(self):
+        return f'DerivedColumn({self.name!r}, {self.inputs!r})'
+
+
+def metallicity(mass, metals):
+    """
+    Metallicity M_Z/M, 0 for galaxies without mass
+    """
+    Z = np.zeros(np.shape(mass))
+    np.divide(metals, mass, out=Z, where=mass > 0.)
+    return Z
+
+
+def add_columns(*vals):
+    """
+    Sum of the input arrays
+    """
+    total = np.array(vals[0], dtype=float)
+    for val in vals[1:]:
+        total += val
+    return total
+
+
+def ext_ratio(lum, lum_ext):
+    """
+    Ratio L_ext/L, notnum*L_ext for galaxies without luminosity
+    """
+    ratio = np.multiply(lum_ext, notnum, dtype=float)
+    np.divide(lum_ext, lum, out=ratio, where=lum > 0.)
+    return ratio
+
+
+def apparent_mag(mag, tomag=0.):
+    """
+    Apparent magnitude from an absolute one and the distance modulus,
+    modifying the input array
+    """
+    mag += tomag
+    return mag
+
+
+def get_derived_columns(config, units, tomag=None):
+    """
+    Derived properties that can be computed from the available datasets
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    units : dict
+        Units of the available input datasets, with their names as keys
+    tomag : float
+        Distance modulus to convert magnitudes into apparent ones
+
+    Returns
+    -------
+    columns : list of DerivedColumn
+        Derived properties, in the order they are to be written
+    """
+    columns = []
+
+    # Metallicities
+    for mass, metals, name in [
+            (config['mcold_disc'], config['mcold_z_disc'], 'Zgas_disc'),
+            (config['mcold_burst'], config['mcold_z_burst'], 'Zgas_bst')]:
+        columns.append(DerivedColumn(name, [mass, metals], 'M_Z/M',
+                                     metallicity, drop=[metals]))
+
+    # Stellar mass of the bursts, if not given
+    mstars_burst = config.get('mstars_burst', 'mstars_burst')
+    if mstars_burst not in units:
+        inputs = [config.get('mstars_burst_diskinstabilities', 'mstars_burst_diskinstabilities'),
+                  config.get('mstars_burst_mergers', 'mstars_burst_mergers')]
+        columns.append(DerivedColumn(mstars_burst, inputs, 'Msun/h', add_columns))
+
+    # Luminosity ratios
+    for line in config['lines']:
+        nom = f"{config['line_prefix']}{line}"
+        enom = f"{config['line_prefix']}{line}{config['line_suffix_ext']}"
+        columns.append(DerivedColumn(f"ratio_{line}", [nom, enom],
+                                     'L_ext/L (dimensionless)',
+                                     ext_ratio, drop=[enom]))
+
+    # Apparent magnitudes, replacing the input ones
+    if tomag is not None:
+        for name, unit in units.items():
+            if 'mag' in name:
+                columns.append(DerivedColumn(name, [name], unit,
+                                             partial(apparent_mag, tomag=tomag),
+                                             drop=[name]))
+
+    return [col for col in columns if set(col.inputs).issubset(units)]
@@ -2,15 +2,23 @@
 Program to generate input files for gnerate_nebular_emission
 """
 import os
+import json
+from contextlib import ExitStack
 import h5py
 import numpy as np
 
 import src.utils as u
 import src.cosmology as cosmo
+from src.instrument import Recorder
+from src.derived import get_derived_columns
+from src.read_plan import get_read_plan, get_plan_files, get_planned_bytes
+from src.read_plan import get_input_bytes
+from src.manifest import get_manifest, is_up_to_date
 
-notnum  = -999.
+index_formats = ['int64', 'int32', 'runs']
 
-def generate_input_file(config, ivol, verbose=False):
+def generate_input_file(config, ivol, verbose=False, chunk_size=None,
+                        index_format=None, force=True):
     """
     Generate input file for generate_nebular_emission
     
@@ -22,12 +30,55 @@ def generate_input_file(config, ivol, verbose=False):
         Number of subvol
     verbose : bool
         Enable verbose output
+    chunk_size : integer
+        If given, the subvolume is streamed in blocks of this number
+        of input rows, from the selection to the output, so that the
+        memory footprint does not depend on the size of the subvolume.
+        By default, the whole subvolume is processed at once.
+    index_format : string
+        Format of the indexes of the selected galaxies in the original
+        files: 'int64' or 'int32' for a gal_index dataset, or 'runs'
+        for contiguous runs of selected galaxies, stored in the index
+        group as gal_index_start and gal_index_stop (exclusive), so that
+        the data group keeps one row per galaxy.
+        By default, the data type of gal_index in config['output_schema'],
+        or 'int64'.
+    force : bool
+        If False, the file is not generated again if its manifest
+        matches the current input files, configuration and code.
         
     Returns
     -------
     bool
-        True if the file has been successfully generated, False otherwise
+        True if the file has been successfully generated (or is up to date),
+        False otherwise
+
+    Notes
+    -----
+    HDF5 storage options for the output datasets can be given in
+    config['storage'], as described in src.utils.get_storage_options.
+    The data types of the output datasets can be given in
+    config['output_schema'], as src.config.output_schema, the values
+    being cast as they are read. Properties needed to derive others
+    are read with their input precision and cast once derived.
+    The wall time, bytes read and written, hdf5 opens and rows of each
+    stage are written into gne_input_stats.json, next to the output file.
+    Once the file is complete, a manifest with the size and modification
+    time of the input files, a hash of the configuration and the code
+    version is stored as the 'manifest' attribute of the header.
     """
+    schema = config.get('output_schema')
+    if index_format is None:
+        index_format = u.get_output_dtype(schema, 'gal_index', 'int64').name
+    if index_format not in index_formats:
+        raise ValueError(f"Index format '{index_format}' not supported. Available formats: {index_formats}")
+    if not force and is_up_to_date(config, ivol, verbose=verbose,
+                                   index_format=index_format):
+        print(f' * Up to date subvolume {ivol}, skipping it')
+        return True
+    stats = Recorder()
+    manifest = get_manifest(config, ivol, index_format=index_format)
+
     # Generate a header for the output file
     outroot = config['outroot']
     outpath = outroot+str(ivol) + '/'
@@ -40,250 +91,362 @@ def generate_input_file(config, ivol, verbose=False):
 
     outfile = outpath+'gne_input.hdf5'
     try:
-        hf = h5py.File(outfile, 'w')
+        with stats.timer('open'):
+            writer = u.OutputWriter(outfile, storage=config.get('storage'))
+        stats.add('open', opens=1)
     except:
         print(f' Not able to generate file: {outfile}')
         return False
-    headnom = 'header'
-    head = hf.create_dataset(headnom,())
-    head.attrs[u'h0'] = config['h0']
-    head.attrs[u'omega0'] = config['omega0']
-    head.attrs[u'omegab'] = config['omegab']
-    head.attrs[u'lambda0'] = config['lambda0']
-    head.attrs[u'bside_Mpch'] = config['boxside']
-    head.attrs[u'mp_Msunh'] = config['mp']
-    head.attrs[u'snapnum'] = config['snap']
-    data_group = hf.create_group('data')
+    writer.set_header('h0', config['h0'])
+    writer.set_header('omega0', config['omega0'])
+    writer.set_header('omegab', config['omegab'])
+    writer.set_header('lambda0', config['lambda0'])
+    writer.set_header('bside_Mpch', config['boxside'])
+    writer.set_header('mp_Msunh', config['mp'])
+    writer.set_header('snapnum', config['snap'])
     if 'fnl' in config:
-        head.attrs[u'fnl'] = config['fnl']
+        writer.set_header('fnl', config['fnl'])
     if 'ln_As' in config:
-        head.attrs[u'ln_As'] = config['ln_As']
-    hf.close()
+        writer.set_header('ln_As', config['ln_As'])
+
+    try:
+        _write_subvolume(config, ivol, writer, stats, chunk_size=chunk_size,
+                         index_format=index_format, verbose=verbose)
+        # Only complete files have a manifest
+        if manifest is not None:
+            writer.set_header('manifest', json.dumps(manifest))
+    finally:
+        with stats.timer('write'):
+            writer.close()
+
+    stats.dump(outpath+'gne_input_stats.json', ivol=ivol,
+               snapnum=config['snap'], outfile=outfile, chunk_size=chunk_size)
+    print(f' * Generated file: {outfile}')
+    return True
+
+
+def _write_subvolume(config, ivol, writer, stats, chunk_size=None,
+                     index_format='int64', verbose=False):
+    """
+    Read, select and derive the properties of one subvolume,
+    passing them to an open output writer
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvol
+    writer : OutputWriter
+        Writer with the output file already open
+    stats : Recorder
+        Instrumentation of the stages
+    chunk_size : integer
+        Number of input rows per block, None for a single block
+    index_format : string
+        Format of the indexes of the selected galaxies, see generate_input_file
+    verbose : bool
+        Enable verbose output
+    """
+    # Open each input file once for the whole subvolume
+    plan = get_read_plan(config, ivol)
+    with ExitStack() as stack:
+        hfiles = {}
+        for filename in get_plan_files(plan):
+            with stats.timer('open'):
+                hfiles[filename] = stack.enter_context(h5py.File(filename, 'r'))
+            stats.add('open', opens=1)
+
+        planned_bytes = get_planned_bytes(plan, hfiles)
+        stats.count(planned_bytes=planned_bytes,
+                    input_bytes=get_input_bytes(config, ivol))
+        if verbose:
+            print(f'  - Read plan: {len(hfiles)} files,',
+                  f'{planned_bytes/1e6:.1f} MB at most')
+
+        # Redshift and conversion to apparent magnitudes
+        tomag = _set_redshift(config, plan, hfiles, writer, stats)
+
+        # Derived properties computable from the input datasets
+        units = {}
+        for read in plan:
+            if read['phase'] == 'redshift': continue
+            for prop, unit in zip(read['datasets'], read['units']):
+                units.setdefault(prop, unit)
+        derived = get_derived_columns(config, units, tomag=tomag)
+        if verbose:
+            print(f'  - Derived properties: {[col.name for col in derived]}')
+
+        # Process the subvolume in blocks of rows
+        nrows = _count_rows(plan, hfiles)
+        stats.count(rows_in=nrows, rows_selected=0)
+        if index_format == 'int32' and nrows > 2**31 - 1:
+            print('WARNING: too many galaxies for int32 indexes, using int64.')
+            index_format = 'int64'
 
-    # Paths to files to be read
-    path = u.get_path(config['root'],ivol,ending=config['ending'])
-    except_file = config.get('except_file')
-    if except_file is not None:
-        except_path =  u.get_path(config['root'],ivol)
+        # Output data types
+        schema = config.get('output_schema')
+        dtypes = {}
+        for name in list(units) + [col.name for col in derived]:
+            dtype = u.get_output_dtype(schema, name)
+            if dtype is not None:
+                dtypes[name] = dtype
+        if chunk_size is None:
+            chunk_size = max(nrows, 1)
+            write = writer.write
+        else:
+            write = writer.append
+
+        overflow = set()
+        def put(name, data, units=None, group='data'):
+            if name in dtypes:
+                with np.errstate(over='ignore'):
+                    data = data.astype(dtypes[name], copy=False)
+                if (dtypes[name].kind == 'f' and name not in overflow
+                        and np.isinf(data).any()):
+                    overflow.add(name)
+                    print(f'WARNING: {name} has infinite values as {dtypes[name]},',
+                          'check the output schema.')
+            with stats.timer('write'):
+                write(name, data, units=units, group=group)
+            stats.add('write', bytes_written=data.nbytes)
+
+        index_runs = []
+        for start in range(0, nrows, chunk_size):
+            stop = min(start + chunk_size, nrows)
+            if verbose and stop - start < nrows:
+                print(f'  - Rows {start} to {stop} of {nrows}')
+            _write_block(plan, hfiles, start, stop, put, stats,
+                         derived=derived, dtypes=dtypes,
+                         index_format=index_format, index_runs=index_runs,
+                         verbose=verbose)
+        if index_format == 'runs' and index_runs:
+            _put_index_runs(put, u.merge_runs(index_runs))
+    return
+
+
+def _count_rows(plan, hfiles):
+    """
+    Number of rows of the input datasets of a subvolume
+
+    Parameters
+    ----------
+    plan : list of dict
+        Reads, as given by get_read_plan
+    hfiles : dict
+        Open input hdf5 files, with their paths as keys
+
+    Returns
+    -------
+    nrows : integer
+    """
+    for read in plan:
+        if read['phase'] == 'redshift': continue
+        hf = u.open_hdf5_group(hfiles[read['file']], read['group'])
+        for dataset in read['datasets']:
+            if hf[dataset].ndim > 0:
+                return hf[dataset].shape[0]
+    return 0
+
+
+def _set_redshift(config, plan, hfiles, writer, stats):
+    """
+    Store the redshift of the subvolume in the header and, if
+    magnitudes are to be read, get their conversion to apparent ones
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    plan : list of dict
+        Reads, as given by get_read_plan
+    hfiles : dict
+        Open input hdf5 files, with their paths as keys
+    writer : OutputWriter
+        Writer with the output file already open
+    stats : Recorder
+        Instrumentation of the stages
+
+    Returns
+    -------
+    tomag : float
+        Band corrected distance modulus, None if there are no magnitudes
+    """
+    redshift = None
+
+    # Extract redshift, if exist
+    for read in plan:
+        if read['phase'] != 'redshift': continue
+        hf = u.open_hdf5_group(hfiles[read['file']], read['group'])
+        redshift = hf[read['datasets'][0]][()]
+        writer.set_header('redshift', redshift)
+
+    # Check if magnitudes are included
+    calc_mag = any('mag' in s for read in plan if read['phase'] != 'redshift'
+                   for s in read['datasets'])
+    if not calc_mag:
+        return None
+
+    with stats.timer('cosmology'):
+        cosmology = cosmo.get_cosmology(omega0=config['omega0'],
+                                        omegab=config['omegab'],
+                                        lambda0=config['lambda0'],
+                                        h0=config['h0'],
+                                        universe="Flat",include_radiation=False,
+                                        cache_dir=u.get_cache_dir())
+        redshift = max(redshift, 0.1) # To avoid no correction
+        tomag = cosmology.band_corrected_distance_modulus(redshift)
+        DL = cosmology.luminosity_distance(redshift)
+    writer.set_header('luminosity_distance_Mpch', DL)
+    return tomag
+
+
+def _write_block(plan, hfiles, start, stop, put, stats, derived=(),
+                 dtypes={}, index_format='int64', index_runs=None,
+                 verbose=False):
+    """
+    Select and derive the properties of a block of input rows
+
+    Parameters
+    ----------
+    plan : list of dict
+        Reads, as given by get_read_plan
+    hfiles : dict
+        Open input hdf5 files, with their paths as keys
+    start : integer
+        First row of the block
+    stop : integer
+        Last row (exclusive) of the block
+    put : function
+        Writer method storing a dataset: put(name, data, units=units, group=group)
+    stats : Recorder
+        Instrumentation of the stages
+    derived : list of DerivedColumn
+        Properties derived from the input datasets
+    dtypes : dict
+        Output data types, with the dataset names as keys
+    index_format : string
+        Format of the indexes of the selected galaxies, see generate_input_file
+    index_runs : list
+        For index_format 'runs', list collecting the runs of each block
+    verbose : bool
+        Enable verbose output
+    """
+    # Datasets needed by derived columns and those replaced by them
+    needed = set(name for col in derived for name in col.inputs)
+    dropped = set(name for col in derived for name in col.drop)
+    columns = {}
 
     # Make the selection, if relevant
-    nomask = False; mask = None
-    selection = config['selection']
-    if selection is None:
+    nomask = False; sel = None
+    selection = [read for read in plan if read['phase'] == 'selection']
+    if not selection:
         nomask = True
+        nsel = stop - start
     else:
-        for ifile, props  in selection.items():
-            if except_file is not None and ifile == config['except_file']:
-                filename = except_path+ifile
-            else:
-                filename = path+ifile
-            group = props['group']
-            datasets = props['datasets']
-            lowl = props['low_limits']
-            highl = props['high_limits']
-            units = props['units']
+        for read in selection:
+            datasets = read['datasets']
+            hf = u.open_hdf5_group(hfiles[read['file']], read['group'])
 
-            with h5py.File(filename, 'r') as hdf_file:
-                hf = u.open_hdf5_group(hdf_file, group)
+            # Read datasets and generate conditions
+            with stats.timer('selection_read'):
+                alldata = u.Columns.from_hdf5(hf, datasets, start, stop)
+            stats.add('selection_read', bytes_read=alldata.nbytes,
+                      rows=stop - start)
 
-                # Read datasets and generate conditions
-                for ii, dataset in enumerate(datasets):
-                    if ii == 0:
-                        alldata = hf[dataset][:].reshape(1, -1)
-                    else:
-                        alldata = np.vstack((alldata,hf[dataset][:]))
-
-            # Build combined mask
-            mask = u.combined_mask(alldata,lowl,highl,verbose=verbose)
-            if mask is None:
+            # Build combined selection
+            with stats.timer('combined_mask'):
+                sel = u.combined_selection(alldata, read['low_limits'],
+                                            read['high_limits'], offset=start,
+                                            verbose=verbose)
+            if sel is None:
                 if verbose:
-                    print(f' * No adequate data in {ifile}, continuing')
+                    print(f' * No adequate data in {read["file"]}, continuing')
                 continue
             else:
                 # Generate galaxy indexes from the original dataset
-                with h5py.File(outfile, 'a') as outf:
-                    ids = outf['data'].create_dataset('gal_index', data=mask)
-                    ids.attrs['units'] = 'Index in original file'
-
-                # Write the properties in the output file
-                for ii in range(np.shape(alldata)[0]):
-                    vals = alldata[ii][mask]
-                    with h5py.File(outfile, 'a') as outf:
-                        dd = outf['data'].create_dataset(datasets[ii], data=vals)
-                        dd.attrs['units'] = units[ii]
-
-    # Metallicity variables
-    mcold_disc = config['mcold_disc']
-    mcold_z_disc = config['mcold_z_disc']
-    mcold_burst = config['mcold_burst']
-    mcold_z_burst = config['mcold_z_burst']
-
-    # Stellar mass variables
-    mstars_burst = config.get('mstars_burst', 'mstars_burst')
-    mstars_burst_diskinstabilities = config.get('mstars_burst_diskinstabilities', 'mstars_burst_diskinstabilities')
-    mstars_burst_mergers = config.get('mstars_burst_mergers', 'mstars_burst_mergers')
+                _put_gal_index(put, sel, index_format, index_runs=index_runs)
 
-    # Extract redshift, if exist
-    if "file_redshift" in config:
-        file_redshift = config['file_redshift']
-        zfile = file_redshift['file']
-        zgroup = file_redshift['group']
-        zdataset = file_redshift['dataset']
-        with h5py.File(path+zfile, 'r') as hdf_file:
-            hf = u.open_hdf5_group(hdf_file, zgroup)
-            zz = hf[zdataset][()]
-        with h5py.File(outfile, 'a') as outf:
-            outf['header'].attrs['redshift'] = zz
-
-
-    # Loop over files with information
-    count_props = -1
-    file_props = config['file_props']
-    redshift = None; tomag = None
-    for ifile, props  in file_props.items():
-        if except_file is not None and ifile == config['except_file']:
-            filename = except_path+ifile
-        else:
-            filename = path+ifile
-        group = props['group']
-        datasets = props['datasets']
-
-        # Check if metallicities need to be calculated
-        calc_Zdisc = set([mcold_disc,mcold_z_disc]).issubset(datasets)
-        if calc_Zdisc:
-            Zdisc = np.ones(len(mask), dtype=float)
-
-        calc_Zbst  = set([mcold_burst,mcold_z_burst]).issubset(datasets)
-        if calc_Zbst:
-            Zbst = np.ones(len(mask), dtype=float)
-
-        # Check if mstar_burst need to be calculated
-        calc_MStarBurst = not mstars_burst in datasets
-        calc_MStarBurst = calc_MStarBurst and set([mstars_burst_diskinstabilities, mstars_burst_mergers]).issubset(datasets)
-        if calc_MStarBurst:
-            MStarBurst = np.zeros(len(mask), dtype=float)
-
-        # Check if magnitudes are included
-        calc_mag = any('mag' in s for s in datasets)
-        if calc_mag and tomag is None:
-            cosmo.set_cosmology(omega0=config['omega0'],
-                                omegab=config['omegab'],
-                                lambda0=config['lambda0'],
-                                h0=config['h0'],
-                                universe="Flat",include_radiation=False)
-            if redshift is None:
-                # Find file with redshift 
-                for check_file, check_props in file_props.items():
-                    if 'redshift' in check_props['datasets']:
-                        if except_file is not None and check_file == config['except_file']:
-                            zfilename = except_path + check_file
-                        else:
-                            zfilename = path + check_file
-                        with h5py.File(zfilename, 'r') as hdf_zfile:
-                            zhf = u.open_hdf5_group(hdf_zfile, group)
-                            # Read redshift
-                            redshift = zhf['redshift'][()]
-                            break
-                redshift = max(redshift, 0.1) # To avoid no correction
-                tomag = cosmo.band_corrected_distance_modulus(redshift)
-                DL = cosmo.luminosity_distance(redshift)
-                with h5py.File(outfile, 'a') as outf:
-                    outf['header'].attrs['luminosity_distance_Mpch'] = DL
-
-        # Check if luminosities are included
-        L_nom = []; L_ext_nom = [] ; ratio_nom = []
-        calc_ratios = any(config['line_prefix'] in s for s in datasets)
-        if calc_ratios:
-            nl = 0;
-            for line in config['lines']:
-                nom = f"{config['line_prefix']}{line}"
-                enom = f"{config['line_prefix']}{line}{config['line_suffix_ext']}"
-                if (nom in datasets) and (enom in datasets):
-                    L_nom.append(nom); L_ext_nom.append(enom)
-                    ratio_nom.append(f"ratio_{line}")
-                    nl += 1
-            if (nl>0):
-                ratios = np.ones((nl,len(mask)), dtype=float)
-            else:
-                calc_ratios = False
-        
-        if verbose: print(f'  - Reading {filename} (extra calcs:',
-                          f'{calc_Zdisc}, {calc_Zbst}, {calc_mag}, {calc_ratios})')
-        
-        # Read data in each file    
-        with h5py.File(filename, 'r') as hdf_file:
-            hf = u.open_hdf5_group(hdf_file, group)
-                
-            # Extract properties
-            for ii,prop in enumerate(datasets):
-                if prop=='redshift':
-                    zz = hf[prop]
-                    with h5py.File(outfile, 'a') as outf:
-                        outf['header'].attrs['redshift'] = zz
+                # Selected values, read only once
+                for ii, dataset in enumerate(datasets):
+                    vals = sel.apply(alldata[ii])
+                    if dataset in needed:
+                        columns[dataset] = vals
+                    if dataset not in dropped:
+                        put(dataset, vals, units=read['units'][ii])
+        if sel is None:
+            return
+
+        nsel = len(sel)
+    stats.count(rows_selected=nsel)
+
+    # Read the properties not read for the selection
+    for read in plan:
+        if read['phase'] != 'props': continue
+        hdf_file = hfiles[read['file']]
+        stage = 'read:' + os.path.basename(read['file'])
+        if verbose: print(f'  - Reading {hdf_file.filename}')
+        hf = u.open_hdf5_group(hdf_file, read['group'])
+
+        for prop, units in zip(read['datasets'], read['units']):
+            # Cast as read, unless needed at input precision
+            dtype = None if prop in needed else dtypes.get(prop)
+            with stats.timer(stage):
+                if nomask:
+                    vals = u.Columns.from_hdf5(hf, [prop], start, stop,
+                                               dtypes=[dtype])[0]
                 else:
-                    count_props += 1
-                    vals = None
-                    vals = hf[prop][:]
-                    if not nomask:
-                        vals = vals[mask]
-                    if vals is None: continue
-
-                    if calc_MStarBurst and (prop in [mstars_burst_diskinstabilities, mstars_burst_mergers]):
-                        MStarBurst += vals
-
-                    if calc_Zdisc and (prop==mcold_disc or prop==mcold_z_disc):
-                        if prop==mcold_disc:
-                            Zdisc[vals<=0.] = 0.
-                            Zdisc[vals>0.] /= vals[vals>0.]
-                        else:
-                            Zdisc *= vals
-                    elif calc_Zbst and (prop==mcold_burst or prop==mcold_z_burst):
-                        if prop==mcold_burst:
-                            Zbst[vals<=0.] = 0.
-                            Zbst[vals>0.] /= vals[vals>0.]
-                        else:
-                            Zbst *= vals
-                    
-                    if(prop!=mcold_z_disc and prop!=mcold_z_burst and prop not in L_ext_nom):
-                        with h5py.File(outfile, 'a') as outf:
-                            if 'mag' in prop:
-                                vals += tomag
-                                if verbose:
-                                    print(f'- Converting {prop} into an apparent mag')
-                            dd = outf['data'].create_dataset(prop, data=vals)
-                            dd.attrs['units'] = props['units'][ii]
-                    
-                    if calc_ratios and (prop in L_nom or prop in L_ext_nom):
-                        if prop in L_nom:
-                            il = L_nom.index(prop)
-                            ratios[il, vals <= 0.] = notnum
-                            ratios[il,vals>0.] /= vals[vals>0.]
-                        else:
-                            il = L_ext_nom.index(prop)
-                            ratios[il,:] *= vals
-
-        # Write out metallicities, if required
-        if calc_Zdisc:
-            with h5py.File(outfile, 'a') as outf:
-                dd = outf['data'].create_dataset('Zgas_disc', data=Zdisc)
-                dd.attrs['units'] = 'M_Z/M'
-        if calc_Zbst:
-            with h5py.File(outfile, 'a') as outf:
-                dd = outf['data'].create_dataset('Zgas_bst', data=Zbst)
-                dd.attrs['units'] = 'M_Z/M'
-
-        # Write stellar mass, if required
-        if calc_MStarBurst:
-            with h5py.File(outfile, 'a') as outf:
-                dd = outf['data'].create_dataset(mstars_burst, data=MStarBurst)
-                dd.attrs['units'] = 'Msun/h'
-        
-        # Write luminosity ratios, if required
-        if calc_ratios:
-            with h5py.File(outfile, 'a') as outf:
-                for il, nom in enumerate(ratio_nom):
-                    dd = outf['data'].create_dataset(nom, data=ratios[il,:])
-                    dd.attrs['units'] = 'L_ext/L (dimensionless)'
-                    
-    print(f' * Generated file: {outfile}')
-    return True
\ No newline at end of file
+                    vals = sel.read(hf[prop], dtype=dtype)
+            stats.add(stage, bytes_read=vals.nbytes)
+
+            if prop in needed:
+                columns[prop] = vals
+            if prop not in dropped:
+                put(prop, vals, units=units)
+
+    # Derived properties, with kernels evaluated once per block
+    for col in derived:
+        with stats.timer('derived'):
+            vals = col.evaluate(columns)
+        put(col.name, vals, units=col.units)
+    return
+
+
+def _put_gal_index(put, selection, index_format, index_runs=None):
+    """
+    Write the indexes of the selected galaxies in the original files
+
+    Parameters
+    ----------
+    put : function
+        Writer method storing a dataset: put(name, data, units=units, group=group)
+    selection : Selection
+        Selected galaxies
+    index_format : string
+        'int64', 'int32' or 'runs'
+    index_runs : list
+        For 'runs', list collecting the runs of each block, written
+        by _put_index_runs once a run split between blocks can be merged
+    """
+    if index_format == 'runs':
+        index_runs.append(selection.runs())
+    else:
+        put('gal_index', selection.indexes(dtype=index_format),
+            units='Index in original file')
+
+
+def _put_index_runs(put, runs):
+    """
+    Write the contiguous runs of selected galaxies into the index group
+
+    Parameters
+    ----------
+    put : function
+        Writer method storing a dataset: put(name, data, units=units, group=group)
+    runs : numpy array (R,2)
+        Start and stop (exclusive) of each run in the original files
+    """
+    units = 'Index in original file'
+    put('gal_index_start', runs[:, 0], units=units, group='index')
+    put('gal_index_stop', runs[:, 1], units=units+' (exclusive)',
+        group='index')
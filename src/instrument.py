@@ -0,0 +1,75 @@
+"""
+Instrumentation of the stages processing a subvolume:
+wall time, bytes read and written, hdf5 opens and rows
+"""
+import json
+import time
+from contextlib import contextmanager
+
+class Recorder:
+    """
+    Accumulate wall times and counters per stage.
+    Timers can be nested, the time of a stage excluding
+    that of the stages timed within it.
+
+    Examples
+    --------
+    >>> stats = Recorder()
+    >>> with stats.timer('read:galaxies.hdf5'):
+    ...     vals = hf['mcold'][:]
+    >>> stats.add('read:galaxies.hdf5', bytes_read=vals.nbytes)
+    >>> stats.dump('gne_input_stats.json')
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self._nested = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        self._nested.append(0.)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            self.add(stage, time_s=elapsed - nested, calls=1)
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def add(self, stage, **counters):
+        """
+        Add counters (time_s, bytes_read, bytes_written, opens, rows...)
+        to a stage
+        """
+        entry = self.stages.setdefault(stage, {})
+        for key, val in counters.items():
+            entry[key] = entry.get(key, 0) + val
+
+    def count(self, **counters):
+        """
+        Add counters for the whole subvolume
+        """
+        for key, val in counters.items():
+            self.counts[key] = self.counts.get(key, 0) + val
+
+    def to_dict(self, **info):
+        """
+        Statistics as a dictionary, with totals over stages
+        and the extra information given as keywords
+        """
+        totals = {'time_s': time.perf_counter() - self._start}
+        for entry in self.stages.values():
+            for key in ['bytes_read', 'bytes_written', 'opens']:
+                if key in entry:
+                    totals[key] = totals.get(key, 0) + entry[key]
+        return {**info, **self.counts, 'totals': totals, 'stages': self.stages}
+
+    def dump(self, jsonfile, **info):
+        """
+        Write the statistics into a json file
+        """
+        with open(jsonfile, 'w') as f:
+            json.dump(self.to_dict(**info), f, indent=1)
@@ -0,0 +1,351 @@
+"""
+Packing of subvolumes into jobs of a target runtime, with the cost
+of each subvolume estimated from recorded timings or input sizes,
+and resubmission of the subvolumes still missing
+"""
+import os
+import json
+
+from src.config import get_config
+from src.read_plan import get_input_bytes
+from src.catalogue import get_subvolume_bytes
+from src.manifest import read_manifest
+from src.slurm_utils import generate_job_name, get_job_names, get_subvol_groups
+
+# Throughput assumed without recorded timings, in input MB/s
+default_MB_per_s = 20.
+
+def get_recorded_time(config, ivol):
+    """
+    Wall time and input bytes of the last generation of a subvolume,
+    from its gne_input_stats.json
+
+    Returns
+    -------
+    time_s : float
+        None if there are no recorded timings
+    nbytes : integer
+        Size of the input files, as given by get_input_bytes,
+        0 if not recorded
+    """
+    statsfile = config['outroot'] + str(ivol) + '/gne_input_stats.json'
+    try:
+        with open(statsfile) as f:
+            stats = json.load(f)
+        return stats['totals']['time_s'], stats.get('input_bytes', 0)
+    except (OSError, ValueError, KeyError):
+        return None, 0
+
+
+def get_subvol_costs(config, subvols, sizes=None):
+    """
+    Estimated runtime of each subvolume: its recorded time if it has
+    been processed before, otherwise the size of its input files over
+    the throughput of the recorded subvolumes, measured on the same
+    file sizes (default_MB_per_s if none)
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    subvols : list of integers
+        List of subvolumes
+    sizes : dict
+        Input bytes of each subvolume, for example from
+        src.catalogue.get_subvolume_bytes. By default, from the files.
+
+    Returns
+    -------
+    costs : dict
+        Estimated seconds, with the subvolumes as keys
+    """
+    costs = {}; unknown = []
+    total_time = 0.; total_bytes = 0
+    for ivol in subvols:
+        time_s, nbytes = get_recorded_time(config, ivol)
+        if time_s is None:
+            unknown.append(ivol)
+            continue
+        costs[ivol] = time_s
+        if nbytes > 0:
+            total_time += time_s; total_bytes += nbytes
+
+    rate = default_MB_per_s*1e6
+    if total_time > 0:
+        rate = total_bytes/total_time
+    for ivol in unknown:
+        if sizes is not None and ivol in sizes:
+            nbytes = sizes[ivol]
+        else:
+            nbytes = get_input_bytes(config, ivol)
+        costs[ivol] = nbytes/rate
+    return costs
+
+
+def get_job_time(costs, workers=1):
+    """
+    Estimated runtime of a job processing subvolumes in a pool of
+    worker processes: the total divided among the workers, or the
+    longest subvolume if this takes longer
+
+    Parameters
+    ----------
+    costs : list of floats
+        Estimated seconds of each subvolume
+    workers : integer
+        Number of worker processes of the job
+
+    Returns
+    -------
+    time_s : float
+    """
+    if len(costs) < 1:
+        return 0.
+    return max(max(costs), sum(costs)/max(workers, 1))
+
+
+def pack_subvols(subvols, costs, target_time, workers=1):
+    """
+    Split a list of subvolumes into consecutive groups with an
+    estimated runtime of at most target_time (next fit), a group
+    having a single subvolume if it is longer than that
+
+    Parameters
+    ----------
+    subvols : list of integers
+        List of subvolumes, in the order to be kept
+    costs : dict
+        Estimated seconds, with the subvolumes as keys
+    target_time : float
+        Target runtime of each group, in seconds
+    workers : integer
+        Number of worker processes of each job, see get_job_time
+
+    Returns
+    -------
+    groups : list of lists of integers
+    """
+    groups = []; current = []
+    for ivol in subvols:
+        group_costs = [costs[i] for i in current] + [costs[ivol]]
+        if current and get_job_time(group_costs, workers) > target_time:
+            groups.append(current)
+            current = []
+        current.append(ivol)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def plan_jobs(simulations, target_time, workers=1, catalogue=None,
+              laptop=False, verbose=True):
+    """
+    Pack the subvolumes of each simulation snapshot into jobs
+    of about a target runtime
+
+    Parameters
+    ----------
+    simulations : list of tuples
+        (sim, snaps, subvols) for each simulation, as in generate_input_slurm.py
+    target_time : float
+        Target runtime of each job, in seconds
+    workers : integer
+        Number of worker processes of each job, as the CPUs per task
+        given by src.slurm_utils.get_cpus_per_task
+    catalogue : string
+        If given, SQLite catalogue built by src.catalogue.build_catalogue
+        to get the input sizes from
+    laptop : bool
+        If True, use local test configuration
+    verbose : bool
+        If True, print the estimated runtime of each job
+
+    Returns
+    -------
+    jobs : list of tuples
+        (sim, [snap], subvols) for each job, to be passed to
+        the functions in src.slurm_utils as a list of simulations
+    """
+    jobs = []
+    for sim, snaps, subvols in simulations:
+        for snap in snaps:
+            config = get_config(sim, snap, subvols, laptop=laptop)
+            sizes = None
+            if catalogue is not None:
+                sizes = get_subvolume_bytes(catalogue, sim, snap)
+            costs = get_subvol_costs(config, subvols, sizes=sizes)
+            for group in pack_subvols(subvols, costs, target_time,
+                                      workers=workers):
+                jobs.append((sim, [snap], group))
+                if verbose:
+                    hours = get_job_time([costs[ivol] for ivol in group],
+                                         workers)/3600.
+                    print(f' * {sim} iz{snap}: subvolumes {group[0]}-{group[-1]}',
+                          f'({len(group)}), {hours:.2f} h estimated')
+    return jobs
+
+
+def save_plan(jobs, planfile):
+    """
+    Write a list of jobs, as returned by plan_jobs, into a json file,
+    to check or clean the same jobs once they have run
+    """
+    outdir = os.path.dirname(planfile)
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+    with open(planfile, 'w') as f:
+        json.dump([list(job) for job in jobs], f, indent=1)
+
+
+def load_plan(planfile):
+    """
+    Read a list of jobs written by save_plan
+
+    Returns
+    -------
+    jobs : list of tuples
+        (sim, [snap], subvols) for each job
+    """
+    with open(planfile) as f:
+        return [tuple(job) for job in json.load(f)]
+
+
+def get_missing_subvols(config, subvols):
+    """
+    Subvolumes without a complete output file, that is
+    without a manifest in its header
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    subvols : list of integers
+        List of subvolumes
+
+    Returns
+    -------
+    missing : list of integers
+    """
+    return [ivol for ivol in subvols if read_manifest(
+        config['outroot'] + str(ivol) + '/gne_input.hdf5') is None]
+
+
+def get_missing_units(simulations, results=None, queued=None,
+                      group_size=None, laptop=False, verbose=True):
+    """
+    Subvolumes of a set of jobs without a complete output file,
+    as given by get_missing_subvols, leaving out those of the jobs
+    still running, whose output files are being written
+
+    Parameters
+    ----------
+    simulations : list of tuples
+        (sim, snaps, subvols) for each job, as passed to check_all_jobs
+    results : dict
+        Job status, as returned by check_all_jobs. The output files
+        of successful jobs (or array tasks) are not checked.
+    queued : set of strings
+        Names of the jobs in the SLURM queue, as returned by
+        src.slurm_utils.get_queued_jobs, whose output files are not
+        checked. If None and results are given, the incomplete jobs,
+        which could be still running, are not checked.
+    group_size : integer
+        Number of subvolumes per task, if submitted as job arrays
+    laptop : bool
+        If True, use local test configuration
+    verbose : bool
+        If True, print the number of missing subvolumes per snapshot
+
+    Returns
+    -------
+    units : list of tuples
+        (sim, snap, ivol) still to be generated
+    """
+    skip = set()
+    if results is not None:
+        skip = set(results['success'])
+        if queued is None:
+            skip.update(results['incomplete'])
+            if verbose and results['incomplete']:
+                print(f'WARNING: {len(results["incomplete"])} incomplete jobs',
+                      'not resubmitted, as they could be still running.')
+
+    units = []
+    for sim, snaps, subvols in simulations:
+        if group_size is None:
+            groups = [subvols]
+        else:
+            groups = get_subvol_groups(subvols, group_size)
+        for snap in snaps:
+            if (queued is not None and
+                    generate_job_name(sim, snap, subvols) in queued):
+                continue # Still pending or running
+            job_names = get_job_names(sim, snap, subvols, group_size=group_size)
+            tocheck = [ivol for job_name, group in zip(job_names, groups)
+                       if job_name not in skip for ivol in group]
+            if not tocheck: continue
+
+            config = get_config(sim, snap, subvols, laptop=laptop)
+            missing = get_missing_subvols(config, tocheck)
+            units.extend((sim, snap, ivol) for ivol in missing)
+            if verbose and missing:
+                print(f' * {sim} iz{snap}: {len(missing)} subvolumes missing')
+    return units
+
+
+def get_running_jobs(simulations, results=None, queued=None, group_size=None):
+    """
+    Jobs left out by get_missing_units as possibly still running:
+    those in the SLURM queue or, if this is unknown, those with
+    incomplete jobs or array tasks
+
+    Parameters
+    ----------
+    simulations : list of tuples
+        (sim, snaps, subvols) for each job, as passed to check_all_jobs
+    results : dict
+        Job status, as returned by check_all_jobs
+    queued : set of strings
+        Names of the jobs in the SLURM queue, as returned by
+        src.slurm_utils.get_queued_jobs
+    group_size : integer
+        Number of subvolumes per task, if submitted as job arrays
+
+    Returns
+    -------
+    jobs : list of tuples
+        (sim, [snap], subvols) for each job, to be kept in a plan
+        together with the resubmitted ones
+    """
+    incomplete = set()
+    if queued is None and results is not None:
+        incomplete = set(results['incomplete'])
+
+    jobs = []
+    for sim, snaps, subvols in simulations:
+        for snap in snaps:
+            if queued is not None:
+                running = generate_job_name(sim, snap, subvols) in queued
+            else:
+                running = not incomplete.isdisjoint(
+                    get_job_names(sim, snap, subvols, group_size=group_size))
+            if running:
+                jobs.append((sim, [snap], subvols))
+    return jobs
+
+
+def group_units(units):
+    """
+    Group (sim, snap, ivol) units into (sim, [snap], subvols) jobs,
+    one per simulation snapshot
+
+    Returns
+    -------
+    jobs : list of tuples
+        (sim, [snap], subvols), to be passed to the functions
+        in src.slurm_utils as a list of simulations
+    """
+    jobs = {}
+    for sim, snap, ivol in units:
+        jobs.setdefault((sim, snap), []).append(ivol)
+    return [(sim, [snap], subvols) for (sim, snap), subvols in jobs.items()]
@@ -0,0 +1,139 @@
+"""
+Manifest of the inputs, configuration and code generating an output
+file, stored in its header to regenerate only outdated subvolumes
+"""
+import os
+import json
+import hashlib
+from functools import lru_cache
+
+import h5py
+
+from src.read_plan import get_read_plan, get_plan_files
+
+# Modules determining the content of the output files
+code_modules = ['generate_input.py', 'derived.py', 'read_plan.py',
+                'utils.py', 'cosmology.py']
+
+@lru_cache(maxsize=None)
+def get_code_version():
+    """
+    Hash of the modules generating the output files
+
+    Returns
+    -------
+    version : string
+        Hexadecimal sha256 digest (16 characters)
+    """
+    sha = hashlib.sha256()
+    srcdir = os.path.dirname(os.path.abspath(__file__))
+    for module in code_modules:
+        with open(os.path.join(srcdir, module), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+
+def get_config_hash(config, **options):
+    """
+    Hash of a configuration and the options generating an output file
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    **options :
+        Other arguments changing the output, such as index_format
+
+    Returns
+    -------
+    confighash : string
+        Hexadecimal sha256 digest (16 characters)
+    """
+    text = json.dumps({'config': config, 'options': options},
+                      sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def get_manifest(config, ivol, **options):
+    """
+    Manifest of the output file of a subvolume: size and modification
+    time of its input files, configuration hash and code version
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+    **options :
+        Other arguments changing the output, such as index_format
+
+    Returns
+    -------
+    manifest : dict
+        None if an input file is missing
+    """
+    inputs = {}
+    for infile in get_plan_files(get_read_plan(config, ivol)):
+        try:
+            stat = os.stat(infile)
+        except OSError:
+            return None
+        inputs[infile] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return {'inputs': inputs,
+            'config_hash': get_config_hash(config, **options),
+            'code_version': get_code_version()}
+
+
+def read_manifest(outfile):
+    """
+    Manifest stored in the header of an output file
+
+    Returns
+    -------
+    manifest : dict
+        None if the file or its manifest do not exist
+    """
+    if not os.path.isfile(outfile):
+        return None
+    try:
+        with h5py.File(outfile, 'r') as hf:
+            text = hf['header'].attrs.get('manifest')
+    except (OSError, KeyError):
+        return None
+    if text is None:
+        return None
+    return json.loads(text)
+
+
+def is_up_to_date(config, ivol, verbose=False, **options):
+    """
+    Check if the output file of a subvolume was generated, completely,
+    from the current input files, configuration and code
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+    verbose : bool
+        If True, print the reason for the output to be outdated
+    **options :
+        Other arguments changing the output, such as index_format
+
+    Returns
+    -------
+    bool
+        True if the stored manifest matches the current one
+    """
+    outfile = config['outroot'] + str(ivol) + '/gne_input.hdf5'
+    stored = read_manifest(outfile)
+    if stored is None:
+        if verbose: print(f' * No complete output for subvolume {ivol}')
+        return False
+    current = get_manifest(config, ivol, **options)
+    if current is None or stored != current:
+        if verbose: print(f' * Outdated output for subvolume {ivol}')
+        return False
+    return True
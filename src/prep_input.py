@@ -1,3 +1,6 @@
+from functools import partial
+
+import src.utils as u
 from src.config import get_config
 from src.validate import validate_hdf5_file
 from src.generate_input import generate_input_file
@@ -5,7 +8,8 @@ from src.generate_test_files import generate_test_files
 
 def prep_input(sim,snap,subvols,laptop=False,percentage=10,subfiles=2,
                validate_files=True,generate_files=False,
-               generate_testing_files=False,verbose=False):
+               generate_testing_files=False,chunk_size=None,workers=None,
+               index_format=None,force=False,verbose=False):
     '''
     Validate input files and generate input for 
     generate_nebular_emission from hdf5 files 
@@ -30,6 +34,18 @@ def prep_input(sim,snap,subvols,laptop=False,percentage=10,subfiles=2,
         True to generate input for generate_nebular_emission
     generate_testing_files : bool
         True to generate reduced input for testing
+    chunk_size : int
+        If given, number of input rows processed at once per subvolume
+    workers : int
+        Number of processes working on different subvolumes,
+        by default SLURM_CPUS_PER_TASK if defined, otherwise 1
+    index_format : str
+        Format of the indexes of the selected galaxies,
+        'int64', 'int32' or 'runs', by default as in the output schema
+    force : bool
+        If True, generate again the files of all the subvolumes.
+        By default, those up to date with the input files,
+        configuration and code are skipped.
     verbose : bool
         If True, print further messages
     ''' 
@@ -39,20 +55,23 @@ def prep_input(sim,snap,subvols,laptop=False,percentage=10,subfiles=2,
 
     # Get the configuration
     config = get_config(sim,snap,subvols,laptop=laptop,verbose=verbose)
+    nworkers = u.get_nworkers(workers)
     
     # Validate that files have the expected structure
     if validate_files:
         count_failures = 0
-        for ivol in subvols:
-            success = validate_hdf5_file(config, snap, ivol, verbose=verbose)
+        func = partial(validate_hdf5_file, config, snap, verbose=verbose)
+        for success in u.map_subvols(func, subvols, workers=nworkers):
             if not success: count_failures += 1
         if count_failures<1: print(f'SUCCESS: All {len(subvols)} subvolumes have valid hdf5 files.')
             
     # Generate input data for generate_nebular_emission
     if generate_files:
         count_failures = 0
-        for ivol in subvols:
-            success = generate_input_file(config, ivol, verbose=verbose)
+        func = partial(generate_input_file, config, verbose=verbose,
+                       chunk_size=chunk_size, index_format=index_format,
+                       force=force)
+        for success in u.map_subvols(func, subvols, workers=nworkers):
             if not success: count_failures += 1
         if count_failures<1: print(f'SUCCESS: All {len(subvols)} hdf5 files have been generated.')
     
@@ -0,0 +1,164 @@
+"""
+Plan of the reads needed to process a subvolume, so that each
+input file is opened once and each dataset is read once
+"""
+import os
+import h5py
+
+import src.utils as u
+
+def get_input_files(config, ivol):
+    """
+    Paths to the input files of a subvolume
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+
+    Returns
+    -------
+    infiles : dict
+        Full path of each input file, with the file names
+        used in the configuration as keys
+    """
+    path = u.get_path(config['root'], ivol, ending=config.get('ending'))
+    except_file = config.get('except_file')
+
+    allfiles = list(config['file_props'])
+    if config['selection'] is not None:
+        allfiles = list(config['selection']) + allfiles
+
+    infiles = {}
+    for ifile in allfiles:
+        if except_file is not None and ifile == except_file:
+            infiles[ifile] = u.get_path(config['root'], ivol) + ifile
+        else:
+            infiles[ifile] = path + ifile
+    if 'file_redshift' in config:
+        # The redshift file is always within the subvolume path
+        zfile = config['file_redshift']['file']
+        infiles['file_redshift'] = path + zfile
+    return infiles
+
+
+def get_input_bytes(config, ivol):
+    """
+    Size in bytes of the existing input files of a subvolume,
+    counting once the files with several names
+    """
+    nbytes = 0
+    for infile in set(get_input_files(config, ivol).values()):
+        if os.path.exists(infile):
+            nbytes += os.path.getsize(infile)
+    return nbytes
+
+
+def get_read_plan(config, ivol):
+    """
+    Ordered reads to process a subvolume: the redshift, the selection
+    datasets and then the properties not already read for the selection
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties,
+        as given by src.config.get_config
+    ivol : integer
+        Number of subvolume
+
+    Returns
+    -------
+    plan : list of dict
+        Reads, each with the 'file' (full path), 'group', 'datasets'
+        and 'units' to be read and the 'phase' they belong to:
+        'redshift', 'selection' or 'props'. Selection reads also have
+        the 'low_limits' and 'high_limits' of the datasets.
+    """
+    infiles = get_input_files(config, ivol)
+    plan = []; planned = set()
+
+    def add_read(filename, group, phase, **lists):
+        keep = [ii for ii, ds in enumerate(lists['datasets'])
+                if (filename, group, ds) not in planned]
+        if not keep:
+            return
+        read = {'file': filename, 'group': group, 'phase': phase}
+        for key, vals in lists.items():
+            read[key] = [vals[ii] for ii in keep]
+        planned.update((filename, group, ds) for ds in read['datasets'])
+        plan.append(read)
+
+    # Redshift, from its own group and from the first file with properties
+    if 'file_redshift' in config:
+        zprops = config['file_redshift']
+        add_read(infiles['file_redshift'], zprops['group'], 'redshift',
+                 datasets=[zprops['dataset']], units=[zprops['unit']])
+    for ifile, props in config['file_props'].items():
+        if 'redshift' in props['datasets']:
+            add_read(infiles[ifile], props['group'], 'redshift',
+                     datasets=['redshift'], units=['redshift'])
+            break
+
+    # Selection, with all the datasets of a file read at once
+    selection = config['selection']
+    if selection is not None:
+        for ifile, props in selection.items():
+            add_read(infiles[ifile], props['group'], 'selection',
+                     datasets=props['datasets'], units=props['units'],
+                     low_limits=props['low_limits'],
+                     high_limits=props['high_limits'])
+
+    # Properties, skipping those already read
+    for ifile, props in config['file_props'].items():
+        datasets = [ds for ds in props['datasets'] if ds != 'redshift']
+        units = [unit for ds, unit in zip(props['datasets'], props['units'])
+                 if ds != 'redshift']
+        add_read(infiles[ifile], props['group'], 'props',
+                 datasets=datasets, units=units)
+    return plan
+
+
+def get_plan_files(plan):
+    """
+    Input files of a read plan, in the order they are first needed
+    """
+    return list(dict.fromkeys(read['file'] for read in plan))
+
+
+def get_planned_bytes(plan, hfiles=None):
+    """
+    Bytes of the datasets in a read plan, an upper limit for the
+    bytes read when only some galaxies are selected
+
+    Parameters
+    ----------
+    plan : list of dict
+        Reads, as given by get_read_plan
+    hfiles : dict
+        Open hdf5 files, with their paths as keys.
+        If None, the files are opened here.
+
+    Returns
+    -------
+    nbytes : integer
+        Size of the planned datasets
+    """
+    nbytes = 0
+    for filename in get_plan_files(plan):
+        if hfiles is not None:
+            hdf_file = hfiles[filename]
+        else:
+            hdf_file = h5py.File(filename, 'r')
+        try:
+            for read in plan:
+                if read['file'] != filename: continue
+                hf = u.open_hdf5_group(hdf_file, read['group'])
+                for ds in read['datasets']:
+                    nbytes += hf[ds].nbytes
+        finally:
+            if hfiles is None:
+                hdf_file.close()
+    return nbytes
@@ -1,16 +1,78 @@
 ''' Auxiliary functions for slurm submission '''
 import os,sys
+import re
 import subprocess
 
-def generate_job_name(sim, snap, subvols):
-    """Generate a unique job name based on sim, snap, and subvols."""
+def generate_job_name(sim, snap, subvols, task=None):
+    """
+    Generate a unique job name based on sim, snap, and subvols.
+    For a task of a job array, the name of its output files.
+    """
     # Create a compact subvols representation
     if len(subvols) <= 2:
         subvols_str = '_'.join(map(str, subvols))
     else:
         subvols_str = f'{subvols[0]}-{subvols[-1]}'
     
-    return f'prep_{sim}_iz{snap}_ivols{subvols_str}'
+    job_name = f'prep_{sim}_iz{snap}_ivols{subvols_str}'
+    if task is not None:
+        job_name += f'_{task}'
+    return job_name
+
+
+def get_subvol_groups(subvols, group_size=1):
+    """
+    Split a list of subvolumes into consecutive groups,
+    one per task of a job array
+
+    Parameters
+    ----------
+    subvols : list of integers
+        List of subvolumes
+    group_size : integer
+        Maximum number of subvolumes per group
+
+    Returns
+    -------
+    groups : list of lists of integers
+    """
+    group_size = max(int(group_size), 1)
+    return [list(subvols[i:i+group_size])
+            for i in range(0, len(subvols), group_size)]
+
+
+def add_job_array(script_content, ntasks, max_running=None):
+    """
+    Make a SLURM script a job array of ntasks tasks, with
+    the output and error files of each task ending in _<task>
+
+    Parameters
+    ----------
+    script_content : string
+        SLURM script
+    ntasks : integer
+        Number of tasks, with SLURM_ARRAY_TASK_ID from 0 to ntasks-1
+    max_running : integer
+        Maximum number of tasks running at once, None for no limit
+
+    Returns
+    -------
+    script_content : string
+    """
+    array = f'#SBATCH --array=0-{ntasks-1}'
+    if max_running is not None:
+        array += f'%{max_running}'
+
+    lines = []
+    for line in script_content.split('\n'):
+        if line.startswith('#SBATCH'):
+            if array is not None:
+                lines.append(array)
+                array = None
+            line = re.sub(r'^(#SBATCH\s+(?:--output=|--error=|-o\s+|-e\s+)\S*)(\.out|\.err)',
+                          r'\1_%a\2', line)
+        lines.append(line)
+    return '\n'.join(lines)
 
 
 def get_slurm_template(hpc):
@@ -30,10 +92,30 @@ def get_slurm_template(hpc):
     return slurm_template
 
 
+def get_cpus_per_task(hpc):
+    """
+    CPUs requested per task in the SLURM template of a hpc,
+    the worker processes of each job
+
+    Returns
+    -------
+    cpus : integer
+        1 if the template does not set --cpus-per-task
+    """
+    match = re.search(r'^#SBATCH\s+--cpus-per-task=(\d+)',
+                      get_slurm_template(hpc), flags=re.MULTILINE)
+    if match is None:
+        return 1
+    return int(match.group(1))
+
+
 def create_slurm_script(hpc, sim, snap, subvols,
-                        outdir=None, verbose=True):
+                        outdir=None, verbose=True, group_size=None,
+                        max_running=None):
     """
     Create a SLURM script for a specific hpc/sim/snap/subvols combination.
+    If group_size is given, the script is a job array, each task
+    processing a group of subvolumes selected by SLURM_ARRAY_TASK_ID.
 
     Parameters
     ----------
@@ -47,8 +129,26 @@ def create_slurm_script(hpc, sim, snap, subvols,
         List of subvolumes
     outdir : string
         Name of output directory, if different from output/
+    group_size : integer
+        Number of subvolumes per task of a job array,
+        None for a single job processing all the subvolumes
+    max_running : integer
+        Maximum number of array tasks running at once
+
+    Returns
+    -------
+    script_path : string
+        Path to the SLURM script
+    job_name : string
+        Name of the job, followed by _<task> in the names of
+        the output files of the tasks of a job array
     """
     job_name = generate_job_name(sim, snap, subvols)
+    subvols_str = str(subvols)
+    if group_size is not None:
+        # Subvolumes of each task, expanded by the shell
+        groups = get_subvol_groups(subvols, group_size)
+        subvols_str = f'{groups}[$SLURM_ARRAY_TASK_ID]'
 
     # Read the appropriate template file
     slurm_template = get_slurm_template(hpc)
@@ -58,8 +158,11 @@ def create_slurm_script(hpc, sim, snap, subvols,
     script_content = script_content.replace('JOB_NAME', job_name)
     script_content = script_content.replace('SIM_NAME', sim)
     script_content = script_content.replace('SNAP_NUM', str(snap))
-    script_content = script_content.replace('SUBVOLS_LIST', str(subvols))
+    script_content = script_content.replace('SUBVOLS_LIST', subvols_str)
     script_content = script_content.replace('VERBOSE', str(verbose))
+    if group_size is not None:
+        script_content = add_job_array(script_content, len(groups),
+                                       max_running=max_running)
     
     # Write script to file
     if outdir is None:
@@ -98,6 +201,33 @@ def submit_slurm_job(script_path,job_name):
         return None
 
 
+def get_queued_jobs():
+    """
+    Names of the jobs of the user still in the SLURM queue,
+    pending or running
+
+    Returns
+    -------
+    job_names : set of strings
+        None if squeue is not available
+    """
+    user = os.environ.get('USER')
+    command = ['squeue', '-h', '-o', '%j']
+    if user:
+        command += ['-u', user]
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+    except FileNotFoundError:
+        print('  WARNING: squeue not found, queued jobs unknown')
+        return None
+    if process.returncode != 0:
+        print(f'  WARNING: squeue failed: {stderr.decode("utf-8")}')
+        return None
+    return set(stdout.decode('utf-8').split())
+
+
 def check_job_status(job_name, outdir=None, success_string='SUCCESS', verbose=True):
     """
     Check the status of a completed SLURM job by examining its output files.
@@ -173,9 +303,27 @@ def check_job_status(job_name, outdir=None, success_string='SUCCESS', verbose=Tr
         return 'incomplete', None
 
 
-def check_all_jobs(simulations, outdir=None, success_string='SUCCESS', verbose=True):
+def get_job_names(sim, snap, subvols, group_size=None):
+    """
+    Names of the output files of the job of a snapshot: one for
+    a single job, or one per task for a job array
+
+    Returns
+    -------
+    job_names : list of strings
+    """
+    if group_size is None:
+        return [generate_job_name(sim, snap, subvols)]
+    ntasks = len(get_subvol_groups(subvols, group_size))
+    return [generate_job_name(sim, snap, subvols, task=task)
+            for task in range(ntasks)]
+
+
+def check_all_jobs(simulations, outdir=None, success_string='SUCCESS',
+                   group_size=None, verbose=True):
     """
     Check the status of all jobs for a list of simulations.
+    For job arrays, each task is checked.
 
     Parameters
     ----------
@@ -185,6 +333,8 @@ def check_all_jobs(simulations, outdir=None, success_string='SUCCESS', verbose=T
         Directory containing output files, default is 'output/'
     success_string : string
         String to search for in .out file to confirm success
+    group_size : integer
+        Number of subvolumes per task, if submitted as job arrays
     verbose : bool
         If True, print detailed status messages
 
@@ -192,7 +342,8 @@ def check_all_jobs(simulations, outdir=None, success_string='SUCCESS', verbose=T
     -------
     results : dict
         Dictionary with keys 'success', 'error', 'incomplete', 'not_found',
-        each containing a list of job names in that status
+        each containing a list of job names (or array task names,
+        <job name>_<task>) in that status
     """
     results = {
         'success': [],
@@ -203,11 +354,12 @@ def check_all_jobs(simulations, outdir=None, success_string='SUCCESS', verbose=T
     
     for sim, snaps, subvols in simulations:
         for snap in snaps:
-            job_name = generate_job_name(sim, snap, subvols)
-            status, _ = check_job_status(job_name, outdir=outdir,
-                                         success_string=success_string,
-                                         verbose=verbose)
-            results[status].append(job_name)
+            for job_name in get_job_names(sim, snap, subvols,
+                                          group_size=group_size):
+                status, _ = check_job_status(job_name, outdir=outdir,
+                                             success_string=success_string,
+                                             verbose=verbose)
+                results[status].append(job_name)
     
     # Print summary
     if verbose:
@@ -294,7 +446,8 @@ def clean_job_files(job_name=None, outdir=None, only_show=True, verbose=True):
     return deleted_files
 
 
-def clean_all_jobs(simulations, outdir=None, only_show=True, verbose=True):
+def clean_all_jobs(simulations, outdir=None, only_show=True,
+                   group_size=None, verbose=True):
     """
     Remove .out, .err, and .sh files for all jobs in a simulation list.
 
@@ -307,6 +460,8 @@ def clean_all_jobs(simulations, outdir=None, only_show=True, verbose=True):
     only_show : bool
         If True, only list files that would be deleted without removing them.
         Set to False to actually delete files.
+    group_size : integer
+        Number of subvolumes per task, if submitted as job arrays
     verbose : bool
         If True, print information about deleted files
 
@@ -319,10 +474,14 @@ def clean_all_jobs(simulations, outdir=None, only_show=True, verbose=True):
     
     for sim, snaps, subvols in simulations:
         for snap in snaps:
-            job_name = generate_job_name(sim, snap, subvols)
-            deleted = clean_job_files(job_name, outdir=outdir,
-                                      only_show=only_show, verbose=False)
-            all_deleted.extend(deleted)
+            job_names = [generate_job_name(sim, snap, subvols)]
+            if group_size is not None:
+                job_names += get_job_names(sim, snap, subvols,
+                                           group_size=group_size)
+            for job_name in job_names:
+                deleted = clean_job_files(job_name, outdir=outdir,
+                                          only_show=only_show, verbose=False)
+                all_deleted.extend(deleted)
     
     # Print summary
     if verbose:
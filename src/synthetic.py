@@ -0,0 +1,225 @@
+"""
+Synthetic GALFORM and Shark input files, with the structure expected
+by the configurations, to test and benchmark the code at any size
+"""
+import os
+import h5py
+import numpy as np
+
+import src.utils as u
+from src.config import get_GP20cosma_config, get_SharkSU_config
+
+layouts = ['galform', 'shark']
+
+def get_synthetic_config(layout, path, snap=39, boxside=125.):
+    """
+    Get a configuration for synthetic files, with the datasets of
+    the GALFORM (GP20) or Shark (SU) configurations
+
+    Parameters
+    ----------
+    layout : str
+        Layout of the files, 'galform' or 'shark'
+    path : string
+        Path to the synthetic input and output files
+    snap : integer
+        Snapshot number
+    boxside : float
+        Side of the subvolumes, in Mpc/h
+
+    Returns
+    -------
+    config: dict
+        Configuration dictionary
+    """
+    if layout not in layouts:
+        raise ValueError(f"Layout '{layout}' not supported. Available layouts: {layouts}")
+
+    outroot = os.path.join(path, 'output', 'iz'+str(snap), 'ivol')
+    if layout == 'galform':
+        # iz*/ivol* tree, with lines separated in elgs.hdf5 as for GP20SU
+        config = get_GP20cosma_config(snap, [0])
+        config['root'] = os.path.join(path, 'iz'+str(snap), 'ivol')
+        config['ending'] = None
+        group = 'Output001'
+        config['selection'] = {
+            'galaxies.hdf5': {
+                'group': group,
+                'datasets': ['mhhalo'],
+                'units': ['Msun/h'],
+                'low_limits': [20 * config['mp']],
+                'high_limits': [None]
+            }
+        }
+        file_props = config['file_props']
+        sed = file_props['tosedfit.hdf5']
+        nmag = 2
+        file_props['elgs.hdf5'] = {
+            'group': group,
+            'datasets': sed['datasets'][nmag:],
+            'units': sed['units'][nmag:]
+        }
+        sed['datasets'] = sed['datasets'][:nmag]
+        sed['units'] = sed['units'][:nmag]
+        for props in file_props.values():
+            props['group'] = group
+    else:
+        # Files in <snap>/<ivol>/, redshift in run_info
+        config = get_SharkSU_config(snap, [0])
+        config['root'] = os.path.join(path, str(snap)) + '/'
+
+    config['outroot'] = outroot
+    config['boxside'] = boxside
+    return config
+
+
+def get_synthetic_files(config, ivol):
+    """
+    Get the paths of the input files of a subvolume and the
+    datasets each of them holds
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+
+    Returns
+    -------
+    files: dict
+        Dictionary with the file paths as keys and,
+        as values, dictionaries of groups with their datasets and units
+    """
+    path = u.get_path(config['root'], ivol, ending=config.get('ending'))
+    except_file = config.get('except_file')
+
+    files = {}
+    allprops = [config['file_props']]
+    if config['selection'] is not None:
+        allprops.insert(0, config['selection'])
+    for props in allprops:
+        for ifile, iprops in props.items():
+            if ifile == except_file:
+                infile = u.get_path(config['root'], ivol) + ifile
+            else:
+                infile = path + ifile
+            groups = files.setdefault(infile, {})
+            datasets = groups.setdefault(iprops.get('group'), {})
+            for name, unit in zip(iprops['datasets'], iprops['units']):
+                datasets.setdefault(name, unit)
+
+    # Redshift stored in its own group
+    file_redshift = config.get('file_redshift')
+    if file_redshift is not None:
+        groups = files.setdefault(path + file_redshift['file'], {})
+        datasets = groups.setdefault(file_redshift['group'], {})
+        datasets[file_redshift['dataset']] = file_redshift['unit']
+    return files
+
+
+def synthetic_values(name, unit, ngal, rng, boxside=125.):
+    """
+    Random values for a dataset, guessed from its name and units
+
+    Parameters
+    ----------
+    name : str
+        Name of the dataset
+    unit : str
+        Units of the dataset
+    ngal : integer
+        Number of values
+    rng : numpy.random.Generator
+        Random number generator
+    boxside : float
+        Side of the subvolume, in Mpc/h
+
+    Returns
+    -------
+    vals : numpy array
+        Values of the dataset
+    """
+    if name in ['index', 'id_halo']:
+        return rng.integers(0, 10**9, ngal)
+    if name == 'type':
+        return rng.integers(0, 3, ngal).astype(np.int32)
+    if name in ['mhhalo', 'mvir_hosthalo']:
+        vals = 10**rng.uniform(9., 14., ngal)
+    elif unit == 'Mpc/h':
+        if 'gal' in name or 'position' in name:
+            return rng.uniform(0., boxside, ngal)
+        vals = 10**rng.uniform(-4., -1., ngal)
+    elif unit == 'km/s':
+        return rng.normal(0., 300., ngal)
+    elif unit == 'AB apparent':
+        return rng.uniform(-25., -10., ngal)
+    elif unit.startswith('Msun/h'):
+        vals = 10**rng.uniform(5., 12., ngal)
+    elif unit.startswith('1e40'):
+        vals = 10**rng.uniform(-3., 3., ngal)
+    else:
+        return rng.uniform(0., 1., ngal)
+
+    # Some empty galaxies
+    vals[rng.random(ngal) < 0.05] = 0.
+    return vals
+
+
+def write_synthetic_files(config, ivol, ngal, redshift=0.5,
+                          chunk_size=10**6, seed=None, verbose=False):
+    """
+    Write synthetic input files for a subvolume, as expected by a
+    configuration, filled in chunks so that any size fits in memory
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+    ngal : integer
+        Number of galaxies in the subvolume
+    redshift : float
+        Redshift of the subvolume
+    chunk_size : integer
+        Number of galaxies written at once
+    seed : integer
+        Seed for the random values, by default the subvolume number
+    verbose : bool
+        If True, print further messages
+
+    Returns
+    -------
+    nbytes : integer
+        Size of the written files, in bytes
+    """
+    if seed is None:
+        seed = ivol
+    rng = np.random.default_rng(seed)
+    boxside = config['boxside']
+
+    nbytes = 0
+    for infile, groups in get_synthetic_files(config, ivol).items():
+        os.makedirs(os.path.dirname(infile), exist_ok=True)
+        with h5py.File(infile, 'w') as hf:
+            dsets = {}
+            for group, datasets in groups.items():
+                hg = hf if group is None else hf.require_group(group)
+                for name, unit in datasets.items():
+                    if name == 'redshift':
+                        hg.create_dataset(name, data=redshift)
+                        continue
+                    vals = synthetic_values(name, unit, 1, rng, boxside)
+                    dsets[(group, name)] = (unit, hg.create_dataset(
+                        name, shape=(ngal,), dtype=vals.dtype))
+
+            for start in range(0, ngal, chunk_size):
+                stop = min(start + chunk_size, ngal)
+                for (group, name), (unit, dset) in dsets.items():
+                    dset[start:stop] = synthetic_values(name, unit, stop - start,
+                                                        rng, boxside)
+        nbytes += os.path.getsize(infile)
+        if verbose:
+            print(f' * Synthetic file: {infile}')
+    return nbytes
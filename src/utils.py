@@ -1,5 +1,9 @@
 import sys, os
-from glob import glob
+import json
+import hashlib
+import tempfile
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import h5py
 import numpy as np
 
@@ -30,14 +34,71 @@ def get_path(root, ivol, ending=None):
     return path
 
 
+def get_cache_dir():
+    """
+    Directory for cached tables and metadata, given by the
+    environment variable PREP_GNE_CACHE or, by default,
+    ~/.cache/prep_gne_input
+
+    Returns
+    -------
+    cache_dir : str
+    """
+    cache_dir = os.environ.get('PREP_GNE_CACHE')
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'prep_gne_input')
+    return cache_dir
+
+
+def write_atomic(outfile, write, binary=False):
+    """
+    Write a file through a temporary one that is renamed atomically,
+    so that concurrent jobs never read partial files. Any OSError,
+    such as an unusable directory, leaves the file unwritten.
+
+    Parameters
+    ----------
+    outfile : str
+        Name of the file
+    write : function
+        Writing the content into the open temporary file
+    binary : bool
+        If True, the file is opened in binary mode
+
+    Returns
+    -------
+    written : bool
+        True if the file has been written
+    """
+    outdir = os.path.dirname(outfile) or '.'
+    tmpfile = None
+    try:
+        os.makedirs(outdir, exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(dir=outdir,
+                                       suffix=os.path.splitext(outfile)[1])
+        with os.fdopen(fd, 'wb' if binary else 'w') as ff:
+            write(ff)
+        os.chmod(tmpfile, 0o644) # Readable by others sharing the cache
+        os.replace(tmpfile, outfile)
+    except OSError:
+        if tmpfile is not None:
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
+        return False
+    return True
+
+
 def combined_mask(alldata,low_lim,high_lim,verbose=True):
     '''
     Combine conditions to different datasets into one mask
 
     Parameters
     ----------
-    alldata : numpy array (N,M)
-       Array with N datasets
+    alldata : Columns, list of arrays or numpy array (N,M)
+       N datasets with M values each
     low_lim : list (N,1)
        List with the lower limits for each dataset
     high_lim : list (N,1)
@@ -49,44 +110,313 @@ def combined_mask(alldata,low_lim,high_lim,verbose=True):
     mask : numpy array
        Indexes of those rows passing the combined conditions
     '''
+    combined_cuts = _combined_cuts(alldata,low_lim,high_lim,
+                                   caller='combined_mask',verbose=verbose)
+    if combined_cuts is None or not np.any(combined_cuts):
+        return None
+
+    mask = np.where(combined_cuts)[0]
+    return mask
+
+
+def combined_selection(alldata,low_lim,high_lim,offset=0,kind=None,
+                       verbose=True):
+    '''
+    Combine conditions to different datasets into a compact Selection
+
+    Parameters
+    ----------
+    alldata : Columns, list of arrays or numpy array (N,M)
+       N datasets with M values each
+    low_lim : list (N,1)
+       List with the lower limits for each dataset
+    high_lim : list (N,1)
+       List with the higher limits for each dataset
+    offset : integer
+       Row in the original datasets of the first value
+    kind : string
+       Representation of the selection, 'bitmap', 'index' or 'runs'.
+       By default, the most compact one.
+
+    Returns
+    -------
+    selection : Selection
+       Rows passing the combined conditions, None if there are none
+    '''
+    combined_cuts = _combined_cuts(alldata,low_lim,high_lim,
+                                   caller='combined_selection',verbose=verbose)
+    if combined_cuts is None or not np.any(combined_cuts):
+        return None
+    return Selection(combined_cuts, offset=offset, kind=kind)
+
+
+def _combined_cuts(alldata,low_lim,high_lim,caller='combined_mask',
+                   verbose=True):
+    '''
+    Boolean array with the conditions on each dataset reduced in place,
+    None if the shapes of the data and limits are not consistent
+    '''
     # Check that input shapes are consistent
-    nd = np.shape(alldata)[0]
+    nd = len(alldata)
     if (nd != len(low_lim) or nd != len(high_lim)):
         if verbose:
-            print(f' WARNING (combined_mask): Data, '
-                  f'{np.shape(alldata)}, should be (N,M) and '
+            print(f' WARNING ({caller}): Data, '
+                  f'with {nd} datasets, should be (N,M) and '
                   f'limits (N,1), len(low_lim)={len(low_lim)} and '
                   f'len(high_lim)={len(high_lim)}')
         return None
+    if nd < 1:
+        return None
 
-    # Read each dataset and build individual conditions
-    cuts = []
-    for ii in range(nd):
-        data = alldata[ii][:]
-
-        if low_lim[ii] is not None and high_lim[ii] is not None:
-            cuts.append((data >= low_lim[ii]) & (data <= high_lim[ii]))
-        elif low_lim[ii] is not None:
-            cuts.append(data >= low_lim[ii])
-        elif high_lim[ii] is not None:
-            cuts.append(data <= high_lim[ii])
-        else:
-            cuts.append(np.ones(len(data), dtype=bool))
-    if not cuts:
+    combined_cuts = np.ones(len(alldata[0]), dtype=bool)
+    cut = np.empty(len(alldata[0]), dtype=bool)
+    for ii in range(len(alldata)):
+        data = alldata[ii]
+        if low_lim[ii] is not None:
+            np.greater_equal(data, low_lim[ii], out=cut)
+            combined_cuts &= cut
+        if high_lim[ii] is not None:
+            np.less_equal(data, high_lim[ii], out=cut)
+            combined_cuts &= cut
+    return combined_cuts
+
+
+def get_nworkers(workers=None):
+    """
+    Number of worker processes to be used
+
+    Parameters
+    ----------
+    workers : integer
+       Number of workers. If None, SLURM_CPUS_PER_TASK is used
+       when defined, and 1 otherwise.
+
+    Returns
+    -------
+    nworkers : integer
+    """
+    if workers is None:
+        workers = os.environ.get('SLURM_CPUS_PER_TASK', 1)
+    return max(int(workers), 1)
+
+
+def map_subvols(func, subvols, workers=1):
+    """
+    Apply a function to each subvolume, in a pool of
+    processes if more than one worker is available
+
+    Parameters
+    ----------
+    func : function
+       Function taking the subvolume number as its only argument
+    subvols : list of integers
+       List of subvolumes
+    workers : integer
+       Number of worker processes
+
+    Returns
+    -------
+    results : list
+       Output of func for each subvolume, in the order of subvols
+    """
+    nworkers = min(workers, len(subvols))
+    if nworkers <= 1:
+        return [func(ivol) for ivol in subvols]
+
+    with ProcessPoolExecutor(max_workers=nworkers) as executor:
+        results = list(executor.map(func, subvols))
+    return results
+
+
+def get_runs(indexes):
+    """
+    Group sorted indexes into contiguous runs
+
+    Parameters
+    ----------
+    indexes : numpy array of integers
+       Sorted indexes, as returned by combined_mask
+
+    Returns
+    -------
+    runs : numpy array (R,2)
+       Start and stop (exclusive) of each contiguous run
+    """
+    indexes = np.asarray(indexes)
+    if len(indexes) < 1:
+        return np.empty((0, 2), dtype=np.int64)
+
+    breaks = np.flatnonzero(np.diff(indexes) != 1) + 1
+    starts = indexes[np.r_[0, breaks]]
+    stops = indexes[np.r_[breaks - 1, len(indexes) - 1]] + 1
+    return np.column_stack((starts, stops)).astype(np.int64)
+
+
+def merge_runs(runs):
+    """
+    Join a list of arrays of sorted runs, merging the adjacent ones,
+    as a run split between consecutive blocks of rows
+
+    Parameters
+    ----------
+    runs : list of numpy arrays (R,2)
+       Start and stop (exclusive) of contiguous runs, as returned by get_runs
+
+    Returns
+    -------
+    runs : numpy array (R,2)
+    """
+    runs = [np.asarray(rr, dtype=np.int64).reshape(-1, 2) for rr in runs]
+    if not runs:
+        return np.empty((0, 2), dtype=np.int64)
+    runs = np.concatenate(runs)
+    if len(runs) < 2:
+        return runs
+    keep = np.r_[True, runs[1:, 0] != runs[:-1, 1]]
+    starts = runs[keep, 0]
+    stops = runs[np.r_[keep[1:], True], 1]
+    return np.column_stack((starts, stops))
+
+
+def read_selected(dset, indexes, runs=None, run_cost=4096, dtype=None):
+    """
+    Read only the selected rows of a hdf5 dataset
+
+    Each contiguous run of indexes is read as a hyperslab. If the
+    selection is dense, or so fragmented that the overhead of the
+    individual reads, each counted as run_cost rows, exceeds the span
+    of the selection, this is read at once and masked in memory.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+       One dimensional dataset to be read
+    indexes : numpy array of integers or Selection
+       Sorted indexes of the rows to be read
+    runs : numpy array (R,2)
+       Contiguous runs of the indexes, as returned by get_runs
+    run_cost : integer
+       Cost of a hyperslab read, in rows
+    dtype : numpy dtype
+       Data type the values are cast into as they are read,
+       by default that of the dataset
+
+    Returns
+    -------
+    vals : numpy array
+       Values of the selected rows
+    """
+    if not isinstance(indexes, Selection):
+        indexes = Selection.from_indexes(indexes, runs=runs)
+    return indexes.read(dset, run_cost=run_cost, dtype=dtype)
+
+
+def scan_snapshots(vol_dir, dir_base='iz'):
+    """
+    Snapshots with a directory within a subvolume directory
+
+    Parameters
+    ----------
+    vol_dir : str
+        Subvolume directory
+    dir_base : str
+        The base for the redshift directories, None if they are
+        just numbers
+
+    Returns
+    -------
+    zz : list of int
+        Sorted list of redshift indices (descending order),
+        None if vol_dir does not exist
+    """
+    prefix = '' if dir_base is None else dir_base
+    try:
+        entries = list(os.scandir(vol_dir))
+    except (FileNotFoundError, NotADirectoryError):
         return None
 
-    # Combine all conditions
-    combined_cuts = cuts[0]
-    for cut in cuts[1:]:
-        combined_cuts &= cut
-    if not np.any(combined_cuts):
+    zz = []
+    for entry in entries:
+        if not entry.name.startswith(prefix): continue
+        num = entry.name[len(prefix):]
+        if num.isdigit() and entry.is_dir():
+            zz.append(int(num))
+    zz.sort(reverse=True)
+    return zz
+
+
+def _stat_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
         return None
 
-    mask = np.where(combined_cuts)[0]
-    return mask
 
+def get_snapshots(root, subvols, dir_base='iz', use_cache=True):
+    """
+    Snapshots of each subvolume, scanning the subvolume directories
+    in parallel. The snapshots are kept in a cache file per root
+    within get_cache_dir(), and each directory is only scanned again
+    if its modification time has changed.
+
+    Parameters
+    ----------
+    root : str
+        Root to higher level directories
+    subvols : list of int
+        List of subvolumes to check
+    dir_base : str
+        The base for the redshift directories
+    use_cache : bool
+        If False, scan all the directories, without reading
+        or writing the cache
+
+    Returns
+    -------
+    snapshots : dict
+        Snapshots of each subvolume as returned by scan_snapshots,
+        with the subvolume numbers as keys
+    """
+    vol_dirs = [root + str(ivol) for ivol in subvols]
+    nworkers = min(32, max(len(vol_dirs), 1))
+
+    cache_file = None; cached = {}
+    if use_cache:
+        key = repr((os.path.abspath(root), dir_base))
+        label = hashlib.sha1(key.encode()).hexdigest()[:16]
+        cache_file = os.path.join(get_cache_dir(), 'snapshots',
+                                  f'snapshots_{label}.json')
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+
+    with ThreadPoolExecutor(max_workers=nworkers) as executor:
+        mtimes = list(executor.map(_stat_mtime, vol_dirs))
+        toscan = [vol_dir for vol_dir, mtime in zip(vol_dirs, mtimes)
+                  if mtime is not None and
+                  cached.get(vol_dir, {}).get('mtime_ns') != mtime]
+        scanned = dict(zip(toscan, executor.map(scan_snapshots, toscan,
+                                                [dir_base]*len(toscan))))
+
+    snapshots = {}
+    for ivol, vol_dir, mtime in zip(subvols, vol_dirs, mtimes):
+        if mtime is None:
+            snapshots[ivol] = None
+        elif vol_dir in scanned:
+            snapshots[ivol] = scanned[vol_dir]
+            if snapshots[ivol] is not None:
+                cached[vol_dir] = {'mtime_ns': mtime, 'zz': snapshots[ivol]}
+        else:
+            snapshots[ivol] = cached[vol_dir]['zz']
+
+    if cache_file is not None and scanned:
+        write_atomic(cache_file, lambda f: json.dump(cached, f))
+    return snapshots
 
-def get_zz_subvols(root, subvols, dir_base='iz',verbose=False):
+
+def get_zz_subvols(root, subvols, dir_base='iz', verbose=False, use_cache=True):
     """
     Check which subvolume directories exist and 
     verify they all have the same redshift subdirectories.
@@ -99,6 +429,9 @@ def get_zz_subvols(root, subvols, dir_base='iz',verbose=False):
         List of subvolumes to check
     dir_base : str
         The base for the redshift directories
+    use_cache : bool
+        If True, use the snapshots cached by get_snapshots
+        for unmodified directories
 
     Returns
     -------
@@ -108,31 +441,21 @@ def get_zz_subvols(root, subvols, dir_base='iz',verbose=False):
     zz_reference = None
     first_vol_dir = None
 
+    snapshots = get_snapshots(root, subvols, dir_base=dir_base,
+                              use_cache=use_cache)
     for ivol in subvols:
         vol_dir = root + str(ivol)
-        if not os.path.exists(vol_dir):
+        zz = snapshots[ivol]
+        if zz is None:
             if verbose:
                 print(f'WARNING: Directory {vol_dir} does not exist')
             continue
 
-        # Find redshift subdirectories
-        zroot = vol_dir.rstrip('/') + '/'
-        if dir_base is not None:
-            zroot = os.path.join(vol_dir, dir_base)
-
-        z_dirs = glob(zroot + '*')
-        if len(z_dirs) < 1:
+        if len(zz) < 1:
             if verbose:
                 print(f'WARNING: No {dir_base}* directories in {vol_dir}')
             continue
 
-        # Find output snapshots
-        if dir_base is None:
-            zz = [int(os.path.basename(d)) for d in z_dirs]
-        else:
-            zz = [int(os.path.basename(d).replace(dir_base, '')) for d in z_dirs]
-        zz.sort(reverse=True)
-
         # Check that all subvolumes have the same snapshots
         if zz_reference is None:
             zz_reference = zz
@@ -150,7 +473,7 @@ def get_zz_subvols(root, subvols, dir_base='iz',verbose=False):
 
 
 def get_group_name(root, snap, subvols, group_base='Output',
-                   ndigits=3, dir_base='iz',verbose=False):
+                   ndigits=3, dir_base='iz',verbose=False,use_cache=True):
     """
     Get the name of the hdf5 group to be read for a given snapshot.
     
@@ -172,6 +495,8 @@ def get_group_name(root, snap, subvols, group_base='Output',
         Number of characters to convert digits to
     dir_base : str
         The base for the redshift directories
+    use_cache : bool
+        If True, use the snapshots cached for unmodified directories
 
     Returns
     -------
@@ -180,7 +505,7 @@ def get_group_name(root, snap, subvols, group_base='Output',
     snap_int = int(snap)
     
     # Get and validate redshift directories across subvolumes
-    zz = get_zz_subvols(root, subvols, dir_base=dir_base)
+    zz = get_zz_subvols(root, subvols, dir_base=dir_base, use_cache=use_cache)
     if snap_int not in zz:
         print(f'STOP: Snapshot {snap} not found in available snapshots: {zz}')
         sys.exit(1)
@@ -231,21 +556,507 @@ def check_h5_structure(infile, datasets, group=None, verbose=True):
     -------
     structure_ok : bool
     """
-    try:
-        with h5py.File(infile, 'r') as hdf_file:
-            hf = open_hdf5_group(hdf_file, group)
-            if hf is None:
-                if verbose:
-                    print(f'WARNING: Group {group} not found in {infile}')
-                return False
-
-            structure_ok = set(datasets).issubset(list(hf.keys()))
-            if not structure_ok and verbose:
-                missing = list(set(datasets).difference(list(hf.keys())))
-                print(f"  {missing} properties not found in {infile}")
-    except FileNotFoundError:
+    return check_h5_groups(infile, {group: datasets}, verbose=verbose)
+
+
+def check_h5_groups(infile, groups, verbose=True):
+    """
+    Check that the datasets expected in each group of a hdf5 file
+    exist, opening the file once
+
+    Parameters
+    ----------
+    infile : string
+      Name of input file (this should be a hdf5 file)
+    groups : dict
+      Names of the expected datasets, with their group names as keys
+      (None for the root of the file)
+
+    Return
+    -------
+    structure_ok : bool
+    """
+    missing = get_h5_missing(infile, groups)
+    if missing is None:
         if verbose:
             print(f"  {infile} could not be opened")
-        structure_ok = False
-        
-    return structure_ok
+        return False
+
+    for group, datasets in missing.items():
+        if verbose:
+            if datasets is None:
+                print(f'WARNING: Group {group} not found in {infile}')
+            else:
+                print(f"  {datasets} properties not found in {infile}")
+    return not missing
+
+
+def get_h5_missing(infile, groups):
+    """
+    Groups and datasets expected in a hdf5 file but not found
+
+    Parameters
+    ----------
+    infile : string
+      Name of input file (this should be a hdf5 file)
+    groups : dict
+      Names of the expected datasets, with their group names as keys
+      (None for the root of the file)
+
+    Return
+    -------
+    missing : dict
+      Missing datasets, with their group names as keys, or None for
+      missing groups. Empty if the file has the expected structure,
+      None if the file could not be opened.
+    """
+    missing = {}
+    try:
+        with h5py.File(infile, 'r') as hdf_file:
+            for group, datasets in groups.items():
+                hf = open_hdf5_group(hdf_file, group)
+                if hf is None:
+                    missing[group] = None
+                    continue
+                keys = set(hf.keys())
+                absent = [ds for ds in datasets if ds not in keys]
+                if absent:
+                    missing[group] = absent
+    except OSError: # Missing, truncated or corrupt file
+        return None
+    return missing
+
+
+storage_keys = ['chunks', 'compression', 'compression_opts',
+                'shuffle', 'fletcher32']
+
+def get_storage_options(storage, name, nrows=None):
+    """
+    HDF5 storage options for a dataset
+
+    Parameters
+    ----------
+    storage : dict
+        Options for all datasets under 'default', and for particular
+        datasets under their names, overriding the default ones:
+        'chunks' (rows per chunk), 'compression' ('gzip' or 'lzf'),
+        'compression_opts', 'shuffle' and 'fletcher32' (False by default).
+        For example, {'default': {'chunks': 65536, 'compression': 'lzf',
+        'shuffle': True}, 'gal_index': {'compression': 'gzip'}}
+    name : string
+        Name of the dataset
+    nrows : integer
+        Size of a fixed size dataset, limiting the chunk size.
+        None for resizable datasets.
+
+    Returns
+    -------
+    options : dict
+        Keyword arguments for h5py create_dataset
+    """
+    if not storage:
+        return {}
+    options = {'fletcher32': False}
+    options.update(storage.get('default', {}))
+    own = storage.get(name, {})
+    if 'compression' in own and 'compression_opts' not in own:
+        # Options of the default compression do not apply
+        options.pop('compression_opts', None)
+    options.update(own)
+    for key in options:
+        if key not in storage_keys:
+            raise ValueError(f"Storage option '{key}' not supported. Available options: {storage_keys}")
+
+    if nrows is not None and nrows < 1:
+        # Empty datasets cannot be chunked
+        return {}
+    chunks = options.get('chunks')
+    if isinstance(chunks, (int, np.integer)) and not isinstance(chunks, bool):
+        if nrows is not None:
+            chunks = min(chunks, nrows)
+        options['chunks'] = (int(chunks),)
+    return options
+
+
+def get_output_dtype(schema, name, dtype=None):
+    """
+    Data type of an output dataset
+
+    Parameters
+    ----------
+    schema : dict
+        Data types with patterns of the dataset names as keys
+        (as in fnmatch), the first matching pattern applying.
+        For example, {'type': 'int32', 'L_*': 'float32'}
+    name : string
+        Name of the dataset
+    dtype : numpy dtype
+        Data type if no pattern matches
+
+    Returns
+    -------
+    dtype : numpy dtype
+        None if no pattern matches and no dtype is given
+    """
+    if schema:
+        for pattern, pdtype in schema.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                return np.dtype(pdtype)
+    if dtype is None:
+        return None
+    return np.dtype(dtype)
+
+
+class OutputWriter:
+    """
+    Buffered writer for the gne_input.hdf5 files.
+
+    The output file is opened once and kept open until close() is
+    called, so that datasets and header attributes do not trigger
+    an open/close cycle each.
+
+    Parameters
+    ----------
+    outfile : string
+        Name of the output hdf5 file
+    mode : string
+        Mode used to open the file, default 'w'
+    storage : dict
+        HDF5 storage options of the datasets, see get_storage_options.
+        By default, datasets are stored contiguous and uncompressed.
+
+    Examples
+    --------
+    >>> with OutputWriter('gne_input.hdf5') as writer:
+    ...     writer.set_header('h0', 0.7)
+    ...     writer.write('mcold', mcold, units='Msun/h')
+    """
+    def __init__(self, outfile, mode='w', storage=None):
+        self.outfile = outfile
+        self.storage = storage
+        self.hf = h5py.File(outfile, mode)
+        if 'header' in self.hf:
+            self.header = self.hf['header']
+        else:
+            self.header = self.hf.create_dataset('header', (), dtype='f4')
+        if 'data' in self.hf:
+            self.data = self.hf['data']
+        else:
+            self.data = self.hf.create_group('data')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def set_header(self, key, value):
+        """
+        Set an attribute of the header
+
+        Parameters
+        ----------
+        key : string
+            Name of the attribute
+        value : any
+            Value of the attribute
+        """
+        self.header.attrs[key] = value
+
+    def _group(self, group):
+        if group == 'data':
+            return self.data
+        return self.hf.require_group(group)
+
+    def write(self, name, data, units=None, group='data'):
+        """
+        Write a dataset into the data group
+
+        Parameters
+        ----------
+        name : string
+            Name of the dataset
+        data : numpy array
+            Values to be stored
+        units : string
+            Units stored as an attribute of the dataset
+        group : string
+            Group of the dataset, by default the data group,
+            with one row per galaxy
+        """
+        options = get_storage_options(self.storage, name, len(data))
+        dd = self._group(group).create_dataset(name, data=data, **options)
+        if units is not None:
+            dd.attrs['units'] = units
+        return dd
+
+    def append(self, name, data, units=None, group='data'):
+        """
+        Append values to a dataset of the data group, creating
+        it as a resizable dataset if it does not exist yet
+
+        Parameters
+        ----------
+        name : string
+            Name of the dataset
+        data : numpy array
+            Values to be appended
+        units : string
+            Units stored as an attribute of the dataset
+        group : string
+            Group of the dataset, by default the data group
+        """
+        hg = self._group(group)
+        if name not in hg:
+            options = get_storage_options(self.storage, name)
+            if options.get('chunks') is None:
+                options['chunks'] = True
+            dd = hg.create_dataset(name, data=data, maxshape=(None,),
+                                   **options)
+            if units is not None:
+                dd.attrs['units'] = units
+            return dd
+
+        dd = hg[name]
+        nn = dd.shape[0]
+        dd.resize(nn + len(data), axis=0)
+        dd[nn:] = data
+        return dd
+
+    def close(self):
+        """
+        Flush and close the output file
+        """
+        if self.hf:
+            self.hf.flush()
+            self.hf.close()
+
+
+class Columns:
+    """
+    Columnar buffer for the selection datasets.
+
+    Each column is preallocated with the dtype of its dataset and
+    filled directly from the file. Columns can be accessed by position,
+    as the rows of an (N,M) array, or by name.
+
+    Parameters
+    ----------
+    names : list of strings
+        Names of the columns
+    nrows : integer
+        Number of rows
+    dtypes : list of numpy dtypes
+        Data type of each column
+
+    Examples
+    --------
+    >>> alldata = Columns.from_hdf5(hf, ['mhhalo', 'type'], 0, 1000)
+    >>> mask = combined_mask(alldata, [1e10, 0], [None, 0])
+    """
+    def __init__(self, names, nrows, dtypes):
+        self.names = list(names)
+        self.columns = [np.empty(nrows, dtype=dtype) for dtype in dtypes]
+
+    @classmethod
+    def from_hdf5(cls, hf, datasets, start=0, stop=None, dtypes=None):
+        """
+        Read rows start:stop of the datasets of an hdf5 group,
+        cast into the given dtypes (None for that of the dataset)
+        """
+        dsets = [hf[name] for name in datasets]
+        if stop is None:
+            stop = dsets[0].shape[0] if dsets else 0
+        if dtypes is None:
+            dtypes = [None]*len(dsets)
+        dtypes = [dset.dtype if dtype is None else dtype
+                  for dset, dtype in zip(dsets, dtypes)]
+        buffer = cls(datasets, stop - start, dtypes)
+        if stop > start:
+            for dset, col in zip(dsets, buffer.columns):
+                dset.read_direct(col, np.s_[start:stop])
+        return buffer
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self.names.index(key)
+        return self.columns[key]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    @property
+    def shape(self):
+        nrows = len(self.columns[0]) if self.columns else 0
+        return (len(self.columns), nrows)
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns)
+
+
+class Selection:
+    """
+    Compact set of selected rows of a block of datasets.
+
+    The selection is kept as a packed bitmap, int32 (or int64 if
+    needed) indexes or contiguous runs, whichever takes less memory,
+    and read from hdf5 datasets as hyperslabs.
+
+    Parameters
+    ----------
+    cuts : numpy array of bool
+        Condition for each row of the block
+    offset : integer
+        Row in the original datasets of the first row of the block
+    kind : string
+        Representation, 'bitmap', 'index' or 'runs'.
+        By default, the most compact one.
+
+    Examples
+    --------
+    >>> sel = Selection(mhhalo > 1e10, offset=start)
+    >>> mcold = sel.read(hf['mcold'])
+    >>> gal_index = sel.indexes()
+    """
+    kinds = ['bitmap', 'index', 'runs']
+
+    def __init__(self, cuts, offset=0, kind=None):
+        cuts = np.asarray(cuts, dtype=bool)
+        self.nrows = len(cuts)
+        self.offset = int(offset)
+        self.count = int(np.count_nonzero(cuts))
+
+        if self.offset + self.nrows < 2**31:
+            self.itype = np.int32
+        else:
+            self.itype = np.int64
+        edges = np.flatnonzero(np.diff(np.r_[False, cuts, False].view(np.int8)))
+        nruns = len(edges)//2
+        itemsize = np.dtype(self.itype).itemsize
+        sizes = {'bitmap': (self.nrows + 7)//8,
+                 'index': self.count*itemsize,
+                 'runs': 2*nruns*itemsize}
+        if kind is None:
+            kind = min(sizes, key=sizes.get)
+        elif kind not in self.kinds:
+            raise ValueError(f"Selection kind '{kind}' not supported. Available kinds: {self.kinds}")
+        self.kind = kind
+
+        if kind == 'bitmap':
+            self.data = np.packbits(cuts)
+        elif kind == 'index':
+            self.data = np.flatnonzero(cuts).astype(self.itype)
+        else:
+            self.data = edges.reshape(-1, 2).astype(self.itype)
+        self._runs = None
+
+    @classmethod
+    def from_indexes(cls, indexes, runs=None):
+        """
+        Selection of the rows with the given sorted indexes
+
+        Parameters
+        ----------
+        indexes : numpy array of integers
+            Sorted indexes of the selected rows
+        runs : numpy array (R,2)
+            Contiguous runs of the indexes, as returned by get_runs
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        if len(indexes) < 1:
+            return cls(np.zeros(0, dtype=bool))
+        first = int(indexes[0])
+        cuts = np.zeros(int(indexes[-1]) + 1 - first, dtype=bool)
+        cuts[indexes - first] = True
+        sel = cls(cuts, offset=first)
+        if runs is not None:
+            sel._runs = np.asarray(runs, dtype=np.int64)
+        return sel
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def mask(self):
+        """
+        Boolean array with the selected rows of the block
+        """
+        if self.kind == 'bitmap':
+            return np.unpackbits(self.data, count=self.nrows).view(bool)
+        mask = np.zeros(self.nrows, dtype=bool)
+        if self.kind == 'index':
+            mask[self.data] = True
+        else:
+            for start, stop in self.data:
+                mask[start:stop] = True
+        return mask
+
+    def runs(self):
+        """
+        Start and stop (exclusive) of each contiguous run of
+        selected rows, in the original datasets
+        """
+        if self._runs is None:
+            if self.kind == 'runs':
+                runs = self.data.astype(np.int64)
+            elif self.kind == 'index':
+                runs = get_runs(self.data)
+            else:
+                edges = np.flatnonzero(np.diff(np.r_[False, self.mask(), False].view(np.int8)))
+                runs = edges.reshape(-1, 2).astype(np.int64)
+            self._runs = runs + self.offset
+        return self._runs
+
+    def indexes(self, dtype=np.int64):
+        """
+        Indexes of the selected rows in the original datasets
+        """
+        if self.kind == 'index':
+            return self.data.astype(dtype) + self.offset
+        if self.kind == 'bitmap':
+            return np.flatnonzero(self.mask()).astype(dtype) + self.offset
+        runs = self.runs()
+        lengths = runs[:, 1] - runs[:, 0]
+        shift = np.repeat(runs[:, 0] - np.cumsum(lengths) + lengths, lengths)
+        return (np.arange(self.count) + shift).astype(dtype)
+
+    def apply(self, vals, first=0):
+        """
+        Selected values from an array with the rows of the block
+        from row first, covering all the selected ones
+        """
+        if self.kind == 'index':
+            return vals[self.data - first]
+        return vals[self.mask()[first:first + len(vals)]]
+
+    def read(self, dset, run_cost=4096, dtype=None):
+        """
+        Read the selected rows of a hdf5 dataset, as in read_selected
+        """
+        if dtype is None:
+            dtype = dset.dtype
+        if self.count < 1:
+            return np.empty(0, dtype=dtype)
+        runs = self.runs()
+        first = int(runs[0, 0]); last = int(runs[-1, 1])
+        if self.count + len(runs)*run_cost >= last - first:
+            # Dense selection: read the span and mask it
+            span = np.empty(last - first, dtype=dtype)
+            dset.read_direct(span, np.s_[first:last])
+            return self.apply(span, first=first - self.offset)
+
+        vals = np.empty(self.count, dtype=dtype)
+        offset = 0
+        for start, stop in runs:
+            nn = int(stop - start)
+            dset.read_direct(vals, np.s_[start:stop], np.s_[offset:offset+nn])
+            offset += nn
+        return vals
@@ -1,10 +1,168 @@
-import sys
+import os
+import csv
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import src.utils as u
+from src.config import get_config
+from src.read_plan import get_input_files
+from src.catalogue import get_structure
 
-def validate_hdf5_file(config, snap, ivol, verbose=True):
+report_formats = ['.json', '.csv']
+report_columns = ['sim', 'snap', 'ivol', 'file', 'group', 'missing', 'datasets']
+
+def get_expected_structure(config, ivol):
+    """
+    Datasets expected in each input file of a subvolume, merging
+    the selection and the properties read from the same file
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+
+    Returns
+    -------
+    structure : dict
+        For each input file path, the expected datasets with their
+        group names as keys
+    """
+    infiles = get_input_files(config, ivol)
+    allfiles = [config['file_props']]
+    if config['selection'] is not None:
+        allfiles.insert(0, config['selection'])
+
+    structure = {}
+    for files in allfiles:
+        for ifile, props in files.items():
+            groups = structure.setdefault(infiles[ifile], {})
+            datasets = groups.setdefault(props.get('group'), [])
+            datasets.extend(ds for ds in props['datasets'] if ds not in datasets)
+    return structure
+
+
+def get_validation_file(infile, groups, cache_dir):
+    """
+    Cache entry recording that a file has the expected structure,
+    keyed by its path, size and modification time and the expected
+    datasets
+
+    Parameters
+    ----------
+    infile : string
+        Path to the hdf5 file
+    groups : dict
+        Expected datasets, with their group names as keys
+    cache_dir : string
+        Directory with the cache entries
+
+    Returns
+    -------
+    cache_file : string
+        None if the file does not exist
+    """
+    try:
+        stat = os.stat(infile)
+    except OSError:
+        return None
+    expected = sorted((str(group), sorted(datasets))
+                      for group, datasets in groups.items())
+    key = repr((os.path.abspath(infile), stat.st_size, stat.st_mtime_ns,
+                expected))
+    label = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'validate_{label}.json')
+
+
+def _store_validation(cache_file, infile):
+    """
+    Write a cache entry, atomically for concurrent jobs
+    """
+    u.write_atomic(cache_file, lambda ff: json.dump({'file': infile}, ff))
+
+
+def get_missing_structure(config, ivol, use_cache=True, catalogue=None):
+    """
+    Files, groups and datasets of a subvolume not found
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary containing paths and file properties
+    ivol : integer
+        Number of subvolume
+    use_cache : bool
+        If True, skip the files validated before and not modified since,
+        as recorded in the validation directory within u.get_cache_dir()
+    catalogue : string
+        If given, SQLite catalogue built by src.catalogue.build_catalogue,
+        queried instead of opening the files
+
+    Returns
+    -------
+    problems : list of dict
+        Each with the 'file', the 'group' (None for missing files),
+        what is 'missing' ('file', 'group' or 'datasets') and the
+        missing 'datasets'
+    ncached : integer
+        Number of files skipped as unchanged since validated
+    """
+    problems = []; ncached = 0
+    cache_dir = os.path.join(u.get_cache_dir(), 'validation')
+
+    # Each file is opened once, checking all its groups
+    for infile, groups in get_expected_structure(config, ivol).items():
+        cache_file = None
+        if catalogue is not None:
+            missing = _get_catalogue_missing(catalogue, infile, groups)
+        elif use_cache:
+            cache_file = get_validation_file(infile, groups, cache_dir)
+            if cache_file is not None and os.path.exists(cache_file):
+                ncached += 1
+                continue
+
+        if catalogue is None:
+            missing = u.get_h5_missing(infile, groups)
+        if missing is None:
+            problems.append({'file': infile, 'group': None,
+                             'missing': 'file', 'datasets': []})
+        elif missing:
+            for group, datasets in missing.items():
+                if datasets is None:
+                    problems.append({'file': infile, 'group': group,
+                                     'missing': 'group', 'datasets': []})
+                else:
+                    problems.append({'file': infile, 'group': group,
+                                     'missing': 'datasets', 'datasets': datasets})
+        elif cache_file is not None:
+            _store_validation(cache_file, infile)
+    return problems, ncached
+
+
+def _get_catalogue_missing(catalogue, infile, groups):
+    """
+    Missing groups and datasets of a file, as u.get_h5_missing,
+    from a catalogue
+    """
+    structure = get_structure(catalogue, infile)
+    if structure is None:
+        return None
+    missing = {}
+    for group, datasets in groups.items():
+        if group not in structure:
+            missing[group] = None
+            continue
+        absent = [ds for ds in datasets if ds not in structure[group]]
+        if absent:
+            missing[group] = absent
+    return missing
+
+
+def validate_hdf5_file(config, snap, ivol, verbose=True, use_cache=True):
     """
     Validate that all HDF5 files have the expected structure
-    
+
     Parameters
     ----------
     config : dict
@@ -15,44 +173,140 @@ def validate_hdf5_file(config, snap, ivol, verbose=True):
         Number of subvolume
     verbose : bool
         Enable verbose output
-        
+    use_cache : bool
+        If True, skip the files validated before and not modified since,
+        as recorded in the validation directory within u.get_cache_dir()
+
     Returns
     -------
     bool
         True if all files are valid, False otherwise
     """
-    
-    count_fails = 0
-    selection = config['selection']
-    file_props = config['file_props']
-    
-    path = u.get_path(config['root'],ivol,ending=config['ending'])
-    
-    # File to be read a directory above, if applicable
-    except_file = config.get('except_file')
-    if except_file is not None:
-        except_path =  u.get_path(config['root'],ivol)
-
-    # Combine selection and file_props for validation
-    if selection is None:
-        allfiles = file_props
-    else:
-        allfiles = {**selection, **file_props}
-
-    for ifile, props in allfiles.items():
-        datasets = props['datasets']
-        group = props.get('group')
-
-        if except_file is not None and ifile == config['except_file']:
-            structure_ok = u.check_h5_structure(except_path+ifile,
-                                                datasets,group=group)
+    problems, ncached = get_missing_structure(config, ivol, use_cache=use_cache)
+    for problem in problems:
+        if problem['missing'] == 'file':
+            print(f"  {problem['file']} could not be opened")
+        elif problem['missing'] == 'group':
+            print(f"WARNING: Group {problem['group']} not found in {problem['file']}")
         else:
-            structure_ok = u.check_h5_structure(path+ifile,datasets,group=group)
-            
-        if not structure_ok:
-            count_fails += 1
-    
-    if count_fails > 0:
+            print(f"  {problem['datasets']} properties not found in {problem['file']}")
+
+    if verbose and ncached > 0:
+        print(f' * ivol{ivol}: {ncached} files unchanged since validated')
+    if problems:
         print(f"VALIDATION FAILED for ivol{ivol}.")
-        return False    
+        return False
     return True
+
+
+def _validate_unit(task):
+    """
+    Missing structure of one (sim, snap, ivol), for validate_campaign
+    """
+    sim, snap, ivol, config, use_cache, catalogue = task
+    problems, ncached = get_missing_structure(config, ivol, use_cache=use_cache,
+                                              catalogue=catalogue)
+    return [{'sim': sim, 'snap': snap, 'ivol': ivol, **problem}
+            for problem in problems]
+
+
+def validate_campaign(simulations, workers=None, report=None, laptop=False,
+                      use_cache=True, catalogue=None, verbose=True):
+    """
+    Validate the input files of a set of simulations, with the
+    subvolumes checked concurrently by a pool of processes
+
+    Parameters
+    ----------
+    simulations : list of tuples
+        (sim, snaps, subvols) for each simulation, as in validate_files.py
+    workers : integer
+        Number of processes, by default SLURM_CPUS_PER_TASK if defined,
+        otherwise 1
+    report : string
+        If given, file (.json or .csv) to write the report into
+    laptop : bool
+        If True, use local test configuration
+    use_cache : bool
+        If True, skip the files validated before and not modified since
+    catalogue : string
+        If given, SQLite catalogue built by src.catalogue.build_catalogue,
+        queried instead of opening the files
+    verbose : bool
+        If True, print a summary
+
+    Returns
+    -------
+    problems : list of dict
+        Missing 'file', 'group', 'datasets' or 'config' for each
+        (sim, snap, ivol), as returned by get_missing_structure.
+        Configurations that cannot be built have ivol None.
+    """
+    tasks = []; problems = []
+    for sim, snaps, subvols in simulations:
+        for snap in snaps:
+            try:
+                config = get_config(sim, snap, subvols, laptop=laptop)
+            except (ValueError, OSError, SystemExit):
+                problems.append({'sim': sim, 'snap': snap, 'ivol': None,
+                                 'file': None, 'group': None,
+                                 'missing': 'config', 'datasets': []})
+                continue
+            tasks.extend((sim, snap, ivol, config, use_cache, catalogue)
+                         for ivol in subvols)
+
+    nworkers = min(u.get_nworkers(workers), max(len(tasks), 1))
+    if nworkers <= 1:
+        results = map(_validate_unit, tasks)
+        for result in results:
+            problems.extend(result)
+    else:
+        chunksize = max(len(tasks)//(4*nworkers), 1)
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            for result in executor.map(_validate_unit, tasks, chunksize=chunksize):
+                problems.extend(result)
+
+    if report is not None:
+        write_validation_report(report, problems)
+    if verbose:
+        failed = set((p['sim'], p['snap'], p['ivol']) for p in problems
+                     if p['missing'] != 'config')
+        nconfig = sum(p['missing'] == 'config' for p in problems)
+        if failed or nconfig:
+            print(f'VALIDATION FAILED for {len(failed)} of the',
+                  f'{len(tasks)} subvolumes;',
+                  f'{nconfig} configurations could not be loaded.')
+        else:
+            print(f'SUCCESS: All {len(tasks)} subvolumes have valid hdf5 files.')
+    return problems
+
+
+def write_validation_report(reportfile, problems):
+    """
+    Write the problems found by validate_campaign into a json
+    or csv file, one row per missing file, group or set of datasets
+
+    Parameters
+    ----------
+    reportfile : string
+        Name of the report, with extension .json or .csv
+    problems : list of dict
+        As returned by validate_campaign
+    """
+    ext = os.path.splitext(reportfile)[1]
+    if ext not in report_formats:
+        raise ValueError(f"Report format '{ext}' not supported. Available formats: {report_formats}")
+
+    outdir = os.path.dirname(reportfile)
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+    if ext == '.json':
+        with open(reportfile, 'w') as f:
+            json.dump(problems, f, indent=1)
+    else:
+        with open(reportfile, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=report_columns)
+            writer.writeheader()
+            for problem in problems:
+                writer.writerow({**problem,
+                                 'datasets': ';'.join(problem['datasets'])})
@@ -0,0 +1,19 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+class CacheTestCase(unittest.TestCase):
+    """
+    Test case with a temporary directory, self.test_dir, removed after
+    each test, which also holds the cache of the tested functions
+    (PREP_GNE_CACHE, self.cache_dir), so that ~/.cache is not modified
+    """
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.cache_dir = os.path.join(self.test_dir, 'cache')
+        env = mock.patch.dict(os.environ, {'PREP_GNE_CACHE': self.cache_dir})
+        env.start()
+        self.addCleanup(env.stop)
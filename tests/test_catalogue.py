@@ -0,0 +1,91 @@
+# python -m unittest tests/test_catalogue.py
+
+import unittest
+import os
+import copy
+import h5py
+
+import src.synthetic as syn
+import src.catalogue as cat
+from src.validate import get_missing_structure
+from src.read_plan import get_input_files
+from tests import CacheTestCase
+
+class TestCatalogue(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dbfile = os.path.join(self.test_dir, 'catalogue.db')
+        self.config = syn.get_synthetic_config('galform', self.test_dir)
+        for ivol in [0, 1]:
+            syn.write_synthetic_files(self.config, ivol, 100 + ivol, seed=ivol)
+        self.configs = [('synthetic', 39, [0, 1, 2], self.config)]
+
+    def test_add_to_catalogue(self):
+        nfiles = cat.add_to_catalogue(self.dbfile, self.configs, workers=2,
+                                      verbose=False)
+        self.assertEqual(nfiles, 12)
+
+        files = cat.get_files(self.dbfile, 'synthetic', snap=39)
+        self.assertEqual(len(files), 12)
+        self.assertEqual(sum(f['size'] is None for f in files), 4)
+        nbytes = cat.get_subvolume_bytes(self.dbfile, 'synthetic', 39)
+        self.assertEqual(sorted(nbytes), [0, 1, 2])
+        self.assertGreater(nbytes[1], nbytes[0])
+        self.assertEqual(nbytes[2], 0)
+
+        path = [f['path'] for f in files
+                if f['ivol'] == 1 and f['name'] == 'galaxies.hdf5'][0]
+        structure = cat.get_structure(self.dbfile, path)
+        self.assertIn('mhhalo', structure['Output001'])
+        self.assertIsNone(cat.get_structure(self.dbfile, 'nofile.hdf5'))
+
+        # Validation from the catalogue
+        problems, ncached = get_missing_structure(self.config, 1,
+                                                  catalogue=self.dbfile)
+        self.assertEqual(problems, [])
+        problems, ncached = get_missing_structure(self.config, 2,
+                                                  catalogue=self.dbfile)
+        self.assertEqual(set(p['missing'] for p in problems), {'file'})
+
+        # Only modified files are inspected again
+        with h5py.File(path, 'a') as hf:
+            del hf['Output001/mhhalo']
+        cat.add_to_catalogue(self.dbfile, self.configs, verbose=False)
+        structure = cat.get_structure(self.dbfile, path)
+        self.assertNotIn('mhhalo', structure['Output001'])
+        problems, ncached = get_missing_structure(self.config, 1,
+                                                  catalogue=self.dbfile)
+        self.assertEqual(problems[0]['datasets'], ['mhhalo'])
+
+    def test_new_groups(self):
+        path = get_input_files(self.config, 0)['agn.hdf5']
+        with h5py.File(path, 'a') as hf:
+            hf.create_dataset('Extra/Lbol_AGN', data=[1.])
+        cat.add_to_catalogue(self.dbfile, self.configs, verbose=False)
+        self.assertNotIn('Extra', cat.get_structure(self.dbfile, path))
+
+        # Unchanged file opened again for a group not crawled before
+        config = copy.deepcopy(self.config)
+        config['file_props']['agn.hdf5']['group'] = 'Extra'
+        cat.add_to_catalogue(self.dbfile, [('synthetic', 39, [0], config)],
+                             verbose=False)
+        structure = cat.get_structure(self.dbfile, path)
+        self.assertEqual(sorted(structure), ['Extra', 'Output001'])
+        problems, ncached = get_missing_structure(config, 0,
+                                                  catalogue=self.dbfile)
+        self.assertEqual(problems, [])
+
+    def test_subvolume_bytes(self):
+        # Shark's galaxies.hdf5 is also its file_redshift
+        config = syn.get_synthetic_config('shark', self.test_dir + '/shark')
+        syn.write_synthetic_files(config, 0, 100, seed=1)
+        cat.add_to_catalogue(self.dbfile, [('shark', 39, [0], config)],
+                             verbose=False)
+        infiles = set(get_input_files(config, 0).values())
+        nbytes = cat.get_subvolume_bytes(self.dbfile, 'shark', 39)
+        self.assertEqual(nbytes[0], sum(os.path.getsize(infile)
+                                        for infile in infiles))
+
+
+if __name__ == '__main__':
+    unittest.main()
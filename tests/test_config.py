@@ -4,10 +4,26 @@ import unittest
 from unittest.mock import patch, mock_open
 import sys
 import os
+import tempfile
+import shutil
+import numpy as np
 
 import src.config as conf
+import src.utils as u
 
 class TestConfigFunctions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Snapshot caches within a temporary directory
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.env = patch.dict(os.environ, {'PREP_GNE_CACHE': cls.cache_dir})
+        cls.env.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.stop()
+        shutil.rmtree(cls.cache_dir)
+
     def setUp(self):
         self.snap = 39
         self.subvols = [0]
@@ -47,6 +63,14 @@ class TestConfigFunctions(unittest.TestCase):
         # Test with localtest=False (default)
         config = conf.get_config(self.valid_simtype, self.snap, self.subvols)
         self.assertEqual(self.localroot, config['root'])
+        self.assertEqual(config['output_schema'], conf.output_schema)
+
+        # Masses cast, other datasets starting with m kept as read
+        schema = config['output_schema']
+        self.assertEqual(u.get_output_dtype(schema, 'mstars_disk'), np.float32)
+        self.assertEqual(u.get_output_dtype(schema, 'mhhalo'), np.float32)
+        self.assertIsNone(u.get_output_dtype(schema, 'metals_burst'))
+        self.assertIsNone(u.get_output_dtype(schema, 'merger_count'))
 
     def test_get_GP20cosma_config(self):
         config = conf.get_GP20cosma_config(self.snap, self.subvols)
@@ -0,0 +1,150 @@
+# python -m unittest tests/test_cosmology.py
+
+import unittest
+import os
+import tempfile
+import shutil
+import pickle
+import numpy as np
+
+import src.cosmology as cosmo
+
+class TestCosmology(unittest.TestCase):
+    def setUp(self):
+        cosmo.set_Planck15()
+
+    def test_comoving_distance_table(self):
+        # Bin by bin romberg integration, as previously done
+        nbins = 4000
+        zz = cosmo.redshift[:nbins]
+        expected = np.zeros(nbins)
+        for i in range(1, nbins):
+            expected[i] = expected[i-1] + cosmo.romberg(cosmo.f, zz[i-1], zz[i])
+
+        np.testing.assert_allclose(cosmo.comoving_distance_table(zz),
+                                   expected, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(cosmo.r_comoving[:nbins],
+                                   expected, rtol=1e-12, atol=1e-12)
+        self.assertEqual(len(cosmo.r_comoving), len(cosmo.redshift))
+
+        # Comoving distance to z=1 for Planck15
+        self.assertAlmostEqual(cosmo.comoving_distance(1.), 2300.65, delta=0.01)
+
+    def test_distance_table_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            expected = cosmo.r_comoving.copy()
+            cosmo.set_cosmology(0.3089,0.0486,0.6911,0.6774,cache_dir=cache_dir)
+            files = os.listdir(cache_dir)
+            self.assertEqual(len(files), 1)
+            self.assertIsInstance(cosmo.r_comoving, np.memmap)
+            np.testing.assert_array_equal(cosmo.r_comoving, expected)
+
+            # Reuse the cached table, a different cosmology adds a new entry
+            cosmo.set_cosmology(0.3089,0.0486,0.6911,0.6774,cache_dir=cache_dir)
+            self.assertEqual(os.listdir(cache_dir), files)
+            cosmo.set_cosmology(0.3,0.05,0.7,0.7,cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            self.assertEqual(len(cosmo.redshift), len(cosmo.r_comoving))
+
+            # Cache files readable by others sharing the cache
+            mode = os.stat(os.path.join(cache_dir, files[0])).st_mode
+            self.assertEqual(mode & 0o777, 0o644)
+
+            # Unusable cache directory, the table is kept in memory
+            notdir = os.path.join(cache_dir, files[0], 'cache')
+            mill = cosmo.Cosmology(0.25,0.045,0.75,0.73,cache_dir=notdir)
+            self.assertNotIsInstance(mill.r_comoving, np.memmap)
+            self.assertAlmostEqual(mill.comoving_distance(1.),
+                cosmo.Cosmology(0.25,0.045,0.75,0.73).comoving_distance(1.))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_cosmology_instances(self):
+        # Two cosmologies coexisting, independent of set_cosmology
+        planck = cosmo.Cosmology(0.3089,0.0486,0.6911,0.6774)
+        mill = cosmo.Cosmology(0.25,0.045,0.75,0.73)
+        self.assertEqual(planck.comoving_distance(1.), cosmo.comoving_distance(1.))
+        self.assertNotAlmostEqual(mill.comoving_distance(1.), planck.comoving_distance(1.))
+        self.assertEqual(cosmo.Omega_M(), 0.3089)
+
+        with self.assertRaises(AttributeError):
+            planck.WM = 0.2
+        with self.assertRaises(ValueError):
+            planck.r_comoving[1] = 0.
+
+        # Instances are reused within a process
+        self.assertIs(cosmo.get_cosmology(0.25,0.045,0.75,0.73),
+                      cosmo.get_cosmology(0.25,0.045,0.75,0.73))
+
+        # Pickled tables, or memory-mapped again if cached
+        copy = pickle.loads(pickle.dumps(mill))
+        np.testing.assert_array_equal(copy.r_comoving, mill.r_comoving)
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cached = cosmo.Cosmology(0.25,0.045,0.75,0.73,cache_dir=cache_dir)
+            data = pickle.dumps(cached)
+            self.assertLess(len(data), 10000)
+            copy = pickle.loads(data)
+            self.assertIsInstance(copy.r_comoving, np.memmap)
+            self.assertEqual(copy.luminosity_distance(0.5),
+                             mill.luminosity_distance(0.5))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_array_inputs(self):
+        zz = np.array([0., 0.001, 0.1, 0.5, 1., 3.])
+        lum = np.array([0., -1., 1e-3, 1., 10., 100.])
+
+        for func in [cosmo.distance_modulus,
+                     cosmo.band_corrected_distance_modulus,
+                     cosmo.comoving_volume]:
+            vals = func(zz)
+            self.assertEqual(vals.shape, zz.shape)
+            for z, val in zip(zz, vals):
+                self.assertIsInstance(func(z), float)
+                self.assertAlmostEqual(val, func(z), places=8)
+        self.assertEqual(cosmo.distance_modulus(0.), 0.)
+        self.assertEqual(cosmo.distance_modulus(zz)[0], 0.)
+
+        for func, data in [(cosmo.emission_line_flux, lum),
+                           (cosmo.emission_line_luminosity, lum),
+                           (cosmo.logL2flux, np.log10(np.abs(lum)+1e-20)+40)]:
+            vals = func(data, zz)
+            self.assertEqual(vals.shape, zz.shape)
+            for dd, z, val in zip(data, zz, vals):
+                self.assertIsInstance(func(dd, z), float)
+                self.assertEqual(val, func(dd, z))
+            # Scalar redshift broadcast over all the luminosities
+            np.testing.assert_array_equal(func(data, 0.5),
+                                          [func(dd, 0.5) for dd in data])
+        self.assertEqual(cosmo.emission_line_flux(-1., 0.5), 0.)
+
+        # Round trip between luminosities and fluxes
+        flux = cosmo.emission_line_flux(lum, zz)
+        np.testing.assert_allclose(cosmo.emission_line_luminosity(flux, zz)[lum > 0],
+                                   lum[lum > 0], rtol=1e-10)
+
+    def test_uniform_grid_interpolation(self):
+        rng = np.random.default_rng(0)
+        zz = np.concatenate([rng.uniform(-1., 21., 10000),
+                             [0., 1., cosmo.redshift[-1], np.nan]])
+        expected = np.interp(zz, cosmo.redshift, cosmo.r_comoving)
+        np.testing.assert_allclose(cosmo.comoving_distance(zz), expected,
+                                   rtol=1e-14, atol=1e-12)
+        self.assertIsInstance(cosmo.comoving_distance(1.), float)
+
+        rr = np.concatenate([rng.uniform(-10., cosmo.r_comoving[-1] + 10., 10000),
+                             [0., cosmo.r_comoving[-1], np.nan]])
+        expected = np.interp(rr, cosmo.r_comoving, cosmo.redshift)
+        np.testing.assert_allclose(cosmo.redshift_at_distance(rr), expected,
+                                   rtol=1e-14, atol=1e-12)
+        # Every node of the table is recovered
+        np.testing.assert_allclose(cosmo.redshift_at_distance(cosmo.r_comoving),
+                                   cosmo.redshift, rtol=1e-14, atol=1e-12)
+        self.assertEqual(cosmo.redshift_at_distance(rr[:3].reshape(3, 1)).shape,
+                         (3, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
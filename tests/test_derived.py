@@ -0,0 +1,59 @@
+# python -m unittest tests/test_derived.py
+
+import unittest
+import numpy as np
+
+import src.derived as d
+
+class TestDerived(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            'mcold_disc': 'mcold', 'mcold_z_disc': 'cold_metal',
+            'mcold_burst': 'mcold_burst', 'mcold_z_burst': 'metals_burst',
+            'lines': ['Halpha', 'Hbeta'],
+            'line_prefix': 'L_tot_', 'line_suffix_ext': '_ext',
+        }
+
+    def test_kernels(self):
+        mass = np.array([0., -1., 2., 4.])
+        metals = np.array([1., 1., 1., 2.])
+        np.testing.assert_array_equal(d.metallicity(mass, metals),
+                                      [0., 0., 0.5, 0.5])
+
+        lum = np.array([0., 2., 4.])
+        lum_ext = np.array([0., 1., 4.])
+        np.testing.assert_array_equal(d.ext_ratio(lum, lum_ext), [0., 0.5, 1.])
+        self.assertEqual(d.ext_ratio(np.array([0.]), np.array([2.]))[0],
+                         2*d.notnum)
+
+        np.testing.assert_array_equal(d.add_columns(mass, metals),
+                                      [1., 0., 3., 6.])
+        self.assertEqual(mass[0], 0.)
+
+    def test_get_derived_columns(self):
+        units = {'mcold': 'Msun/h', 'cold_metal': 'Msun/h',
+                 'mcold_burst': 'Msun/h',
+                 'L_tot_Halpha': '1e40', 'L_tot_Halpha_ext': '1e40',
+                 'L_tot_Hbeta': '1e40',
+                 'mstars_burst_diskinstabilities': 'Msun/h',
+                 'mstars_burst_mergers': 'Msun/h',
+                 'mag_K': 'AB'}
+        cols = d.get_derived_columns(self.config, units, tomag=10.)
+        self.assertEqual([col.name for col in cols],
+                         ['Zgas_disc', 'mstars_burst', 'ratio_Halpha', 'mag_K'])
+        self.assertEqual(cols[0].drop, ['cold_metal'])
+        self.assertEqual(cols[-1].units, 'AB')
+
+        columns = {name: np.arange(3.) for name in units}
+        np.testing.assert_array_equal(cols[1].evaluate(columns), [0., 2., 4.])
+        np.testing.assert_array_equal(cols[-1].evaluate(columns), [10., 11., 12.])
+
+        # Burst masses are only derived if not given
+        units['mstars_burst'] = 'Msun/h'
+        cols = d.get_derived_columns(self.config, units)
+        self.assertNotIn('mstars_burst', [col.name for col in cols])
+        self.assertNotIn('mag_K', [col.name for col in cols])
+
+
+if __name__ == '__main__':
+    unittest.main()
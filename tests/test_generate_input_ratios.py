@@ -1,22 +1,21 @@
 # python -m unittest tests/test_generate_input_ratios.py
 
 import unittest
-import tempfile
-import shutil
 import os
 import h5py
 import numpy as np
 import sys
 
 from src.generate_input import generate_input_file
+from src.generate_test_files import generate_test_files
+from tests import CacheTestCase
 
-class TestLuminosityRatioCalculation(unittest.TestCase):
+class TestLuminosityRatioCalculation(CacheTestCase):
     """Test cases for luminosity ratio calculation"""
     
     def setUp(self):
         """Set up test fixtures before each test method."""
-        # Create temporary directories for input and output
-        self.test_dir = tempfile.mkdtemp()
+        super().setUp()
         self.input_dir = os.path.join(self.test_dir, 'input', '0')
         self.output_dir = os.path.join(self.test_dir, 'output', '0')
         os.makedirs(self.input_dir)
@@ -58,10 +57,6 @@ class TestLuminosityRatioCalculation(unittest.TestCase):
         # Create test configuration
         self.config = self._create_test_config()
     
-    def tearDown(self):
-        """Clean up test fixtures after each test method."""
-        shutil.rmtree(self.test_dir)
-    
     def _create_mock_input_files(self):
         """Create mock HDF5 input files with test data"""
         # Create galaxies.hdf5 with selection data
@@ -264,16 +259,145 @@ class TestLuminosityRatioCalculation(unittest.TestCase):
             
             for line in self.lines:
                 L_ext_name = f"{self.line_prefix}{line}{self.line_suffix_ext}"
-                self.assertNotIn(L_ext_name, data, 
+                self.assertNotIn(L_ext_name, data,
                                f"Extended luminosity {L_ext_name} should NOT be in output")
 
+    def test_chunked_output_matches(self):
+        """Test that streaming in blocks of rows gives the same output"""
+        self.config['root'] = os.path.join(self.test_dir, 'input', '')
+        self.config['outroot'] = os.path.join(self.test_dir, 'output', '')
+        # Select only part of the galaxies
+        self.config['selection']['galaxies.hdf5']['low_limits'] = [1e10, 50., 0., 0.]
+        result = generate_input_file(self.config, ivol=0, verbose=False)
+        self.assertTrue(result)
+
+        self.config['outroot'] = os.path.join(self.test_dir, 'chunked', '')
+        result = generate_input_file(self.config, ivol=0, verbose=False,
+                                     chunk_size=7)
+        self.assertTrue(result)
+
+        outfile = os.path.join(self.test_dir, 'output', '0', 'gne_input.hdf5')
+        chunkfile = os.path.join(self.test_dir, 'chunked', '0', 'gne_input.hdf5')
+        with h5py.File(outfile, 'r') as f, h5py.File(chunkfile, 'r') as fc:
+            self.assertEqual(set(f['data'].keys()), set(fc['data'].keys()))
+            for key in f['data'].keys():
+                np.testing.assert_array_equal(f['data'][key][:], fc['data'][key][:],
+                                              err_msg=f"Mismatch in {key}")
+                self.assertEqual(f['data'][key].attrs['units'],
+                                 fc['data'][key].attrs['units'])
+            self.assertEqual(f['header'].attrs['redshift'],
+                             fc['header'].attrs['redshift'])
+
+    def test_storage_options(self):
+        """Test that compressed, chunked datasets keep the same values"""
+        self.config['root'] = os.path.join(self.test_dir, 'input', '')
+        self.config['outroot'] = os.path.join(self.test_dir, 'output', '')
+        result = generate_input_file(self.config, ivol=0, verbose=False)
+        self.assertTrue(result)
+
+        self.config['outroot'] = os.path.join(self.test_dir, 'compressed', '')
+        self.config['storage'] = {'default': {'chunks': 16, 'compression': 'gzip',
+                                              'shuffle': True}}
+        result = generate_input_file(self.config, ivol=0, verbose=False,
+                                     chunk_size=7)
+        self.assertTrue(result)
+
+        outfile = os.path.join(self.test_dir, 'output', '0', 'gne_input.hdf5')
+        zipfile = os.path.join(self.test_dir, 'compressed', '0', 'gne_input.hdf5')
+        with h5py.File(outfile, 'r') as f, h5py.File(zipfile, 'r') as fz:
+            for key in f['data'].keys():
+                self.assertIsNone(f['data'][key].compression)
+                self.assertEqual(fz['data'][key].compression, 'gzip')
+                self.assertEqual(fz['data'][key].chunks, (16,))
+                np.testing.assert_array_equal(f['data'][key][:], fz['data'][key][:],
+                                              err_msg=f"Mismatch in {key}")
 
-class TestLuminosityRatioEdgeCases(unittest.TestCase):
+    def test_output_schema(self):
+        """Test that the output datasets take the data types of the schema"""
+        self.config['root'] = os.path.join(self.test_dir, 'input', '')
+        self.config['outroot'] = os.path.join(self.test_dir, 'output', '')
+        result = generate_input_file(self.config, ivol=0, verbose=False)
+        self.assertTrue(result)
+
+        self.config['outroot'] = os.path.join(self.test_dir, 'schema', '')
+        self.config['output_schema'] = {'gal_index': 'int32', 'type': 'int32',
+                                        'ratio_*': 'float32', 'Zgas_*': 'float32'}
+        result = generate_input_file(self.config, ivol=0, verbose=False,
+                                     chunk_size=7)
+        self.assertTrue(result)
+
+        outfile = os.path.join(self.test_dir, 'output', '0', 'gne_input.hdf5')
+        schemafile = os.path.join(self.test_dir, 'schema', '0', 'gne_input.hdf5')
+        with h5py.File(outfile, 'r') as f, h5py.File(schemafile, 'r') as fs:
+            self.assertEqual(set(f['data'].keys()), set(fs['data'].keys()))
+            for key in f['data'].keys():
+                dtype = fs['data'][key].dtype
+                if key in ['gal_index', 'type']:
+                    self.assertEqual(dtype, np.int32)
+                elif key.startswith(('ratio_', 'Zgas_')):
+                    self.assertEqual(dtype, np.float32)
+                else:
+                    self.assertEqual(dtype, f['data'][key].dtype)
+                # Ratios derived at input precision and then cast
+                np.testing.assert_array_equal(f['data'][key][:].astype(dtype),
+                                              fs['data'][key][:],
+                                              err_msg=f"Mismatch in {key}")
+
+    def test_gal_index_formats(self):
+        """Test the formats of the indexes of the selected galaxies"""
+        self.config['root'] = os.path.join(self.test_dir, 'input', '')
+        self.config['selection']['galaxies.hdf5']['low_limits'] = [1e10, 50., 0., 0.]
+        gal_index = {}
+        for index_format in ['int64', 'int32', 'runs']:
+            self.config['outroot'] = os.path.join(self.test_dir, index_format, '')
+            result = generate_input_file(self.config, ivol=0, verbose=False,
+                                         chunk_size=30, index_format=index_format)
+            self.assertTrue(result)
+            outfile = os.path.join(self.test_dir, index_format, '0', 'gne_input.hdf5')
+            with h5py.File(outfile, 'r') as f:
+                if index_format == 'runs':
+                    # One row per galaxy in the data group
+                    self.assertNotIn('gal_index_start', f['data'])
+                    nrows = set(len(dset) for dset in f['data'].values())
+                    self.assertEqual(len(nrows), 1)
+                    starts = f['index/gal_index_start'][:]
+                    stops = f['index/gal_index_stop'][:]
+                    gal_index[index_format] = np.concatenate(
+                        [np.arange(i0, i1) for i0, i1 in zip(starts, stops)])
+                else:
+                    self.assertEqual(f['data/gal_index'].dtype, index_format)
+                    gal_index[index_format] = f['data/gal_index'][:]
+        np.testing.assert_array_equal(gal_index['int64'], gal_index['int32'])
+        np.testing.assert_array_equal(gal_index['int64'], gal_index['runs'])
+
+        # Runs split between blocks are merged, as without blocks
+        runs = {}
+        for chunk_size in [None, 3]:
+            self.config['outroot'] = os.path.join(self.test_dir, f'runs{chunk_size}', '')
+            self.assertTrue(generate_input_file(self.config, ivol=0, index_format='runs',
+                                                chunk_size=chunk_size))
+            with h5py.File(self.config['outroot'] + '0/gne_input.hdf5', 'r') as f:
+                runs[chunk_size] = np.column_stack((f['index/gal_index_start'][:],
+                                                    f['index/gal_index_stop'][:]))
+        self.assertGreater(np.max(runs[None][:, 1] - runs[None][:, 0]), 3)
+        np.testing.assert_array_equal(runs[3], runs[None])
+
+        # Test files subsampled from the data group
+        self.config['outroot'] = os.path.join(self.test_dir, 'runs', '')
+        self.assertTrue(generate_test_files(self.config, [0], 50, 1,
+                                            outpath=os.path.join(self.test_dir, 'ex'),
+                                            verbose=False))
+
+        with self.assertRaises(ValueError):
+            generate_input_file(self.config, ivol=0, index_format='bits')
+
+
+class TestLuminosityRatioEdgeCases(CacheTestCase):
     """Test edge cases for luminosity ratio calculation"""
     
     def setUp(self):
         """Set up test fixtures"""
-        self.test_dir = tempfile.mkdtemp()
+        super().setUp()
         self.input_dir = os.path.join(self.test_dir, 'input', '0')
         os.makedirs(self.input_dir)
         
@@ -282,10 +406,6 @@ class TestLuminosityRatioEdgeCases(unittest.TestCase):
         self.line_suffix_ext = '_ext'
         self.n_galaxies = 50
     
-    def tearDown(self):
-        """Clean up test fixtures"""
-        shutil.rmtree(self.test_dir)
-    
     def _create_config(self):
         """Create minimal test configuration"""
         return {
@@ -409,19 +529,16 @@ class TestLuminosityRatioEdgeCases(unittest.TestCase):
 
 
 
-class TestMStarBurstCalculation(unittest.TestCase):
+class TestMStarBurstCalculation(CacheTestCase):
     """Test cases for MStarBurst calculation (Shark specific)"""
     
     def setUp(self):
-        self.test_dir = tempfile.mkdtemp()
+        super().setUp()
         self.input_dir = os.path.join(self.test_dir, 'input', '0')
         self.output_dir = os.path.join(self.test_dir, 'output', '0')
         os.makedirs(self.input_dir)
         self.n_galaxies = 100
         
-    def tearDown(self):
-        shutil.rmtree(self.test_dir)
-        
     def _create_config(self, datasets):
         """Create config with specific datasets"""
         return {
@@ -0,0 +1,52 @@
+# python -m unittest tests/test_instrument.py
+
+import unittest
+import os
+import json
+import time
+
+from src.instrument import Recorder
+import src.synthetic as syn
+from src.generate_input import generate_input_file
+from tests import CacheTestCase
+
+class TestInstrument(CacheTestCase):
+    def test_recorder(self):
+        stats = Recorder()
+        with stats.timer('derived'):
+            with stats.timer('read'):
+                time.sleep(0.02)
+            stats.add('read', bytes_read=100)
+        stats.add('read', bytes_read=50)
+        stats.count(rows_in=10)
+
+        out = stats.to_dict(ivol=3)
+        self.assertEqual(out['ivol'], 3)
+        self.assertEqual(out['rows_in'], 10)
+        self.assertEqual(out['stages']['read']['bytes_read'], 150)
+        self.assertEqual(out['totals']['bytes_read'], 150)
+        # Nested time is excluded from the outer stage
+        self.assertGreaterEqual(out['stages']['read']['time_s'], 0.02)
+        self.assertLess(out['stages']['derived']['time_s'], 0.02)
+
+    def test_stats_sidecar(self):
+        config = syn.get_synthetic_config('galform', self.test_dir)
+        syn.write_synthetic_files(config, 0, 1000)
+        self.assertTrue(generate_input_file(config, 0, chunk_size=400))
+
+        with open(config['outroot'] + '0/gne_input_stats.json') as f:
+            stats = json.load(f)
+        self.assertEqual(stats['ivol'], 0)
+        self.assertEqual(stats['rows_in'], 1000)
+        self.assertEqual(stats['stages']['selection_read']['rows'], 1000)
+        self.assertEqual(stats['stages']['selection_read']['calls'], 3)
+        # Output file and the four input files
+        self.assertEqual(stats['totals']['opens'], 5)
+        for stage in ['cosmology', 'combined_mask', 'write',
+                      'read:galaxies.hdf5', 'derived']:
+            self.assertIn(stage, stats['stages'])
+        self.assertGreater(stats['totals']['bytes_written'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# python -m unittest tests/test_job_plan.py
+
+import unittest
+import os
+
+import src.synthetic as syn
+import src.job_plan as jp
+from src.generate_input import generate_input_file
+from tests import CacheTestCase
+
+class TestJobPlan(CacheTestCase):
+    def test_pack_subvols(self):
+        subvols = [0, 1, 2, 5, 10, 11]
+        costs = {0: 1., 1: 2., 2: 5., 5: 1., 10: 1., 11: 3.}
+        self.assertEqual(jp.pack_subvols(subvols, costs, 3.),
+                         [[0, 1], [2], [5, 10], [11]])
+        self.assertEqual(jp.pack_subvols(subvols, costs, 100.), [subvols])
+        self.assertEqual(jp.pack_subvols([], costs, 3.), [])
+
+        # Subvolumes run in parallel within each job
+        self.assertEqual(jp.get_job_time([1., 2., 3.], workers=2), 3.)
+        self.assertEqual(jp.get_job_time([1., 1., 1., 1.], workers=2), 2.)
+        self.assertEqual(jp.pack_subvols(subvols, costs, 5., workers=2),
+                         [[0, 1, 2, 5, 10], [11]])
+
+    def test_get_subvol_costs(self):
+        config = syn.get_synthetic_config('shark', self.test_dir)
+        for ivol, ngal in [(0, 1000), (1, 4000)]:
+            syn.write_synthetic_files(config, ivol, ngal, seed=ivol)
+
+        # From the input sizes
+        costs = jp.get_subvol_costs(config, [0, 1, 2])
+        self.assertAlmostEqual(costs[0], jp.get_input_bytes(config, 0)/
+                               (jp.default_MB_per_s*1e6))
+        self.assertGreater(costs[1], costs[0])
+        self.assertEqual(costs[2], 0.)
+        costs = jp.get_subvol_costs(config, [1], sizes={1: 2e7})
+        self.assertAlmostEqual(costs[1], 1.)
+
+        # From recorded timings
+        self.assertTrue(generate_input_file(config, 0))
+        time_s, nbytes = jp.get_recorded_time(config, 0)
+        self.assertEqual(nbytes, jp.get_input_bytes(config, 0))
+        costs = jp.get_subvol_costs(config, [0, 1])
+        self.assertEqual(costs[0], time_s)
+        self.assertAlmostEqual(costs[1], time_s*jp.get_input_bytes(config, 1)/nbytes)
+
+    def test_save_plan(self):
+        jobs = [('SharkSU_1', [87], [0, 1]), ('SharkSU_1', [87], [2])]
+        planfile = os.path.join(self.test_dir, 'plan', 'job_plan.json')
+        jp.save_plan(jobs, planfile)
+        self.assertEqual(jp.load_plan(planfile), jobs)
+
+    def test_missing_units(self):
+        config = syn.get_synthetic_config('galform', self.test_dir)
+        for ivol in [0, 1, 2]:
+            syn.write_synthetic_files(config, ivol, 100, seed=ivol)
+        self.assertTrue(generate_input_file(config, 0))
+        self.assertTrue(generate_input_file(config, 2))
+        # Incomplete file, without a manifest
+        os.makedirs(config['outroot'] + '1')
+        open(config['outroot'] + '1/gne_input.hdf5', 'w').close()
+        self.assertEqual(jp.get_missing_subvols(config, [0, 1, 2, 3]), [1, 3])
+
+        units = [('SharkSU_1', 87, 3), ('SharkSU_1', 87, 7),
+                 ('SharkSU_1', 90, 0), ('GP20SU_1', 87, 5)]
+        self.assertEqual(jp.group_units(units),
+                         [('SharkSU_1', [87], [3, 7]), ('SharkSU_1', [90], [0]),
+                          ('GP20SU_1', [87], [5])])
+
+        # Only jobs without success are checked
+        results = {'success': ['prep_Other_iz39_ivols0_1'], 'error': [],
+                   'incomplete': [], 'not_found': []}
+        self.assertEqual(jp.get_missing_units([('Other', [39], [0, 1])],
+                                              results=results), [])
+
+        # Jobs still in the queue, or possibly running, are not resubmitted
+        results = {'success': [], 'error': [],
+                   'incomplete': ['prep_Other_iz39_ivols0_1'], 'not_found': []}
+        self.assertEqual(jp.get_missing_units([('Other', [39], [0, 1])],
+                                              results=results, verbose=False), [])
+        self.assertEqual(jp.get_missing_units([('Other', [39], [0, 1])],
+                                              queued={'prep_Other_iz39_ivols0_1'}), [])
+
+        # and are kept in the plan
+        simulations = [('Other', [39, 40], [0, 1])]
+        self.assertEqual(jp.get_running_jobs(simulations, results=results),
+                         [('Other', [39], [0, 1])])
+        self.assertEqual(jp.get_running_jobs(simulations, results=results,
+                                             queued={'prep_Other_iz40_ivols0_1'}),
+                         [('Other', [40], [0, 1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# python -m unittest tests/test_manifest.py
+
+import unittest
+import os
+import h5py
+
+import src.synthetic as syn
+import src.manifest as man
+from src.generate_input import generate_input_file
+from tests import CacheTestCase
+
+class TestManifest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.config = syn.get_synthetic_config('galform', self.test_dir)
+        syn.write_synthetic_files(self.config, 0, 200, seed=1)
+        self.outfile = self.config['outroot'] + '0/gne_input.hdf5'
+
+    def test_get_manifest(self):
+        manifest = man.get_manifest(self.config, 0, index_format='int64')
+        self.assertEqual(len(manifest['inputs']), 4)
+        for entry in manifest['inputs'].values():
+            self.assertGreater(entry['size'], 0)
+        self.assertEqual(manifest['code_version'], man.get_code_version())
+        self.assertNotEqual(manifest['config_hash'],
+                            man.get_config_hash(self.config, index_format='runs'))
+        # Missing input files
+        self.assertIsNone(man.get_manifest(self.config, 1))
+
+    def test_incremental(self):
+        self.assertFalse(man.is_up_to_date(self.config, 0, index_format='int64'))
+        self.assertTrue(generate_input_file(self.config, 0, force=False))
+        self.assertEqual(man.read_manifest(self.outfile),
+                         man.get_manifest(self.config, 0, index_format='int64'))
+        self.assertTrue(man.is_up_to_date(self.config, 0, index_format='int64'))
+
+        # Up to date files are not written again
+        mtime = os.stat(self.outfile).st_mtime_ns
+        self.assertTrue(generate_input_file(self.config, 0, force=False))
+        self.assertEqual(os.stat(self.outfile).st_mtime_ns, mtime)
+
+        # Changes in the options, configuration or inputs
+        self.assertFalse(man.is_up_to_date(self.config, 0, index_format='runs'))
+        config = {**self.config, 'storage': {'default': {'chunks': 50}}}
+        self.assertFalse(man.is_up_to_date(config, 0, index_format='int64'))
+        infile = list(man.get_manifest(self.config, 0)['inputs'])[0]
+        os.utime(infile, ns=(mtime, mtime + 10**9))
+        self.assertFalse(man.is_up_to_date(self.config, 0, index_format='int64'))
+
+        # Incomplete files, without a manifest
+        self.assertTrue(generate_input_file(self.config, 0, force=False))
+        with h5py.File(self.outfile, 'a') as hf:
+            del hf['header'].attrs['manifest']
+        self.assertFalse(man.is_up_to_date(self.config, 0, index_format='int64'))
+
+
+if __name__ == '__main__':
+    unittest.main()
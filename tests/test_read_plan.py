@@ -0,0 +1,65 @@
+# python -m unittest tests/test_read_plan.py
+
+import unittest
+import os
+import json
+import h5py
+import numpy as np
+
+from src.config import get_GP20cosma_config, get_SharkSU_config
+import src.read_plan as rp
+import src.synthetic as syn
+from src.generate_input import generate_input_file
+from tests import CacheTestCase
+
+class TestReadPlan(CacheTestCase):
+    def test_get_read_plan(self):
+        config = get_GP20cosma_config(39, [0])
+        plan = rp.get_read_plan(config, 3)
+        self.assertEqual([read['phase'] for read in plan],
+                         ['redshift', 'selection', 'props', 'props', 'props'])
+        self.assertTrue(plan[0]['file'].endswith('iz39/ivol3/galaxies.hdf5'))
+        self.assertEqual(len(rp.get_plan_files(plan)), 3)
+
+        # Each dataset is read once
+        reads = [(read['file'], ds) for read in plan for ds in read['datasets']]
+        self.assertEqual(len(reads), len(set(reads)))
+        self.assertEqual(plan[1]['datasets'], ['mhhalo', 'xgal', 'ygal', 'zgal'])
+        self.assertEqual(len(plan[1]['low_limits']), 4)
+        self.assertNotIn('xgal', plan[2]['datasets'])
+        self.assertNotIn('redshift', plan[2]['datasets'])
+        self.assertEqual(len(plan[2]['datasets']), len(plan[2]['units']))
+
+        # Shark: redshift in a different group of the same file
+        config = get_SharkSU_config(87, [0])
+        plan = rp.get_read_plan(config, 0)
+        self.assertEqual(len(rp.get_plan_files(plan)), 1)
+        self.assertEqual(plan[0]['group'], 'run_info')
+
+    def test_selected_props_read_once(self):
+        # Selection datasets also requested as properties, as for GP20cosma
+        config = syn.get_synthetic_config('galform', self.test_dir)
+        selection = config['selection']['galaxies.hdf5']
+        selection['datasets'] += ['xgal', 'ygal', 'zgal']
+        selection['units'] += ['Mpc/h']*3
+        selection['low_limits'] += [0., 0., 0.]
+        selection['high_limits'] += [50., 50., 50.]
+        syn.write_synthetic_files(config, 0, 2000)
+
+        plan = rp.get_read_plan(config, 0)
+        self.assertGreater(rp.get_planned_bytes(plan), 2000*8*4)
+        self.assertTrue(generate_input_file(config, 0, chunk_size=700))
+
+        outpath = config['outroot'] + '0/'
+        with h5py.File(outpath + 'gne_input.hdf5', 'r') as hf:
+            nsel = len(hf['data/gal_index'])
+            self.assertEqual(hf['data/xgal'].shape, (nsel,))
+            self.assertTrue(np.all(hf['data/xgal'][:] <= 50.))
+        with open(outpath + 'gne_input_stats.json') as f:
+            stats = json.load(f)
+        self.assertEqual(stats['totals']['opens'], 5)
+        self.assertEqual(stats['planned_bytes'], rp.get_planned_bytes(plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,6 +16,7 @@ class TestSlurmUtils(unittest.TestCase):
         
         # Create a mock template file for testing
         cls.template_content = '''#!/bin/sh
+#SBATCH --cpus-per-task=4
 #SBATCH --job-name=JOB_NAME
 #SBATCH --output=output/JOB_NAME.out
 #SBATCH --error=output/JOB_NAME.err
@@ -90,6 +91,8 @@ prep_input('SIM_NAME', SNAP_NUM, SUBVOLS_LIST, verbose=VERBOSE)
         with self.assertRaises(SystemExit):
             su.get_slurm_template('nonexistent_hpc')
 
+        self.assertEqual(su.get_cpus_per_task('taurus'), 4)
+
     def test_create_slurm_script(self):
         """Test creating a SLURM script with placeholder substitution"""
         script_path, job_name = su.create_slurm_script(
@@ -144,7 +147,45 @@ prep_input('SIM_NAME', SNAP_NUM, SUBVOLS_LIST, verbose=VERBOSE)
         if os.path.exists(script_path):
             os.remove(script_path)
 
-            
+
+    def test_create_slurm_job_array(self):
+        """Test a job array with groups of subvolumes per task"""
+        self.assertEqual(su.get_subvol_groups([0, 1, 2, 5, 6], 2),
+                         [[0, 1], [2, 5], [6]])
+        script_path, job_name = su.create_slurm_script(
+            'taurus', 'SharkSU_1', 87, [0, 1, 2, 5, 6],
+            outdir=self.test_dir, verbose=False, group_size=2, max_running=8
+        )
+        self.assertEqual(job_name, 'prep_SharkSU_1_iz87_ivols0-6')
+        with open(script_path, 'r') as f:
+            content = f.read()
+        self.assertIn('#SBATCH --array=0-2%8', content)
+        self.assertIn(f'--output=output/{job_name}_%a.out', content)
+        self.assertIn(f'--error=output/{job_name}_%a.err', content)
+        self.assertIn('[[0, 1], [2, 5], [6]][$SLURM_ARRAY_TASK_ID]', content)
+        self.assertLess(content.index('--array'), content.index('--job-name'))
+
+        # Output files of each task
+        job_names = su.get_job_names('SharkSU_1', 87, [0, 1, 2, 5, 6],
+                                     group_size=2)
+        self.assertEqual(job_names, [f'{job_name}_{task}' for task in range(3)])
+        with open(os.path.join(self.test_dir, f'{job_name}_0.out'), 'w') as f:
+            f.write('SUCCESS: All 2 hdf5 files have been generated.')
+        with open(os.path.join(self.test_dir, f'{job_name}_1.out'), 'w') as f:
+            f.write('Generating')
+        results = su.check_all_jobs([('SharkSU_1', [87], [0, 1, 2, 5, 6])],
+                                    outdir=self.test_dir, group_size=2,
+                                    verbose=False)
+        self.assertEqual(results['success'], [f'{job_name}_0'])
+        self.assertEqual(results['incomplete'], [f'{job_name}_1'])
+        self.assertEqual(results['not_found'], [f'{job_name}_2'])
+
+        deleted = su.clean_all_jobs([('SharkSU_1', [87], [0, 1, 2, 5, 6])],
+                                    outdir=self.test_dir, only_show=False,
+                                    group_size=2, verbose=False)
+        self.assertEqual(len(deleted), 3)
+        self.assertFalse(os.path.exists(script_path))
+
     def test_submit_slurm_job_no_sbatch(self):
         """Test submit_slurm_job when sbatch is not available"""
         # Check if sbatch is available
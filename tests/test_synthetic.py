@@ -0,0 +1,59 @@
+# python -m unittest tests/test_synthetic.py
+
+import unittest
+import os
+import h5py
+import numpy as np
+
+import src.synthetic as syn
+from src.benchmark import run_stage
+from src.validate import validate_hdf5_file
+from tests import CacheTestCase
+
+class TestSynthetic(CacheTestCase):
+    def test_synthetic_files(self):
+        ngal = 1000
+        for layout in syn.layouts:
+            path = self.test_dir + '/' + layout
+            config = syn.get_synthetic_config(layout, path)
+            nbytes = syn.write_synthetic_files(config, 0, ngal, chunk_size=300)
+            self.assertGreater(nbytes, 0)
+            self.assertTrue(validate_hdf5_file(config, config['snap'], 0,
+                                               verbose=False))
+
+            files = syn.get_synthetic_files(config, 0)
+            if layout == 'galform':
+                self.assertEqual(sorted(f.split('/')[-1] for f in files),
+                                 ['agn.hdf5', 'elgs.hdf5', 'galaxies.hdf5',
+                                  'tosedfit.hdf5'])
+            for infile, groups in files.items():
+                with h5py.File(infile, 'r') as hf:
+                    for group, datasets in groups.items():
+                        for name in datasets:
+                            if name == 'redshift':
+                                self.assertEqual(hf[group][name][()], 0.5)
+                            else:
+                                self.assertEqual(hf[group][name].shape, (ngal,))
+
+        with self.assertRaises(ValueError):
+            syn.get_synthetic_config('other', self.test_dir)
+
+    def test_run_stage(self):
+        ngal = 500
+        config = syn.get_synthetic_config('galform', self.test_dir)
+        for stage in ['synthetic', 'validate', 'generate', 'read_output']:
+            stats = run_stage(stage, config, [0, 1], ngal, chunk_size=200)
+            self.assertTrue(stats['success'])
+            self.assertEqual(stats['ngal'], 2*ngal)
+            self.assertGreater(stats['nbytes'], 0)
+            self.assertGreater(stats['peak_rss_MB'], 0)
+
+        outfile = config['outroot'] + '1/gne_input.hdf5'
+        with h5py.File(outfile, 'r') as hf:
+            gal_index = hf['data/gal_index'][:]
+            self.assertTrue(np.all(np.diff(gal_index) > 0))
+            self.assertLessEqual(len(gal_index), ngal)
+
+
+if __name__ == '__main__':
+    unittest.main()
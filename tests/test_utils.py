@@ -4,8 +4,12 @@ import unittest
 import numpy as np
 import h5py
 import os
+import glob
+import json
 import tempfile
 import shutil
+from functools import partial
+from unittest.mock import patch
 
 import src.utils as u
 
@@ -19,6 +23,11 @@ class TestPredict(unittest.TestCase):
         
         # Create a temporary directory under the output folder
         cls.test_dir = tempfile.mkdtemp(dir=output_dir)
+
+        # Snapshot caches within the temporary directory
+        cls.env = patch.dict(os.environ, {'PREP_GNE_CACHE':
+                             os.path.join(cls.test_dir, 'cache')})
+        cls.env.start()
         
         # Create test HDF5 file a 'data' group and 'type' dataset
         cls.hf5file = os.path.join(cls.test_dir, 'test_file.hdf5')
@@ -30,6 +39,7 @@ class TestPredict(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Clean up after all tests in the class are finished"""
+        cls.env.stop()
         if os.path.exists(cls.test_dir):
             try:
                 shutil.rmtree(cls.test_dir)
@@ -46,6 +56,19 @@ class TestPredict(unittest.TestCase):
         path = u.get_path('/data/ivol', 5, ending='iz39/')
         self.assertEqual(path, '/data/ivol5/iz39/')
 
+
+    def test_write_atomic(self):
+        outfile = os.path.join(self.test_dir, 'atomic', 'table.json')
+        self.assertTrue(u.write_atomic(outfile, lambda f: json.dump([1], f)))
+        with open(outfile) as f:
+            self.assertEqual(json.load(f), [1])
+        self.assertEqual(os.stat(outfile).st_mode & 0o777, 0o644)
+        self.assertEqual(os.listdir(os.path.dirname(outfile)), ['table.json'])
+
+        # Directory under a file: not written, without raising
+        notdir = os.path.join(outfile, 'table.json')
+        self.assertFalse(u.write_atomic(notdir, lambda f: json.dump([1], f)))
+
         
     def test_combined_mask(self):
         vb = False
@@ -69,6 +92,111 @@ class TestPredict(unittest.TestCase):
         np.testing.assert_array_equal(mask,[1])
 
 
+    def test_columns(self):
+        hfile = os.path.join(self.test_dir, 'columns.hdf5')
+        with h5py.File(hfile, 'w') as f:
+            f.create_dataset('mhhalo', data=np.array([1e9, 1e11, 1e12, 1e13]))
+            f.create_dataset('type', data=np.array([0, 1, 0, 2], dtype=np.int32))
+        with h5py.File(hfile, 'r') as f:
+            alldata = u.Columns.from_hdf5(f, ['mhhalo', 'type'], 1, 4)
+        self.assertEqual(alldata.shape, (2, 3))
+        self.assertEqual(alldata['type'].dtype, np.int32)
+        self.assertEqual(alldata.nbytes, 3*8 + 3*4)
+        np.testing.assert_array_equal(alldata[1], [1, 0, 2])
+
+        mask = u.combined_mask(alldata, [1e10, None], [None, 0], verbose=False)
+        np.testing.assert_array_equal(mask, [1])
+        mask = u.combined_mask(alldata, [None, None], [None, None], verbose=False)
+        np.testing.assert_array_equal(mask, [0, 1, 2])
+        self.assertIsNone(u.combined_mask(alldata, [1e14], [None], verbose=False))
+
+    def test_selection(self):
+        cuts = np.zeros(100, dtype=bool)
+        cuts[[3, 4, 5, 50, 98, 99]] = True
+        expected = np.array([3, 4, 5, 50, 98, 99]) + 1000
+        for kind in u.Selection.kinds:
+            sel = u.Selection(cuts, offset=1000, kind=kind)
+            self.assertEqual(len(sel), 6)
+            np.testing.assert_array_equal(sel.indexes(), expected)
+            np.testing.assert_array_equal(sel.runs(),
+                                          [[1003, 1006], [1050, 1051], [1098, 1100]])
+            np.testing.assert_array_equal(sel.mask(), cuts)
+            np.testing.assert_array_equal(sel.apply(np.arange(100)), expected - 1000)
+        self.assertEqual(u.Selection(cuts, kind='index').data.dtype, np.int32)
+        with self.assertRaises(ValueError):
+            u.Selection(cuts, kind='other')
+
+        # The most compact representation is chosen
+        self.assertEqual(u.Selection(cuts).kind, 'bitmap')
+        self.assertEqual(u.Selection(np.arange(10**4) < 5000).kind, 'runs')
+        sparse = np.zeros(10**4, dtype=bool); sparse[::1000] = True
+        self.assertEqual(u.Selection(sparse).kind, 'index')
+
+        hfile = os.path.join(self.test_dir, 'selection.hdf5')
+        vals = np.arange(2000.)
+        with h5py.File(hfile, 'w') as f:
+            f.create_dataset('vals', data=vals)
+        with h5py.File(hfile, 'r') as f:
+            for kind in u.Selection.kinds:
+                sel = u.Selection(cuts, offset=1000, kind=kind)
+                np.testing.assert_array_equal(sel.read(f['vals']), expected)
+                np.testing.assert_array_equal(sel.read(f['vals'], run_cost=1),
+                                              expected)
+                np.testing.assert_array_equal(u.read_selected(f['vals'], sel),
+                                              expected)
+
+        sel = u.combined_selection([np.arange(10.)], [2.], [4.], offset=5,
+                                   verbose=False)
+        np.testing.assert_array_equal(sel.indexes(), [7, 8, 9])
+        self.assertIsNone(u.combined_selection([np.arange(10.)], [20.], [None],
+                                               verbose=False))
+
+    def test_get_nworkers(self):
+        self.assertEqual(u.get_nworkers(4), 4)
+        self.assertEqual(u.get_nworkers(0), 1)
+        with patch.dict(os.environ, {'SLURM_CPUS_PER_TASK': '16'}):
+            self.assertEqual(u.get_nworkers(), 16)
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(u.get_nworkers(), 1)
+
+    def test_map_subvols(self):
+        func = partial(u.get_path, '/data/ivol')
+        expected = ['/data/ivol0/', '/data/ivol1/', '/data/ivol2/']
+        self.assertEqual(u.map_subvols(func, [0, 1, 2]), expected)
+        self.assertEqual(u.map_subvols(func, [0, 1, 2], workers=2), expected)
+
+    def test_get_runs(self):
+        runs = u.get_runs(np.array([0, 1, 2, 5, 7, 8]))
+        np.testing.assert_array_equal(runs, [[0, 3], [5, 6], [7, 9]])
+        self.assertEqual(u.get_runs(np.array([], dtype=int)).shape, (0, 2))
+
+        # Runs split between blocks are merged
+        runs = u.merge_runs([[[0, 3], [5, 10]], [[10, 12], [13, 14]], [], [[14, 20]]])
+        np.testing.assert_array_equal(runs, [[0, 3], [5, 12], [13, 20]])
+        self.assertEqual(u.merge_runs([]).shape, (0, 2))
+
+    def test_read_selected(self):
+        hfile = os.path.join(self.test_dir, 'read_selected.hdf5')
+        vals = np.arange(20000.)
+        with h5py.File(hfile, 'w') as f:
+            f.create_dataset('vals', data=vals)
+        indexes = np.array([3, 4, 5, 10000, 19998, 19999])
+        with h5py.File(hfile, 'r') as f:
+            # Hyperslab reads of sparse runs
+            out = u.read_selected(f['vals'], indexes, run_cost=1)
+            np.testing.assert_array_equal(out, vals[indexes])
+            # Dense selection read at once
+            out = u.read_selected(f['vals'], indexes)
+            np.testing.assert_array_equal(out, vals[indexes])
+            self.assertEqual(len(u.read_selected(f['vals'], [])), 0)
+            # Cast as read
+            for run_cost in [1, 4096]:
+                out = u.read_selected(f['vals'], indexes, run_cost=run_cost,
+                                      dtype=np.float32)
+                self.assertEqual(out.dtype, np.float32)
+                np.testing.assert_array_equal(out, vals[indexes])
+
+
     def test_get_zz_subvols(self):
         vb = False    
         # Create multiple subvolume directories with matching iz subdirectories
@@ -137,6 +265,32 @@ class TestPredict(unittest.TestCase):
         result = u.get_zz_subvols(root_numonly, [0], dir_base=None, verbose=vb)
         self.assertEqual(result, [20, 15, 10, 5])
 
+    def test_get_snapshots(self):
+        for ivol in [0, 1]:
+            for iz in [100, 75]:
+                os.makedirs(os.path.join(self.test_dir, f'vol{ivol}', f'iz{iz}'))
+        os.makedirs(os.path.join(self.test_dir, 'vol0', 'izfile'))
+        root = os.path.join(self.test_dir, 'vol')
+        cache_dir = os.path.join(self.test_dir, 'snapshot_cache')
+        with patch.dict(os.environ, {'PREP_GNE_CACHE': cache_dir}):
+            snapshots = u.get_snapshots(root, [0, 1, 2])
+            self.assertEqual(snapshots, {0: [100, 75], 1: [100, 75], 2: None})
+            cache_file = glob.glob(os.path.join(cache_dir, 'snapshots', '*.json'))[0]
+
+            # Unmodified directories are not scanned again
+            with open(cache_file) as f:
+                cached = json.load(f)
+            cached[root + '1']['zz'] = [50]
+            with open(cache_file, 'w') as f:
+                json.dump(cached, f)
+            self.assertEqual(u.get_snapshots(root, [1]), {1: [50]})
+            self.assertEqual(u.get_snapshots(root, [1], use_cache=False),
+                             {1: [100, 75]})
+
+            # New snapshots change the directory modification time
+            os.makedirs(os.path.join(self.test_dir, 'vol1', 'iz25'))
+            self.assertEqual(u.get_snapshots(root, [1]), {1: [100, 75, 25]})
+
     def test_get_group_name(self):
         # Create subdirectories to simulate the volume/redshift structure
         vol_dir = os.path.join(self.test_dir, 'ivol0')
@@ -192,6 +346,67 @@ class TestPredict(unittest.TestCase):
         ss = u.check_h5_structure(self.hf5file,['type'],
                                    group='data',verbose=vb)
         self.assertEqual(True,ss)
-        
+
+    def test_output_writer(self):
+        outfile = os.path.join(self.test_dir, 'writer.hdf5')
+        with u.OutputWriter(outfile) as writer:
+            writer.set_header('h0', 0.7)
+            writer.write('mcold', np.arange(3.), units='Msun/h')
+            writer.write('type', np.array([0, 1, 1]))
+        self.assertFalse(writer.hf)
+
+        with h5py.File(outfile, 'r') as f:
+            self.assertEqual(f['header'].attrs['h0'], 0.7)
+            np.testing.assert_array_equal(f['data/mcold'][:], [0., 1., 2.])
+            self.assertEqual(f['data/mcold'].attrs['units'], 'Msun/h')
+            self.assertNotIn('units', f['data/type'].attrs)
+
+        # Appending to an existing file keeps its content
+        with u.OutputWriter(outfile, mode='a') as writer:
+            writer.set_header('redshift', 0.5)
+        with h5py.File(outfile, 'r') as f:
+            self.assertEqual(f['header'].attrs['h0'], 0.7)
+            self.assertEqual(f['header'].attrs['redshift'], 0.5)
+
+        # Storage options per dataset
+        storage = {'default': {'chunks': 2, 'compression': 'gzip',
+                               'compression_opts': 4, 'shuffle': True},
+                   'type': {'compression': 'lzf'}}
+        with u.OutputWriter(outfile, storage=storage) as writer:
+            writer.write('mcold', np.arange(3.))
+            writer.write('type', np.array([0, 1, 1]))
+            writer.write('empty', np.zeros(0))
+            writer.append('mhhalo', np.arange(3.))
+            writer.append('mhhalo', np.arange(3.))
+        with h5py.File(outfile, 'r') as f:
+            self.assertEqual(f['data/mcold'].chunks, (2,))
+            self.assertEqual(f['data/mcold'].compression, 'gzip')
+            self.assertEqual(f['data/mcold'].compression_opts, 4)
+            self.assertTrue(f['data/mcold'].shuffle)
+            self.assertFalse(f['data/mcold'].fletcher32)
+            self.assertEqual(f['data/type'].compression, 'lzf')
+            self.assertIsNone(f['data/empty'].compression)
+            np.testing.assert_array_equal(f['data/mhhalo'][:], [0., 1., 2.]*2)
+
+    def test_get_output_dtype(self):
+        schema = {'type': 'int32', 'L_*': 'float32', 'L_tot_Halpha': 'float64'}
+        self.assertEqual(u.get_output_dtype(schema, 'type'), np.int32)
+        self.assertEqual(u.get_output_dtype(schema, 'L_tot_Halpha'), np.float32)
+        self.assertIsNone(u.get_output_dtype(schema, 'xgal'))
+        self.assertEqual(u.get_output_dtype(schema, 'xgal', np.float64), np.float64)
+        self.assertIsNone(u.get_output_dtype(None, 'type'))
+
+    def test_get_storage_options(self):
+        self.assertEqual(u.get_storage_options(None, 'mcold'), {})
+        storage = {'default': {'compression': 'gzip', 'compression_opts': 1},
+                   'mcold': {'chunks': 100}}
+        opts = u.get_storage_options(storage, 'mcold', nrows=10)
+        self.assertEqual(opts['chunks'], (10,))
+        self.assertEqual(opts['compression_opts'], 1)
+        self.assertFalse(opts['fletcher32'])
+        self.assertEqual(u.get_storage_options(storage, 'mcold', nrows=0), {})
+        with self.assertRaises(ValueError):
+            u.get_storage_options({'mcold': {'filter': 'lz4'}}, 'mcold')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+# python -m unittest tests/test_validate.py
+
+import unittest
+import os
+import csv
+import json
+import h5py
+from unittest import mock
+
+import src.synthetic as syn
+from src.config import get_GP20cosma_config
+from src.validate import (get_expected_structure, get_validation_file,
+                          get_missing_structure,
+                          validate_hdf5_file, validate_campaign,
+                          write_validation_report)
+from tests import CacheTestCase
+
+class TestValidate(CacheTestCase):
+    def test_get_expected_structure(self):
+        config = get_GP20cosma_config(39, [0])
+        structure = get_expected_structure(config, 0)
+        self.assertEqual(len(structure), 3)
+        galfile = [infile for infile in structure
+                   if infile.endswith('galaxies.hdf5')][0]
+        datasets = structure[galfile]['Output###']
+        # Selection and properties from the same file, checked once
+        self.assertIn('mhhalo', datasets)
+        self.assertIn('mcold', datasets)
+        self.assertEqual(len(datasets), len(set(datasets)))
+
+    def test_validation_cache(self):
+        config = syn.get_synthetic_config('shark', self.test_dir)
+        syn.write_synthetic_files(config, 0, 100, seed=1)
+        self.assertTrue(validate_hdf5_file(config, config['snap'], 0,
+                                           verbose=False))
+        entries = os.listdir(os.path.join(self.cache_dir, 'validation'))
+        self.assertEqual(len(entries), 1)
+
+        # Modified files are checked again
+        infile, groups = list(get_expected_structure(config, 0).items())[0]
+        with h5py.File(infile, 'a') as hf:
+            del hf['galaxies/mhot']
+        cache_file = get_validation_file(infile, groups,
+                                         os.path.join(self.cache_dir, 'validation'))
+        self.assertNotIn(os.path.basename(cache_file), entries)
+        self.assertFalse(validate_hdf5_file(config, config['snap'], 0,
+                                            verbose=False))
+
+        # Unchanged files with an entry are not opened
+        open(cache_file, 'w').close()
+        self.assertTrue(validate_hdf5_file(config, config['snap'], 0,
+                                           verbose=False))
+        self.assertFalse(validate_hdf5_file(config, config['snap'], 0,
+                                            verbose=False, use_cache=False))
+
+        # Truncated files, as left by interrupted jobs, cannot be opened
+        with open(infile, 'r+b') as f:
+            f.truncate(os.path.getsize(infile)//2)
+        problems, ncached = get_missing_structure(config, 0, use_cache=False)
+        self.assertEqual([(p['file'], p['missing']) for p in problems],
+                         [(infile, 'file')])
+
+    def test_validate_campaign(self):
+        # Input files not available here
+        simulations = [('GP20cosma', [39], [0, 1]), ('Other', [39], [0])]
+        report = os.path.join(self.test_dir, 'report.csv')
+        with mock.patch('builtins.print') as mock_print:
+            problems = validate_campaign(simulations, workers=2, report=report)
+        mock_print.assert_called_with('VALIDATION FAILED for 2 of the',
+                                      '2 subvolumes;',
+                                      '1 configurations could not be loaded.')
+        self.assertEqual(len(problems), 7)
+        missing = [(p['sim'], p['ivol'], p['missing']) for p in problems]
+        self.assertEqual(missing.count(('GP20cosma', 0, 'file')), 3)
+        self.assertEqual(missing.count(('GP20cosma', 1, 'file')), 3)
+        self.assertIn(('Other', None, 'config'), missing)
+
+        with open(report, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['missing'], 'config')
+
+        report = os.path.join(self.test_dir, 'report.json')
+        write_validation_report(report, problems)
+        with open(report) as f:
+            self.assertEqual(json.load(f), problems)
+        with self.assertRaises(ValueError):
+            write_validation_report(os.path.join(self.test_dir, 'report.txt'),
+                                    problems)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,11 @@
 ''' Validate a set of simulations'''
-from src.prep_input import prep_input
+from src.validate import validate_campaign
 
 verbose = True
 nvol = 64
 SIM = "Shark"
+workers = None  # By default, SLURM_CPUS_PER_TASK if defined, otherwise 1
+report = f'output/validation_{SIM}.csv'  # Missing files, groups and datasets (.csv or .json)
 
 # Shark in taurus
 taurus_sims_Shark = [
@@ -38,11 +40,10 @@ simtypes = {
     "cosma": cosma_sims_GP20
 }
 
-# Loop over the relevant simulations
+# Validate the relevant simulations concurrently
 try:
     simulations = simtypes[SIM]
 except KeyError:
     raise ValueError(f"Simulation type '{SIM}' not supported. Available types: {simtypes.keys()}")
-for sim, snaps, subvols in simulations:
-    for snap in snaps:
-        prep_input(sim, snap, subvols, verbose=verbose)
+problems = validate_campaign(simulations, workers=workers, report=report,
+                             verbose=verbose)